@@ -1,6 +1,8 @@
-import pandas as pd
-from custom_modules import invoice_splitter, dataocr, table_extractor
+from custom_modules import invoice_splitter, pipeline, exporter, profiling, dedup, table_extractor, estimate
+from custom_modules.quarantine import Quarantine
+from custom_modules.watermark import HighWaterMarks
 import os
+import argparse
 from rich.console import Console
 from rich.panel import Panel
 from rich.table import Table
@@ -15,10 +17,35 @@ import sys
 console = Console()
 
 class InvoiceExporter:
-    def __init__(self):
+    def __init__(self, workers=None, queue_size=8, money_mode='float', profiler=None, profile_dir="profile",
+                 deduplicate=True, compression=None, part_size=None, page_chunk=16,
+                 table_engine="dict", timeout=120, retries=1, quarantine_dir=None, split_options=None,
+                 autoscale=None, incremental=False, lookahead=64, calibration_path=estimate.CALIBRATION_PATH,
+                 calibrate=False):
         self.console = console
-        self.all_rows = []
         self.processed_count = 0
+        self.stats = pipeline.PipelineStats()
+        self.workers = workers
+        self.queue_size = queue_size
+        self.money_mode = money_mode
+        self.deduplicate = deduplicate
+        self.compression = compression
+        self.part_size = part_size
+        self.page_chunk = page_chunk
+        self.table_engine = table_engine
+        self.timeout = timeout
+        self.retries = retries
+        self.quarantine_dir = quarantine_dir
+        self.quarantine = None
+        self.split_options = split_options
+        self.autoscale = autoscale
+        self.incremental = incremental
+        self.lookahead = lookahead
+        self.calibration_path = calibration_path
+        self.calibrate = calibrate
+        self.watermarks = None
+        self.profiler = profiler
+        self.profile_dir = profile_dir
         
     def display_banner(self):
         """Display welcome banner"""
@@ -33,56 +60,6 @@ class InvoiceExporter:
         self.console.print(banner, style="bold cyan")
         self.console.print(f"[dim]Session started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}[/dim]\n")
 
-    def calculate_price_after_discount(self, price, discount_percent):
-        """Calculate price after applying discount"""
-        if discount_percent is None or discount_percent == 0:
-            return price
-        discount_amount = price * (discount_percent / 100)
-        return price - discount_amount
-
-    def calculate_amount(self, quantity, price_after_discount):
-        """Calculate total amount"""
-        return quantity * price_after_discount
-
-    def process_invoice_to_rows(self, doc_data):
-        """Convert invoice data to Excel rows format"""
-        rows = []
-        items = doc_data.get("items", {}).get("items", [])
-        
-        for idx, item in enumerate(items):
-            item_name = item.get("items", "")
-            quantity = item.get("Qnty", 0)
-            unit = item.get("unit", "")
-            list_price = item.get("price", 0)
-            discount_percent = item.get("discount", "") or ""
-            
-            if discount_percent != "":
-                price_after_discount = self.calculate_price_after_discount(list_price, discount_percent)
-            else:
-                price_after_discount = list_price
-            
-            amount = self.calculate_amount(quantity, price_after_discount)
-            
-            row = {
-                "VCH_SERIES": doc_data.get("VCH_SERIES", "") if idx == 0 else "",
-                "SALE/PURC_TYPE": doc_data.get("SALE/PURC_TYPE", "") if idx == 0 else "",
-                "MC_NAME": doc_data.get("MC_NAME", "") if idx == 0 else "",
-                "VCH/BILL_DATE": doc_data.get("VCH/BILL_DATE", "") if idx == 0 else "",
-                "VCH/BILL_NO": doc_data.get("VCH/BILL_NO", "") if idx == 0 else "",
-                "PARTY_NAME": doc_data.get("PARTY_NAME", "") if idx == 0 else "",
-                "ITEM_NAME": item_name,
-                "QUANTITY": quantity,
-                "UNIT": unit,
-                "PRICE": round(price_after_discount, 2),
-                "DISCOUNT_PERCENT": discount_percent,
-                "LIST_PRICE_ALT_UNIT": list_price,
-                "LIST_PRICE": list_price,
-                "AMOUNT": round(amount, 2)
-            }
-            rows.append(row)
-        
-        return rows
-
     def get_user_inputs(self):
         """Get configuration from user with validation"""
         self.console.print(Panel.fit(
@@ -95,7 +72,7 @@ class InvoiceExporter:
         self.console.print("\n[cyan]📁 Output Format:[/cyan]")
         file_format = Prompt.ask(
             "  Choose format",
-            choices=["excel", "csv"],
+            choices=list(exporter.WRITERS),
             default="excel"
         )
         
@@ -107,11 +84,11 @@ class InvoiceExporter:
         )
         
         # Add appropriate extension
-        output_file = f"{output_filename}.{'xlsx' if file_format == 'excel' else 'csv'}"
+        output_file = exporter.output_filename(output_filename, file_format, self.compression)
         
         # Check if file exists
         mode = 'write'
-        if os.path.exists(output_file):
+        if exporter.output_exists(output_file):
             self.console.print(f"\n[yellow]⚠️  File '{output_file}' already exists[/yellow]")
             if Confirm.ask("  Do you want to append to existing file?", default=False):
                 mode = 'append'
@@ -139,7 +116,7 @@ class InvoiceExporter:
             'output_folder': output_folder
         }
 
-    def display_processing_summary(self, total_invoices, total_items):
+    def display_processing_summary(self, total_invoices, total_items, writer):
         """Display processing summary in a panel"""
         summary_table = Table(show_header=False, box=box.SIMPLE)
         summary_table.add_column("Metric", style="cyan")
@@ -147,6 +124,20 @@ class InvoiceExporter:
         
         summary_table.add_row("📄 Invoices Processed", str(total_invoices))
         summary_table.add_row("📦 Total Items Extracted", str(total_items))
+        if writer.dedup is not None:
+            summary_table.add_row("🔁 Duplicates Skipped", str(self.stats.skipped + writer.duplicates_skipped))
+        if self.quarantine is not None and len(self.quarantine):
+            summary_table.add_row("🚫 Invoices Quarantined", f"{len(self.quarantine)} (see {self.quarantine.report_path})")
+        if self.stats.retried:
+            summary_table.add_row("🔄 Retries", str(self.stats.retried))
+        if writer.money_mode == 'exact':
+            summary_table.add_row("🧮 Totals Not Reconciled", str(writer.mismatch_count()))
+        summary_table.add_row("⏱️  Wall Time", f"{self.stats.elapsed:.2f}s")
+        for stage, timing in self.stats.summary().items():
+            summary_table.add_row(
+                f"   {stage.capitalize()} (p50 / p95 / max)",
+                f"{timing['p50'] * 1000:.1f} / {timing['p95'] * 1000:.1f} / {timing['max'] * 1000:.1f} ms"
+            )
         summary_table.add_row("⏱️  Completed At", datetime.now().strftime('%H:%M:%S'))
         
         self.console.print("\n")
@@ -181,87 +172,204 @@ class InvoiceExporter:
         
         self.console.print(preview_table)
 
-    def export_data(self, all_rows, output_file, file_format, mode='write'):
-        """Export data to Excel or CSV"""
-        df = pd.DataFrame(all_rows)
+    def render_dashboard(self, progress):
+        """Live view of throughput, stage latencies, queues, memory and slowest invoices"""
+        snapshot = self.stats.snapshot()
         
-        # Reorder columns
-        column_order = [
-            "VCH_SERIES", "SALE/PURC_TYPE", "MC_NAME", "VCH/BILL_DATE", 
-            "VCH/BILL_NO", "PARTY_NAME", "ITEM_NAME", "QUANTITY", "UNIT", 
-            "PRICE", "DISCOUNT_PERCENT", "LIST_PRICE_ALT_UNIT", "LIST_PRICE", "AMOUNT"
-        ]
-        df = df[column_order]
+        throughput = Table(show_header=False, box=box.SIMPLE)
+        throughput.add_column("Metric", style="cyan")
+        throughput.add_column("Value", style="green bold")
+        throughput.add_row("Invoices / sec", f"{snapshot['invoices_per_sec']:.2f}")
+        throughput.add_row("Pages / sec", f"{snapshot['pages_per_sec']:.2f}")
+        throughput.add_row("Worker utilization", f"{snapshot['utilization']:.0%} of {self.stats.workers}")
+        if self.autoscale is not None:
+            throughput.add_row("Active workers",
+                               f"{snapshot['worker_limit']} of {self.stats.workers} ({snapshot['recycles']} recycles)")
+        for name, depth in snapshot['queue_depths'].items():
+            throughput.add_row(f"Queue: {name}", str(depth))
+        throughput.add_row("Memory (RSS)", f"{snapshot['memory_bytes'] / 2**20:.0f} MiB")
+        cache = snapshot['cache']
+        throughput.add_row("Document cache", f"{cache['hit_rate']:.0%} hits of {cache['hits'] + cache['misses']}")
+        throughput.add_row("Elapsed", f"{snapshot['elapsed']:.1f}s")
         
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}"),
-            BarColumn(),
-            console=self.console
-        ) as progress:
-            task = progress.add_task("[cyan]Exporting data...", total=100)
-            
-            if file_format.lower() == 'excel':
-                if mode == 'append' and os.path.exists(output_file):
-                    existing_df = pd.read_excel(output_file)
-                    df = pd.concat([existing_df, df], ignore_index=True)
-                progress.update(task, advance=50)
-                
-                df.to_excel(output_file, index=False, engine='openpyxl')
-                progress.update(task, advance=50)
-                
-            elif file_format.lower() == 'csv':
-                if mode == 'append' and os.path.exists(output_file):
-                    df.to_csv(output_file, mode='a', header=False, index=False)
-                else:
-                    df.to_csv(output_file, index=False)
-                progress.update(task, advance=100)
+        stages = Table(header_style="bold magenta", box=box.SIMPLE)
+        stages.add_column("Stage", style="cyan")
+        stages.add_column("p50", justify="right")
+        stages.add_column("p95", justify="right")
+        stages.add_column("max", justify="right")
+        for stage, timing in snapshot['stages'].items():
+            stages.add_row(
+                stage.capitalize(),
+                f"{timing['p50'] * 1000:.0f} ms",
+                f"{timing['p95'] * 1000:.0f} ms",
+                f"{timing['max'] * 1000:.0f} ms"
+            )
+        
+        slowest = Table(header_style="bold magenta", box=box.SIMPLE)
+        slowest.add_column("Invoice", style="cyan")
+        slowest.add_column("Pages")
+        slowest.add_column("Extract", justify="right")
+        for seconds, invoice in snapshot['slowest']:
+            slowest.add_row(
+                os.path.basename(invoice['path']),
+                f"{invoice['start_page'] + 1}-{invoice['end_page'] + 1}",
+                f"{seconds * 1000:.0f} ms"
+            )
         
-        self.console.print(f"[green]✓ Data exported to {output_file}[/green]")
-        return df
+        layout = Layout()
+        layout.split_column(
+            Layout(progress, name="progress", size=1),
+            Layout(name="body")
+        )
+        layout["body"].split_row(
+            Layout(Panel(throughput, title="Throughput", border_style="cyan"), ratio=2),
+            Layout(Panel(stages, title="Stage latency", border_style="cyan"), ratio=3),
+            Layout(Panel(slowest, title="Slowest invoices", border_style="yellow"), ratio=3)
+        )
+        return Panel(layout, title="[bold yellow]Live Dashboard[/bold yellow]", border_style="yellow", height=16)
+
+    def display_estimate(self, pdf_paths):
+        """Show the expected wall time and peak memory of processing ``pdf_paths``, without processing them"""
+        calibration = estimate.Calibration(self.calibration_path)
+        with self.console.status("[cyan]Scanning invoice boundaries..."):
+            batch = estimate.BatchEstimate(pdf_paths, calibration, self.page_chunk)
+        
+        table = Table(show_header=True, header_style="bold magenta", box=box.ROUNDED)
+        table.add_column("Workers", justify="right", style="cyan")
+        table.add_column("Wall time", justify="right", style="green bold")
+        table.add_column("Speedup", justify="right")
+        table.add_column("Peak memory", justify="right")
+        for row in batch.plan([self.workers] if self.workers else None):
+            table.add_row(
+                str(row['workers']),
+                estimate.format_seconds(row['wall_seconds']),
+                f"{row['speedup']:.1f}x",
+                f"{row['peak_memory'] / 2**20:.0f} MiB"
+            )
+        
+        source = f"calibrated from {calibration.runs} run{'s' if calibration.runs != 1 else ''}" if calibration.runs else "default coefficients (no runs recorded yet)"
+        self.console.print(Panel(
+            table,
+            title=f"[bold yellow]⏳ Estimate: {batch.pages} pages, {batch.invoices} invoices, "
+                  f"~{batch.items:.0f} items[/bold yellow]",
+            subtitle=f"[dim]{source}; scanned in {batch.scan_seconds:.1f}s[/dim]",
+            border_style="yellow"
+        ))
 
-    def process_invoices(self, config):
-        """Process all invoices with progress tracking"""
+    def record_calibration(self):
+        """Add this run's timings to the calibration that --estimate uses (only with --calibrate)"""
+        # Profiled extractions are slower than real ones
+        if not self.calibrate or not self.calibration_path or self.profiler is not None:
+            return
+        try:
+            calibration = estimate.Calibration(self.calibration_path)
+            calibration.record(self.stats)
+            calibration.save()
+        except (OSError, ValueError) as e:
+            self.console.print(f"[dim]Could not update the calibration {self.calibration_path}: {e}[/dim]")
+
+    def display_profile_report(self):
+        """Write the profiling reports and show the slowest invoices"""
+        paths = self.profiler.write_reports(self.profile_dir)
+        
+        slowest_table = Table(show_header=True, header_style="bold magenta", box=box.ROUNDED)
+        slowest_table.add_column("Invoice", style="cyan")
+        slowest_table.add_column("Source Pages")
+        slowest_table.add_column("Total", justify="right")
+        for phase in ("extract_invoice_data", "extract_invoice_table", "parse_items", "export"):
+            slowest_table.add_column(phase, justify="right")
+        
+        for entry in self.profiler.slowest():
+            slowest_table.add_row(
+                os.path.basename(entry['path']),
+                f"{entry['start_page']}-{entry['end_page']}",
+                f"{entry['seconds'] * 1000:.0f} ms",
+                *[
+                    f"{entry['phases'][phase] * 1000:.0f} ms" if phase in entry['phases'] else "-"
+                    for phase in ("extract_invoice_data", "extract_invoice_table", "parse_items", "export")
+                ]
+            )
+        
+        self.console.print("\n")
+        self.console.print(Panel(
+            slowest_table,
+            title=f"[bold yellow]🐢 Top {self.profiler.top} Slowest Invoices[/bold yellow]",
+            border_style="yellow"
+        ))
+        self.console.print(
+            f"[dim]Profile written to {paths['pstats']}, {paths['text']}, "
+            f"{paths['collapsed']} (flamegraph) and {paths['slowest']}[/dim]"
+        )
+
+    def process_invoices(self, config, writer):
+        """Process and export all invoices with progress tracking"""
         self.console.print("\n")
         self.console.print(Panel.fit(
             "[bold yellow]🔄 Processing Invoices[/bold yellow]",
             border_style="yellow"
         ))
         
-        # Split invoices
-        with self.console.status("[bold green]Splitting PDF into individual invoices...") as status:
-            paths = invoice_splitter.split_invoices(
-                config['input_pdf_file'], 
-                config['output_folder']
-            )
+        total_pages = invoice_splitter.page_count(config['input_pdf_file'])
         
-        self.console.print(f"[green]✓ Split into {len(paths)} invoices[/green]\n")
-        
-        # Process each invoice
-        with Progress(
+        # Split, extract and export as a pipeline; progress is tracked in source pages
+        progress = Progress(
             SpinnerColumn(),
             TextColumn("[progress.description]{task.description}"),
             BarColumn(),
             TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-            console=self.console
-        ) as progress:
-            
-            task = progress.add_task("[cyan]Processing invoices...", total=len(paths))
-            
-            for idx, path in enumerate(paths, 1):
-                progress.update(task, description=f"[cyan]Processing invoice {idx}/{len(paths)}")
-                
-                doc_data = dataocr.extract_invoice_data(path)
-                table_data = table_extractor.process_items(path)
-                doc_data["items"] = table_data
-                
-                rows = self.process_invoice_to_rows(doc_data)
-                self.all_rows.extend(rows)
-                
-                progress.update(task, advance=1)
+        )
+        task = progress.add_task("[cyan]Processing invoices...", total=total_pages)
+        first_page = None
+        if self.watermarks is not None and config['mode'] == 'append':
+            first_page = self.watermarks.resume_page(config['input_pdf_file'])
+            if first_page:
+                self.console.print(f"[cyan]⏩ Pages 1-{first_page} were processed by an earlier run; "
+                                   f"resuming at page {first_page + 1}[/cyan]")
+                progress.update(task, completed=first_page)
+        self.quarantine = Quarantine(self.quarantine_dir or os.path.join(config['output_folder'], "quarantine"))
+        
+        def update_progress(done, invoice):
+            progress.update(
+                task,
+                description=f"[cyan]Processed invoice {done} (pages {invoice['start_page'] + 1}-{invoice['end_page'] + 1})",
+                completed=invoice['end_page'] + 1
+            )
         
-        self.console.print(f"[green]✓ All invoices processed successfully[/green]")
-        return len(paths)
+        with Live(
+            get_renderable=lambda: self.render_dashboard(progress),
+            console=self.console,
+            refresh_per_second=4
+        ):
+            invoice_count = exporter.export_invoices(
+                config['input_pdf_file'],
+                config['output_folder'],
+                writer,
+                workers=self.workers,
+                queue_size=self.queue_size,
+                on_progress=update_progress,
+                stats=self.stats,
+                profiler=self.profiler,
+                page_chunk=self.page_chunk,
+                table_engine=self.table_engine,
+                timeout=self.timeout,
+                retries=self.retries,
+                quarantine=self.quarantine,
+                split_options=self.split_options,
+                autoscale=self.autoscale,
+                watermarks=self.watermarks,
+                lookahead=self.lookahead,
+                first_page=first_page
+            )
+            progress.update(task, completed=total_pages)
+        
+        self.console.print()
+        self.console.print(f"[green]✓ Split and processed {invoice_count} invoices[/green]")
+        parts = getattr(writer, 'parts_written', [])
+        if getattr(writer, 'part_size', None):
+            self.console.print(f"[green]✓ Data exported to {len(parts)} part files: {', '.join(parts)}[/green]")
+        else:
+            self.console.print(f"[green]✓ Data exported to {config['output_file']}[/green]")
+        return invoice_count
 
     def run(self):
         """Main execution flow"""
@@ -272,30 +380,35 @@ class InvoiceExporter:
             # Get user inputs
             config = self.get_user_inputs()
             
-            # Process invoices
-            total_invoices = self.process_invoices(config)
-            
-            # Export data
-            self.console.print("\n")
-            df = self.export_data(
-                self.all_rows, 
-                config['output_file'], 
-                config['file_format'], 
-                config['mode']
+            # Process and export invoices
+            index = dedup.DedupIndex.for_output(config['output_file']) if self.deduplicate else None
+            if self.incremental:
+                self.watermarks = HighWaterMarks.for_output(config['output_file'])
+            options = {}
+            if config['file_format'] == 'csv':
+                options = {'compression': self.compression, 'part_size': self.part_size}
+            writer = exporter.get_writer(
+                config['file_format'], config['output_file'], config['mode'], money_mode=self.money_mode,
+                dedup=index, **options
             )
+            total_invoices = self.process_invoices(config, writer)
+            self.record_calibration()
             
             # Display summary
-            self.display_processing_summary(total_invoices, len(self.all_rows))
+            self.display_processing_summary(total_invoices, writer.rows_written, writer)
             
             # Display preview
-            self.display_data_preview(df)
+            self.display_data_preview(writer.preview_frame())
+            
+            if self.profiler is not None:
+                self.display_profile_report()
             
             # Success message
             self.console.print("\n")
             self.console.print(Panel.fit(
                 f"[bold green]🎉 Export Complete![/bold green]\n"
                 f"Output file: [cyan]{config['output_file']}[/cyan]\n"
-                f"Total records: [yellow]{len(self.all_rows)}[/yellow]",
+                f"Total records: [yellow]{writer.rows_written}[/yellow]",
                 border_style="green"
             ))
             
@@ -306,8 +419,95 @@ class InvoiceExporter:
             self.console.print(f"\n[bold red]❌ Error: {str(e)}[/bold red]")
             sys.exit(1)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Split, extract and export invoice data")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Extraction worker processes (default: CPU count)")
+    parser.add_argument("--no-autoscale", action="store_true",
+                        help="Always run --workers extractions at once instead of adapting to memory")
+    parser.add_argument("--min-workers", type=int, default=1,
+                        help="Fewest concurrent extractions the autoscaler may go down to")
+    parser.add_argument("--memory-reserve", type=float, default=0.15, metavar="FRACTION",
+                        help="Fraction of system memory to keep free; fewer workers run below it")
+    parser.add_argument("--worker-memory", type=float, default=1024, metavar="MB",
+                        help="Recycle the worker processes once one of them grows beyond this (0: never)")
+    parser.add_argument("--recycle-after", type=int, default=200, metavar="INVOICES",
+                        help="Recycle the worker processes after this many extractions (0: never)")
+    parser.add_argument("--queue-size", type=int, default=8,
+                        help="Capacity of the queues between pipeline stages")
+    parser.add_argument("--page-chunk", type=int, default=16, metavar="PAGES",
+                        help="Extract invoices longer than this in parallel page ranges of this size (0: never)")
+    parser.add_argument("--table-engine", choices=table_extractor.TABLE_ENGINES, default="dict",
+                        help="Read table rows from the full page dict or from word tuples ('words' allocates less)")
+    parser.add_argument("--lookahead", type=int, default=64, metavar="INVOICES",
+                        help="Extract the longest of this many upcoming invoices first (0: in source order)")
+    parser.add_argument("--timeout", type=float, default=120, metavar="SECONDS",
+                        help="Give up on an invoice whose extraction takes longer than this (0: wait forever)")
+    parser.add_argument("--retries", type=int, default=1,
+                        help="Extra attempts for an invoice whose extraction failed or timed out")
+    parser.add_argument("--quarantine", default=None, metavar="DIR",
+                        help="Folder for invoices that failed every attempt, with errors.json "
+                             "(default: quarantine inside the split invoice folder)")
+    parser.add_argument("--plain-split", action="store_true",
+                        help="Save split invoices without garbage collection, deflate and object streams")
+    parser.add_argument("--subset-fonts", action="store_true",
+                        help="Subset the fonts embedded in split invoices (slow; for sources with whole fonts)")
+    parser.add_argument("--money", choices=["float", "exact"], default="float",
+                        help="'exact' computes amounts in integer paise and reconciles them with item totals")
+    parser.add_argument("--incremental", action="store_true",
+                        help="When appending, only split the pages added to the source PDF since the last run")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Export every invoice, even ones already in the output file's dedup index")
+    parser.add_argument("--compress", choices=sorted(exporter.CSV_COMPRESSION), default=None,
+                        help="Compress CSV output (zstd needs the zstandard package)")
+    parser.add_argument("--part-size", type=float, default=None, metavar="MB",
+                        help="Split CSV output into part files of about this many megabytes")
+    parser.add_argument("--estimate", nargs="+", default=None, metavar="PDF",
+                        help="Only estimate the wall time and peak memory of processing these PDFs")
+    parser.add_argument("--calibration", default=estimate.CALIBRATION_PATH, metavar="PATH",
+                        help="Timing data that --estimate uses and --calibrate runs add to (default: %(default)s)")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="Add this run's timings to the --calibration file")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile every invoice and write aggregated stats and a flamegraph stack file")
+    parser.add_argument("--profile-dir", default="profile",
+                        help="Folder for the profiling reports")
+    parser.add_argument("--profile-top", type=int, default=10,
+                        help="Number of slowest invoices to report")
+    return parser.parse_args()
+
 def main():
-    exporter = InvoiceExporter()
+    args = parse_args()
+    profiler = profiling.InvoiceProfiler(top=args.profile_top) if args.profile else None
+    exporter = InvoiceExporter(
+        workers=args.workers,
+        queue_size=args.queue_size,
+        money_mode=args.money,
+        profiler=profiler,
+        profile_dir=args.profile_dir,
+        deduplicate=not args.no_dedup,
+        compression=args.compress,
+        part_size=int(args.part_size * 1024 * 1024) if args.part_size else None,
+        page_chunk=args.page_chunk,
+        table_engine=args.table_engine,
+        timeout=args.timeout or None,
+        retries=args.retries,
+        quarantine_dir=args.quarantine,
+        split_options={'compact': not args.plain_split, 'subset_fonts': args.subset_fonts},
+        autoscale=None if args.no_autoscale else pipeline.AutoScaler(
+            min_workers=args.min_workers,
+            memory_reserve=args.memory_reserve,
+            worker_memory_limit=int(args.worker_memory * 2**20),
+            recycle_after=args.recycle_after,
+        ),
+        incremental=args.incremental,
+        lookahead=args.lookahead,
+        calibration_path=args.calibration,
+        calibrate=args.calibrate
+    )
+    if args.estimate:
+        exporter.display_estimate(args.estimate)
+        return
     exporter.run()
 
 if __name__ == "__main__":
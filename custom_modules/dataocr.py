@@ -1,11 +1,14 @@
-import fitz 
+from custom_modules import templates
+from custom_modules.doc_cache import CACHE
 
-def extract_invoice_data(pdf_path):
+def extract_invoice_data(pdf_path, template=None):
     """
     Extract invoice data from a PDF file using PyMuPDF.
     
     Args:
         pdf_path (str): Path to the PDF file
+        template: InvoiceTemplate or registered template name; picked from the
+            first page's fingerprint when None
         
     Returns:
         dict: Dictionary containing invoice_number, date, customer, and dealer
@@ -13,44 +16,20 @@ def extract_invoice_data(pdf_path):
 
     # params =ITEM_NAME	QUANTITY	UNIT	PRICE	DISCOUNT_PERCENT	LIST_PRICE_ALT_UNIT 	LIST_PRICE	AMOUNT						
 
-
-    result = {
-        'VCH_SERIES' : 'Main',
-        'SALE/PURC_TYPE' : 'L/GST-ItemWise',
-        'MC_NAME' : 'Main Store',
-        'VCH/BILL_NO': None,
-        'VCH/BILL_DATE': None,
-        'PARTY_NAME': None,
-        'dealer': None
-    }
-    
-    keywords = {
-        'VCH/BILL_NO': 'Invoice No.',
-        'VCH/BILL_DATE': 'Dated',
-        'PARTY_NAME': 'Consignee',
-        'dealer': 'Authorised Signatory'
-    }
+    template = templates.resolve(template)
+    result = dict(template.defaults) if template else {}
     
     try:
         
-        doc = fitz.open(pdf_path)
+        doc = CACHE.document(pdf_path)
+        if template is None:
+            template = templates.REGISTRY.detect(doc)
+            result = dict(template.defaults)
+        result.update(dict.fromkeys(template.header_fields))
+
         for page_num in range(len(doc)):
-            page = doc[page_num]
-            blocks = page.get_text("dict")["blocks"]
-            for block in blocks:
-                if "lines" not in block:
-                    continue
-                block_text = ""
-                for line in block["lines"]:
-                    for span in line["spans"]:
-                        block_text += span["text"]
-                for key, keyword in keywords.items():
-                    if keyword in block_text:
-                        bold_text = extract_bold_text_from_block(block)
-                        if bold_text and result[key] is None:
-                            result[key] = bold_text
-        
-        doc.close()
+            blocks = CACHE.page_dict(pdf_path, page_num)["blocks"]
+            find_header_fields(blocks, template, result)
         
     except Exception as e:
         print(f"Error processing PDF: {str(e)}")
@@ -58,6 +37,26 @@ def extract_invoice_data(pdf_path):
     return result
 
 
+def find_header_fields(blocks, template, result):
+    """
+    Fill header fields of ``result`` that are still None from one page's blocks.
+    Pages are fed in order, so the first block mentioning a keyword wins.
+    """
+    for block in blocks:
+        if "lines" not in block:
+            continue
+        block_text = ""
+        for line in block["lines"]:
+            for span in line["spans"]:
+                block_text += span["text"]
+        for key in template.header_fields_in(block_text):
+            if result.get(key) is None:
+                bold_text = extract_bold_text_from_block(block)
+                if bold_text:
+                    result[key] = bold_text
+    return result
+
+
 def extract_bold_text_from_block(block):
     """
     Extract bold text from a block.
@@ -0,0 +1,118 @@
+import os
+
+# Header fields that identify an invoice in the ledger
+KEY_COLUMNS = ("VCH/BILL_NO", "PARTY_NAME", "VCH/BILL_DATE")
+
+# Record kinds in the index log
+_CONTENT = "c"
+_KEY = "k"
+
+
+def invoice_key(doc_data):
+    """
+    Ledger identity of an extracted invoice: bill number, party and date with
+    whitespace collapsed and case folded.
+
+    Returns:
+        str: The key, or None when any of the fields is missing
+    """
+    parts = []
+    for column in KEY_COLUMNS:
+        value = doc_data.get(column)
+        if value is None or (isinstance(value, float) and value != value):
+            return None
+        value = " ".join(str(value).split()).casefold()
+        if not value:
+            return None
+        parts.append(value)
+    return "\x1f".join(parts)
+
+
+class DedupIndex:
+    """
+    Persistent index of exported invoices, by content hash and by ledger key.
+
+    Both kinds are held in sets, so lookups stay O(1) however many invoices have
+    been exported. On disk the index is an append-only log with one record per
+    line, loaded once when the index is opened. New entries are visible to
+    lookups immediately, so duplicates within a run are caught too, but only
+    reach the log on ``commit``; ``rollback`` forgets the uncommitted ones.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.content_hashes = set()
+        self.keys = set()
+        self._pending = []
+        self._committed = 0
+        self._load()
+
+    @classmethod
+    def for_output(cls, output_file):
+        """The index kept next to an export file, ``<output_file>.dedup``"""
+        return cls(f"{output_file}.dedup")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                kind, _, value = line.rstrip("\n").partition("\t")
+                if kind == _CONTENT:
+                    self.content_hashes.add(value)
+                elif kind == _KEY:
+                    self.keys.add(value)
+
+    def __len__(self):
+        return len(self.keys) + len(self.content_hashes)
+
+    def contains_content(self, content_hash):
+        return content_hash is not None and content_hash in self.content_hashes
+
+    def contains(self, doc_data):
+        """True if an invoice with the same ledger key was already exported"""
+        key = invoice_key(doc_data)
+        return key is not None and key in self.keys
+
+    def add(self, doc_data, content_hash=None):
+        key = invoice_key(doc_data)
+        if key is not None and key not in self.keys:
+            self.keys.add(key)
+            self._pending.append((_KEY, key))
+        if content_hash is not None and content_hash not in self.content_hashes:
+            self.content_hashes.add(content_hash)
+            self._pending.append((_CONTENT, content_hash))
+
+    def add_keys(self, docs):
+        """Index already-exported invoices (header dicts) without content hashes, committed at once"""
+        for doc_data in docs:
+            self.add(doc_data)
+        self.commit()
+
+    def mark(self):
+        """A checkpoint covering every entry added so far, for a later ``commit(mark)``"""
+        return self._committed + len(self._pending)
+
+    def commit(self, mark=None):
+        """Append the entries added since the last commit (up to ``mark``, if given) to the log"""
+        count = len(self._pending) if mark is None else max(mark - self._committed, 0)
+        if not count:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(f"{kind}\t{value}\n" for kind, value in self._pending[:count])
+        del self._pending[:count]
+        self._committed += count
+
+    def rollback(self):
+        """Forget the entries added since the last commit"""
+        for kind, value in self._pending:
+            (self.content_hashes if kind == _CONTENT else self.keys).discard(value)
+        self._pending = []
+
+    def clear(self):
+        """Empty the index, e.g. when its export file is overwritten"""
+        self.content_hashes.clear()
+        self.keys.clear()
+        self._pending = []
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -1,61 +1,100 @@
 import fitz  # PyMuPDF
 import json
 import os
-
-def extract_and_annotate_invoice(pdf_path, output_json="invoice_structure.json", padding=5):
-    pdf = fitz.open(pdf_path)
-    data = {}
-
-    # Prepare output paths
-    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
-    annotated_pdf_path = f"{base_name}_annotated.pdf"
-
-    for page_num, page in enumerate(pdf, start=1):
-        page_data = []
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+def annotate_page(page, page_dict=None, padding=5):
+    """
+    Draw block (red) and line (green) rectangles on a page and describe its layout.
+
+    Args:
+        page: PyMuPDF page to draw on
+        page_dict (dict): Output of ``page.get_text("dict")`` if the caller already
+            has it; parsed here otherwise
+        padding (int): Padding around each block rectangle
+
+    Returns:
+        list: One {"block_no", "bbox", "lines": [{"text", "bbox"}]} per block
+    """
+    if page_dict is None:
         page_dict = page.get_text("dict")
 
-        for block in page_dict.get("blocks", []):
-            block_rect = fitz.Rect(block["bbox"])
-            # Add padding around the block rectangle
-
-            expand_by = padding
-            block_rect.x0 -= expand_by
-            block_rect.y0 -= expand_by
-            block_rect.x1 += expand_by
-            block_rect.y1 += expand_by
-
-            # block_rect.inflate(padding)
-
-            block_obj = {
-                "block_no": block.get("number", None),
-                "bbox": list(block["bbox"]),
-                "lines": []
-            }
-
-            # Draw red rectangle around the (padded) block
-            page.draw_rect(block_rect, color=(1, 0, 0), width=1.5)
-
-            for line in block.get("lines", []):
-                line_text = " ".join(
-                    [span["text"] for span in line.get("spans", []) if span["text"].strip()]
-                )
-                line_rect = fitz.Rect(line["bbox"])
+    page_data = []
+    for block in page_dict.get("blocks", []):
+        block_rect = fitz.Rect(block["bbox"])
+        # Add padding around the block rectangle
+
+        expand_by = padding
+        block_rect.x0 -= expand_by
+        block_rect.y0 -= expand_by
+        block_rect.x1 += expand_by
+        block_rect.y1 += expand_by
+
+        block_obj = {
+            "block_no": block.get("number", None),
+            "bbox": list(block["bbox"]),
+            "lines": []
+        }
+
+        # Draw red rectangle around the (padded) block
+        page.draw_rect(block_rect, color=(1, 0, 0), width=1.5)
+
+        for line in block.get("lines", []):
+            line_text = " ".join(
+                [span["text"] for span in line.get("spans", []) if span["text"].strip()]
+            )
+            line_rect = fitz.Rect(line["bbox"])
+
+            block_obj["lines"].append({
+                "text": line_text,
+                "bbox": list(line["bbox"])
+            })
+
+            # Draw green rectangle around the line
+            page.draw_rect(line_rect, color=(0, 1, 0), width=0.8)
+
+        page_data.append(block_obj)
+
+    return page_data
+
+def annotate_pdf(pdf_path, output_dir=".", padding=5, thumbnails=False, zoom=0.5, page_dicts=None):
+    """
+    Annotate every page of one PDF, save the annotated copy and optional PNG thumbnails.
+
+    Args:
+        pdf_path (str): PDF to annotate
+        output_dir (str): Folder for ``<name>_annotated.pdf`` and ``<name>_p<n>.png``
+        padding (int): Padding around each block rectangle
+        thumbnails (bool): Render each annotated page to a PNG
+        zoom (float): Thumbnail scale relative to the page size
+        page_dicts (list): Already-parsed ``get_text("dict")`` output per page, if any
+
+    Returns:
+        dict: {"page_<n>": page layout} as returned by annotate_page
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    data = {}
 
-                block_obj["lines"].append({
-                    "text": line_text,
-                    "bbox": list(line["bbox"])
-                })
+    with fitz.open(pdf_path) as pdf:
+        for page_num, page in enumerate(pdf, start=1):
+            page_dict = page_dicts[page_num - 1] if page_dicts else None
+            data[f"page_{page_num}"] = annotate_page(page, page_dict, padding)
 
-                # Draw green rectangle around the line
-                page.draw_rect(line_rect, color=(0, 1, 0), width=0.8)
+            if thumbnails:
+                pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+                pixmap.save(os.path.join(output_dir, f"{base_name}_p{page_num}.png"))
 
-            page_data.append(block_obj)
+        pdf.save(os.path.join(output_dir, f"{base_name}_annotated.pdf"), garbage=1, deflate=True)
 
-        data[f"page_{page_num}"] = page_data
+    return data
 
-    # Save annotated PDF
-    pdf.save(annotated_pdf_path)
-    pdf.close()
+def extract_and_annotate_invoice(pdf_path, output_json="invoice_structure.json", padding=5):
+    data = annotate_pdf(pdf_path, ".", padding)
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    annotated_pdf_path = f"{base_name}_annotated.pdf"
 
     # Save JSON structure
     with open(output_json, "w", encoding="utf-8") as f:
@@ -64,7 +103,63 @@ def extract_and_annotate_invoice(pdf_path, output_json="invoice_structure.json",
     print(f"✅ Annotated PDF saved as '{annotated_pdf_path}'")
     print(f"✅ JSON structure saved as '{output_json}'")
 
+def _annotate_for_batch(pdf_path, output_dir, padding, thumbnails, zoom):
+    return pdf_path, annotate_pdf(pdf_path, output_dir, padding, thumbnails, zoom)
+
+def annotate_batch(pdf_paths, output_dir="annotated", workers=None, padding=5, thumbnails=True, zoom=0.5,
+                   jsonl=True):
+    """
+    Annotate many PDFs in parallel to debug layout drift across invoices.
+
+    Each worker process annotates one PDF and writes its annotated copy and
+    thumbnails into ``output_dir``. The layouts are written compactly, either as
+    one ``layout.jsonl`` line per PDF (in input order) or as one
+    ``<name>_structure.json`` per PDF.
+
+    Returns:
+        int: Number of PDFs annotated
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    count = 0
+    jsonl_file = open(os.path.join(output_dir, "layout.jsonl"), "w", encoding="utf-8") if jsonl else None
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            annotate = partial(
+                _annotate_for_batch, output_dir=output_dir, padding=padding, thumbnails=thumbnails, zoom=zoom
+            )
+            for pdf_path, data in executor.map(annotate, pdf_paths):
+                record = {"file": os.path.basename(pdf_path), "pages": data}
+                if jsonl_file is not None:
+                    jsonl_file.write(json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n")
+                else:
+                    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+                    with open(os.path.join(output_dir, f"{base_name}_structure.json"), "w", encoding="utf-8") as f:
+                        json.dump(data, f, separators=(",", ":"), ensure_ascii=False)
+                count += 1
+    finally:
+        if jsonl_file is not None:
+            jsonl_file.close()
+
+    print(f"✅ Annotated {count} PDFs into '{output_dir}'")
+    return count
+
 # Example usage
 if __name__ == "__main__":
-
-    extract_and_annotate_invoice("individual_invoice\invoice_4.pdf")
+    parser = argparse.ArgumentParser(description="Annotate invoice layouts for debugging")
+    parser.add_argument("pdfs", nargs="+", help="PDF files to annotate")
+    parser.add_argument("--out", default="annotated", help="Output folder")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--zoom", type=float, default=0.5, help="Thumbnail scale")
+    parser.add_argument("--no-thumbnails", action="store_true", help="Skip PNG thumbnails")
+    parser.add_argument("--json-per-file", action="store_true", help="Write one JSON per PDF instead of layout.jsonl")
+    args = parser.parse_args()
+
+    annotate_batch(
+        args.pdfs,
+        args.out,
+        workers=args.workers,
+        thumbnails=not args.no_thumbnails,
+        zoom=args.zoom,
+        jsonl=not args.json_per_file,
+    )
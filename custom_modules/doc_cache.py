@@ -0,0 +1,166 @@
+import os
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+import fitz
+
+# Default bound on the memory held by the cache of each process, in MiB
+CACHE_MB = float(os.environ.get("INVOICE_CACHE_MB", 128))
+
+# Rough per-object overhead of a parsed page dict (dicts, tuples, floats per span/line/block)
+_SPAN_BYTES = 600
+_LINE_BYTES = 300
+_BLOCK_BYTES = 300
+# Charged per open document: MuPDF reads pages on demand, so a document holds its
+# cross-reference table and a few buffers rather than the whole file
+_DOCUMENT_BYTES = 256 * 1024
+
+
+def page_dict_size(page_dict):
+    """Approximate memory footprint of a ``get_text("dict")`` result in bytes"""
+    size = 0
+    for block in page_dict["blocks"]:
+        size += _BLOCK_BYTES + len(block.get("image") or b"")
+        for line in block.get("lines", ()):
+            size += _LINE_BYTES
+            for span in line["spans"]:
+                size += _SPAN_BYTES + len(span["text"])
+    return size
+
+
+class DocumentCache:
+    """
+    LRU cache of open fitz documents and parsed page dicts, for one process.
+
+    Documents are keyed by path, modification time and size, so a file that is
+    rewritten is opened afresh. They are also keyed by thread: a fitz.Document
+    must not be used by two threads at once, and callers read its pages without
+    holding the cache lock. Entries are evicted least recently used first once
+    their estimated footprint exceeds ``max_bytes`` (a document counts as a
+    fixed _DOCUMENT_BYTES whatever its file size, a page dict by
+    ``page_dict_size``) or more than ``max_documents`` documents are open.
+    Evicted documents are dropped rather than closed, so a caller still holding
+    one can finish with it.
+
+    Page dicts are plain data, shared by every thread in the process. Neither
+    they nor documents may be closed or modified. Lookups are serialized by a
+    lock, but documents are opened and pages parsed outside it, so threads
+    parse in parallel; two threads missing the same page may both parse it,
+    and the first result is kept. Worker processes start with an empty cache
+    of their own (see ``reset``).
+    """
+
+    def __init__(self, max_bytes=CACHE_MB * 2**20, max_documents=32):
+        self.max_bytes = max_bytes
+        self.max_documents = max_documents
+        self.reset()
+
+    def reset(self):
+        """Drop every entry and counter"""
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._entries = OrderedDict()
+        self._documents = 0
+        self.bytes = 0
+        self.counters = Counter()
+
+    def _count(self, event):
+        self.counters[event] += 1
+        tracker = getattr(self._local, "tracker", None)
+        if tracker is not None:
+            tracker[event] += 1
+
+    @contextmanager
+    def track(self):
+        """Count the hits and misses of the calling thread while the block runs; yields the Counter"""
+        counts = Counter()
+        previous = getattr(self._local, "tracker", None)
+        self._local.tracker = counts
+        try:
+            yield counts
+        finally:
+            self._local.tracker = previous
+
+    @staticmethod
+    def _document_key(path):
+        stat = os.stat(path)
+        return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+    def _get(self, key, kind):
+        entry = self._entries.get(key)
+        if entry is None:
+            self._count(f"{kind}_misses")
+            return None
+        self._entries.move_to_end(key)
+        self._count(f"{kind}_hits")
+        return entry[0]
+
+    def _put(self, key, value, size):
+        """Insert ``value``, or return the entry another thread inserted meanwhile"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry[0]
+        self._entries[key] = (value, size)
+        self.bytes += size
+        if key[0] == "document":
+            self._documents += 1
+        self._evict()
+        return value
+
+    def _evict(self):
+        while self._entries and (self.bytes > self.max_bytes or self._documents > self.max_documents):
+            key, (value, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+            if key[0] == "document":
+                self._documents -= 1
+            self._count("evictions")
+
+    def document(self, path):
+        """The open fitz.Document for ``path``, for use by the calling thread only"""
+        key = ("document",) + self._document_key(path) + (threading.get_ident(),)
+        with self._lock:
+            doc = self._get(key, "document")
+        if doc is None:
+            doc = fitz.open(path)
+            with self._lock:
+                doc = self._put(key, doc, _DOCUMENT_BYTES)
+        return doc
+
+    def page_dict(self, path, page_num):
+        """``get_text("dict")`` of page ``page_num`` (0-based) of ``path``"""
+        key = ("page",) + self._document_key(path) + (page_num,)
+        with self._lock:
+            page_dict = self._get(key, "page")
+        if page_dict is None:
+            page_dict = self.document(path)[page_num].get_text("dict")
+            size = page_dict_size(page_dict)
+            with self._lock:
+                page_dict = self._put(key, page_dict, size)
+        return page_dict
+
+    def stats(self):
+        """
+        Returns:
+            dict: hits, misses, evictions and hit_rate overall plus per kind
+            (document_hits, page_misses, ...), entries, documents and bytes held
+        """
+        with self._lock:
+            return summarize(self.counters, entries=len(self._entries), documents=self._documents,
+                             bytes=self.bytes)
+
+
+def summarize(counters, **extra):
+    """Totals and hit rate for a Counter of cache events (as from ``track`` or ``stats``)"""
+    hits = counters["document_hits"] + counters["page_hits"]
+    misses = counters["document_misses"] + counters["page_misses"]
+    summary = dict(counters, hits=hits, misses=misses, evictions=counters["evictions"],
+                   hit_rate=hits / (hits + misses) if hits + misses else 0.0)
+    summary.update(extra)
+    return summary
+
+
+# The cache of this process; forked workers must not share the parent's open documents
+CACHE = DocumentCache()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=CACHE.reset)
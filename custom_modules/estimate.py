@@ -0,0 +1,244 @@
+import argparse
+import heapq
+import json
+import math
+import os
+import time
+from collections import Counter
+
+from custom_modules import invoice_splitter
+
+# Timing data of previous runs; CLI runs with --calibrate add to it
+CALIBRATION_PATH = os.environ.get(
+    "INVOICE_CALIBRATION", os.path.join(os.path.expanduser("~"), ".invoice_ocr_calibration.json")
+)
+
+# Weight of the stored calibration against a new run's timings when they are merged
+DECAY = 0.5
+
+# Used until a run has been recorded; measured on pdfs/invoice.pdf (13 invoices, 75 items)
+DEFAULTS = {
+    "split_seconds_per_page": 0.013,
+    "write_seconds_per_item": 0.00003,
+    "extract_seconds_per_page": 0.026,
+    "items_per_page": 5.0,
+    "main_memory": 110 * 2**20,
+    "worker_memory": 75 * 2**20,
+}
+
+_SUM_KEYS = ("n", "p", "i", "pp", "pi", "ii", "pt", "it")
+
+
+def fit_costs(sums):
+    """
+    Per-page and per-item extraction seconds fitted to ``extract_seconds ~ pages,
+    items`` by least squares over the sums of PipelineStats.cost_sums. Falls
+    back to seconds per page alone when the two cannot be told apart (e.g.
+    every invoice has one page and the same number of items per page).
+
+    Returns:
+        tuple: (seconds per page, seconds per item, items per page)
+    """
+    pp, pi, ii, pt, it = (sums.get(key, 0.0) for key in ("pp", "pi", "ii", "pt", "it"))
+    items_per_page = sums["i"] / sums["p"] if sums.get("p") else DEFAULTS["items_per_page"]
+    if not pp:
+        return DEFAULTS["extract_seconds_per_page"], 0.0, items_per_page
+    det = pp * ii - pi * pi
+    if sums.get("n", 0) >= 3 and det > 1e-6 * pp * ii:
+        per_page = (pt * ii - it * pi) / det
+        per_item = (it * pp - pt * pi) / det
+        if per_page >= 0 and per_item >= 0:
+            return per_page, per_item, items_per_page
+    return pt / pp, 0.0, items_per_page
+
+
+class Calibration:
+    """
+    Cost coefficients calibrated from the timings of previous runs, kept in a JSON file.
+
+    ``record`` folds a run's PipelineStats in: the extraction fit sums per
+    template, split seconds per page, write seconds per item and the peak memory
+    of the main process and of one worker. Older runs are weighted down by
+    DECAY, so the coefficients follow changes in hardware or sources.
+    """
+
+    def __init__(self, path=CALIBRATION_PATH):
+        self.path = path
+        self.data = {"runs": 0, "templates": {}}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    @property
+    def runs(self):
+        return self.data["runs"]
+
+    def value(self, name):
+        return self.data.get(name, DEFAULTS[name])
+
+    def record(self, stats):
+        """Add a finished run (a PipelineStats) to the calibration"""
+        if not stats.invoices:
+            return
+        weight = DECAY if self.runs else 0.0
+        for template, sums in stats.cost_sums.items():
+            stored = self.data["templates"].setdefault(str(template), {})
+            for key in _SUM_KEYS:
+                stored[key] = stored.get(key, 0.0) * weight + sums[key]
+
+        timings = stats.summary()
+        rates = {
+            "split_seconds_per_page": timings["split"]["total"] / stats.pages if "split" in timings else None,
+            "write_seconds_per_item": timings["write"]["total"] / stats.items
+            if "write" in timings and stats.items else None,
+            "main_memory": stats.peak_main_memory or None,
+            "worker_memory": stats.peak_worker_memory or None,
+        }
+        for name, rate in rates.items():
+            if rate is not None:
+                previous = self.data.get(name)
+                self.data[name] = rate if previous is None else previous * weight + rate * (1 - weight)
+        self.data["runs"] += 1
+        self.data["cpus"] = os.cpu_count()
+
+    def save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def costs(self, template):
+        """(seconds per page, seconds per item, items per page) for ``template``"""
+        sums = self.data["templates"].get(str(template))
+        if sums is None:
+            # Not seen yet: pool every template
+            sums = Counter()
+            for template_sums in self.data["templates"].values():
+                sums.update(template_sums)
+        return fit_costs(sums)
+
+
+def makespan(jobs, workers):
+    """Finish time of ``jobs`` (seconds each) on ``workers`` slots, longest first, as the pipeline schedules them"""
+    finish = [0.0] * max(workers, 1)
+    for cost in sorted(jobs, reverse=True):
+        heapq.heapreplace(finish, finish[0] + cost)
+    return max(finish)
+
+
+class BatchEstimate:
+    """
+    Expected cost of processing some PDFs, from a marker scan and a Calibration.
+
+    Wall time is bounded below by each of the three stages alone: splitting and
+    writing run on one thread each; extraction runs on the workers (the
+    invoices longest first, long ones in ``page_chunk`` page jobs). It is also
+    bounded by all the work spread over the CPUs, since more workers than CPUs
+    only share them.
+    """
+
+    def __init__(self, pdf_paths, calibration, page_chunk=16):
+        self.calibration = calibration
+        self.page_chunk = page_chunk
+        self.pages = 0
+        self.invoices = 0
+        self.items = 0.0
+        self.jobs = []
+        started = time.perf_counter()
+        for path in pdf_paths:
+            self.pages += invoice_splitter.page_count(path)
+            for invoice in invoice_splitter.scan_invoices(path):
+                self.add_invoice(invoice)
+        self.scan_seconds = time.perf_counter() - started
+        self.split_seconds = self.pages * calibration.value("split_seconds_per_page")
+        self.write_seconds = self.items * calibration.value("write_seconds_per_item")
+
+    def add_invoice(self, invoice):
+        per_page, per_item, items_per_page = self.calibration.costs(invoice["template"])
+        pages = invoice["end_page"] - invoice["start_page"] + 1
+        items = pages * items_per_page
+        cost = pages * per_page + items * per_item
+        chunks = math.ceil(pages / self.page_chunk) if self.page_chunk and pages > self.page_chunk else 1
+        self.jobs.extend([cost / chunks] * chunks)
+        self.invoices += 1
+        self.items += items
+
+    @property
+    def extract_seconds(self):
+        """Extraction time summed over all invoices (one worker)"""
+        return sum(self.jobs)
+
+    def wall_seconds(self, workers, cpus=None):
+        cpus = cpus or os.cpu_count() or 1
+        slots = min(workers, cpus)
+        return max(
+            makespan(self.jobs, slots),
+            self.split_seconds,
+            self.write_seconds,
+            (self.extract_seconds + self.split_seconds + self.write_seconds) / cpus,
+        )
+
+    def peak_memory(self, workers):
+        busy = min(workers, max(len(self.jobs), 1))
+        return self.calibration.value("main_memory") + busy * self.calibration.value("worker_memory")
+
+    def plan(self, worker_counts=None):
+        """
+        Returns:
+            list: {"workers", "wall_seconds", "speedup", "peak_memory"} per worker count
+        """
+        cpus = os.cpu_count() or 1
+        if worker_counts is None:
+            worker_counts = {1, cpus}
+            workers = 2
+            while workers <= 2 * cpus:
+                worker_counts.add(workers)
+                workers *= 2
+            worker_counts = sorted(worker_counts)
+        serial = self.wall_seconds(1)
+        rows = []
+        for workers in worker_counts:
+            wall = self.wall_seconds(workers)
+            rows.append({
+                "workers": workers,
+                "wall_seconds": wall,
+                "speedup": serial / wall if wall else 1.0,
+                "peak_memory": self.peak_memory(workers),
+            })
+        return rows
+
+
+def format_seconds(seconds):
+    if seconds < 90:
+        return f"{seconds:.1f}s"
+    if seconds < 90 * 60:
+        return f"{seconds / 60:.1f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate the time and memory a batch will take, without running it")
+    parser.add_argument("pdfs", nargs="+", help="Source PDFs of the batch")
+    parser.add_argument("--workers", type=int, nargs="+", default=None,
+                        help="Worker counts to estimate (default: powers of two up to twice the CPU count)")
+    parser.add_argument("--page-chunk", type=int, default=16, metavar="PAGES")
+    parser.add_argument("--calibration", default=CALIBRATION_PATH,
+                        help="Timing data of previous runs (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    calibration = Calibration(args.calibration)
+    estimate = BatchEstimate(args.pdfs, calibration, args.page_chunk)
+    print(f"{estimate.pages} pages, {estimate.invoices} invoices, ~{estimate.items:.0f} items "
+          f"(scanned in {estimate.scan_seconds:.1f}s)")
+    if not calibration.runs:
+        print("No runs recorded yet; using default coefficients")
+    else:
+        print(f"Calibrated from {calibration.runs} run{'s' if calibration.runs != 1 else ''}")
+    print(f"{'workers':>8} {'wall time':>10} {'speedup':>8} {'peak memory':>12}")
+    for row in estimate.plan(args.workers):
+        print(f"{row['workers']:>8} {format_seconds(row['wall_seconds']):>10} {row['speedup']:>7.1f}x "
+              f"{row['peak_memory'] / 2**20:>8.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1013 @@
+import glob
+import gzip
+import json
+import os
+import re
+import sqlite3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from custom_modules import pipeline, money, templates
+
+try:
+    import duckdb
+except ImportError:  # optional; the duckdb export target is only registered when installed
+    duckdb = None
+
+try:
+    import zstandard
+except ImportError:  # optional; only needed for zstd-compressed CSV
+    zstandard = None
+
+try:
+    import orjson
+except ImportError:  # optional; JSONL output falls back to the json module
+    orjson = None
+
+COLUMN_ORDER = [
+    "VCH_SERIES", "SALE/PURC_TYPE", "MC_NAME", "VCH/BILL_DATE",
+    "VCH/BILL_NO", "PARTY_NAME", "ITEM_NAME", "QUANTITY", "UNIT",
+    "PRICE", "DISCOUNT_PERCENT", "LIST_PRICE_ALT_UNIT", "LIST_PRICE", "AMOUNT"
+]
+
+# Header fields that are only filled on the first row of each invoice
+HEADER_COLUMNS = ["VCH_SERIES", "SALE/PURC_TYPE", "MC_NAME", "VCH/BILL_DATE", "VCH/BILL_NO", "PARTY_NAME"]
+
+PREVIEW_ROWS = 50
+
+
+def calculate_price_after_discount(price, discount_percent):
+    """Calculate price after applying discount; works element-wise on arrays"""
+    return price - price * (discount_percent / 100)
+
+
+def calculate_amount(quantity, price_after_discount):
+    """Calculate total amount; works element-wise on arrays"""
+    return quantity * price_after_discount
+
+
+def round_money(values):
+    """
+    Round an array to 2 decimals with the same result as Python's ``round(x, 2)``.
+
+    ``np.round`` scales by 100 before rounding, which can tip values lying within
+    an ulp of a half-cent the other way. Those few values are re-rounded with
+    ``round`` so the vectorized output matches the scalar one exactly.
+    """
+    scaled = values * 100
+    rounded = np.rint(scaled) / 100
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_half.any():
+        rounded[near_half] = [round(value, 2) for value in values[near_half].tolist()]
+    return rounded
+
+
+def transform_columns(counts, headers, item_names, quantities, units, list_prices, discounts,
+                      money_mode='float'):
+    """
+    Build export rows for a batch of invoices from column lists.
+
+    Args:
+        counts (list[int]): Number of items in each invoice, in order
+        headers (dict): {header column: [one value per invoice]}
+        item_names, quantities, units, list_prices, discounts (list | np.ndarray):
+            One value per item across the whole batch; a discount that is None,
+            NaN or 0 means none
+        money_mode (str): 'float' rounds like Python's round(); 'exact' computes in
+            integer paise and rounds half-up (see custom_modules/money.py),
+            scaling Decimal inputs straight to integers rather than through floats
+
+    Returns:
+        pd.DataFrame: Rows in COLUMN_ORDER, header fields filled only on the first
+        item of each invoice
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    total_items = int(counts.sum())
+
+    quantity = np.array(quantities, dtype=float)
+    list_price = np.array(list_prices, dtype=float)
+    discount = np.array(discounts, dtype=float)
+    has_discount = np.nan_to_num(discount) != 0
+    discount[~has_discount] = 0
+    # Exported as-is where present, blank otherwise
+    discount_percent = discount.astype(object)
+    discount_percent[~has_discount] = ""
+
+    if money_mode == 'exact':
+        # The float arrays above are only for the exported columns
+        price_paise, amount_paise, present = money.exact_amounts(quantities, list_prices, discounts)
+        price = money.to_rupees(price_paise, ~np.isnan(list_price))
+        amount = money.to_rupees(amount_paise, present)
+    else:
+        price_after_discount = calculate_price_after_discount(list_price, discount)
+        price = round_money(price_after_discount)
+        amount = round_money(calculate_amount(quantity, price_after_discount))
+
+    # Mark the first item of every non-empty invoice
+    first_item = np.zeros(total_items, dtype=bool)
+    starts = np.cumsum(counts) - counts
+    first_item[starts[counts > 0]] = True
+
+    columns = {}
+    for column in HEADER_COLUMNS:
+        values = np.repeat(np.array(headers[column], dtype=object), counts)
+        values[~first_item] = ""
+        columns[column] = values
+
+    columns.update({
+        "ITEM_NAME": np.array(item_names, dtype=object),
+        "QUANTITY": quantity,
+        "UNIT": np.array(units, dtype=object),
+        "PRICE": price,
+        "DISCOUNT_PERCENT": discount_percent,
+        "LIST_PRICE_ALT_UNIT": list_price,
+        "LIST_PRICE": list_price,
+        "AMOUNT": amount
+    })
+    return pd.DataFrame(columns, columns=COLUMN_ORDER)
+
+
+def rows_frame(docs, money_mode='float'):
+    """Convert a batch of extracted invoices to export rows, one per item"""
+    invoice_items = [doc_data.get("items", {}).get("items", []) for doc_data in docs]
+    items = [item for doc_items in invoice_items for item in doc_items]
+    headers = {
+        column: [doc_data.get(column, "") for doc_data in docs]
+        for column in HEADER_COLUMNS
+    }
+
+    return transform_columns(
+        [len(doc_items) for doc_items in invoice_items],
+        headers,
+        [item.get("items", "") for item in items],
+        [item.get("Qnty", 0) for item in items],
+        [item.get("unit", "") for item in items],
+        [item.get("price", 0) for item in items],
+        [item.get("discount") or None for item in items],
+        money_mode=money_mode,
+    )
+
+
+def reconcile_totals(docs, tax_rates=money.GST_RATES):
+    """
+    Check every item's exact AMOUNT against the ``total`` extracted from the invoice.
+
+    Returns:
+        pd.DataFrame: One row per item whose total does not match, with columns
+        VCH/BILL_NO, ITEM_NAME, AMOUNT and TOTAL
+    """
+    bill_numbers, items = [], []
+    for doc_data in docs:
+        doc_items = doc_data.get("items", {}).get("items", [])
+        bill_numbers.extend([doc_data.get("VCH/BILL_NO", "")] * len(doc_items))
+        items.extend(doc_items)
+
+    _, amount_paise, present = money.exact_amounts(
+        [item.get("Qnty") for item in items],
+        [item.get("price") for item in items],
+        [item.get("discount") or None for item in items],
+    )
+    total_paise, has_total = money.to_fixed([item.get("total") for item in items], money.PAISE)
+    checked = present & has_total
+    mismatched = checked & ~money.totals_match(amount_paise, total_paise, tax_rates)
+
+    return pd.DataFrame({
+        "VCH/BILL_NO": np.array(bill_numbers, dtype=object)[mismatched],
+        "ITEM_NAME": np.array([item.get("items", "") for item in items], dtype=object)[mismatched],
+        "AMOUNT": money.to_rupees(amount_paise, present)[mismatched],
+        "TOTAL": money.to_rupees(total_paise, has_total)[mismatched],
+    })
+
+
+def process_invoice_to_rows(doc_data, money_mode='float'):
+    """Convert invoice data to export rows, one dict per item"""
+    return rows_frame([doc_data], money_mode).to_dict("records")
+
+
+def _item_count(doc_data):
+    return len(doc_data.get("items", {}).get("items", []))
+
+
+def _invoice_starts(frame):
+    """First row of every invoice in rows without invoice boundaries (export_data): each row with a header value"""
+    starts = np.flatnonzero((frame[HEADER_COLUMNS].fillna("") != "").any(axis=1).to_numpy())
+    if len(frame) and (len(starts) == 0 or starts[0] != 0):
+        starts = np.concatenate([[0], starts])
+    return starts
+
+
+def _invoice_headers(frame):
+    """Header dicts of the invoices in an exported frame (only first rows carry a bill number)"""
+    return frame[frame["VCH/BILL_NO"] != ""].to_dict("records")
+
+
+class Writer:
+    """
+    Base class for export targets.
+
+    A writer is opened once, receives extracted invoices (``doc_data`` dicts as
+    returned by ``pipeline.extract_invoice``) through ``write`` and is closed at
+    the end of the run. Invoices are buffered until ``batch_rows`` items are
+    pending (or until close when it is None), then transformed together and
+    handed to ``write_frame``. Use it as a context manager: a run that fails
+    part-way calls ``abort`` instead of ``close``.
+
+    With ``money_mode='exact'`` amounts are computed in integer paise and every
+    batch is reconciled against the extracted item totals; mismatches are
+    collected in ``total_mismatches``.
+
+    With a ``dedup`` index (dedup.DedupIndex), invoices whose bill number, party
+    and date are already indexed are dropped in ``write`` and counted in
+    ``duplicates_skipped``. Subclasses call ``commit_index`` once rows are in the
+    output, so the index never lists invoices that were not written.
+    """
+
+    batch_rows = None
+    # Optional results.ResultBuffer that every flushed batch is added to, for browsing
+    results = None
+
+    def __init__(self, output_file, mode='write', money_mode='float', dedup=None):
+        self.output_file = output_file
+        self.mode = mode
+        self.money_mode = money_mode
+        self.dedup = dedup
+        self.total_mismatches = []
+        self.invoices_written = 0
+        self.rows_written = 0
+        self.duplicates_skipped = 0
+        self._pending = []
+        self._pending_items = 0
+        self._preview = []
+
+    def open(self):
+        if self.dedup is None:
+            return
+        if self.mode == 'write':
+            self.dedup.clear()
+        elif len(self.dedup) == 0 and output_exists(self.output_file):
+            # First indexed append to a file exported without an index
+            self.dedup.add_keys(self.read_existing_headers())
+
+    def read_existing_headers(self):
+        """Header dicts of the invoices already in ``output_file``, for seeding a new index"""
+        return []
+
+    def write(self, docs, content_hashes=None):
+        """
+        Queue extracted invoices for export.
+        ``content_hashes`` (one per doc, from the splitter) are recorded in the dedup index.
+        """
+        if self.dedup is not None:
+            docs = self._drop_duplicates(docs, content_hashes or [None] * len(docs))
+        self._pending.extend(docs)
+        self._pending_items += sum(_item_count(doc_data) for doc_data in docs)
+        if self.batch_rows is not None and self._pending_items >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        frame = rows_frame(self._pending, self.money_mode)
+        if self.money_mode == 'exact':
+            mismatches = reconcile_totals(self._pending)
+            if len(mismatches):
+                self.total_mismatches.append(mismatches)
+        docs = self._pending
+        self.invoices_written += len(docs)
+        self.rows_written += len(frame)
+        self._pending = []
+        self._pending_items = 0
+
+        previewed = sum(len(part) for part in self._preview)
+        if previewed < PREVIEW_ROWS:
+            self._preview.append(frame.head(PREVIEW_ROWS - previewed))
+        self.write_batch(docs, frame)
+        if self.results is not None:
+            self.results.add(frame, docs)
+
+    def write_batch(self, docs, frame):
+        """Write one flushed batch; targets that need more than the rows (e.g. invoice boundaries) override this"""
+        self.write_frame(frame)
+
+    def _drop_duplicates(self, docs, content_hashes):
+        kept = []
+        for doc_data, content_hash in zip(docs, content_hashes):
+            duplicate = self.dedup.contains(doc_data)
+            # A duplicate's content hash is indexed too, so a re-run skips it before extraction
+            self.dedup.add(doc_data, content_hash)
+            if duplicate:
+                self.duplicates_skipped += 1
+            else:
+                kept.append(doc_data)
+        return kept
+
+    def commit_index(self, mark=None):
+        """Commit the dedup entries of everything written so far (or up to a ``dedup.mark()``)"""
+        if self.dedup is not None:
+            self.dedup.commit(mark)
+
+    def write_frame(self, frame):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+    def abort(self):
+        self._pending = []
+        self._pending_items = 0
+        if self.dedup is not None:
+            self.dedup.rollback()
+
+    def mismatch_count(self):
+        """Number of items whose extracted total did not reconcile (exact mode only)"""
+        return sum(len(part) for part in self.total_mismatches)
+
+    def preview_frame(self):
+        """First rows written in this run, as a DataFrame in export column order"""
+        if not self._preview:
+            return pd.DataFrame(columns=COLUMN_ORDER)
+        return pd.concat(self._preview, ignore_index=True)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def _gzip(data):
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _zstd(data):
+    # A compressor per call: ZstdCompressor objects must not be shared between threads
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+# Compression: (function compressing one chunk into a self-contained member, file suffix)
+CSV_COMPRESSION = {
+    'gzip': (_gzip, '.gz'),
+    'zstd': (_zstd, '.zst'),
+}
+
+# Part file names insert the part number before the extension: invoice_data.part0001.csv.gz
+_PART_PATTERN = re.compile(r"\.part(\d+)$")
+
+
+def _split_extension(output_file):
+    """('invoice_data', '.csv.gz') for 'invoice_data.csv.gz'"""
+    index = output_file.lower().rfind(".csv")
+    if index == -1:
+        return os.path.splitext(output_file)
+    return output_file[:index], output_file[index:]
+
+
+def part_path(output_file, number):
+    stem, extension = _split_extension(output_file)
+    return f"{stem}.part{number:04d}{extension}"
+
+
+def _numbered_parts(output_file):
+    stem, extension = _split_extension(output_file)
+    parts = []
+    for path in glob.glob(f"{glob.escape(stem)}.part*{glob.escape(extension)}"):
+        match = _PART_PATTERN.search(path[:len(path) - len(extension)])
+        if match:
+            parts.append((int(match.group(1)), path))
+    return sorted(parts)
+
+
+def part_paths(output_file):
+    """Existing part files of a size-bounded CSV export, in part order"""
+    return [path for _, path in _numbered_parts(output_file)]
+
+
+def output_exists(output_file):
+    """True if ``output_file`` or any of its part files exists"""
+    return os.path.exists(output_file) or bool(part_paths(output_file))
+
+
+class CsvWriter(Writer):
+    """
+    Streams rows to a CSV file in batches of ``batch_rows`` items.
+
+    With ``compression`` ('gzip', or 'zstd' when the zstandard package is
+    installed) every batch is rendered to CSV once and compressed on a thread
+    pool as a self-contained member; members are written in order, so the file
+    is a valid concatenated .gz/.zst stream. Appending adds members without
+    rewriting anything. The compression's suffix is added to ``output_file``
+    unless it already ends with it; a name with another compression's suffix
+    (or any, without compression) is rejected.
+
+    With ``part_size`` (bytes on disk) output is split into part files named
+    ``<name>.part0001.csv[.gz]``, each starting with the header; a part is closed
+    once it reaches the size, so it may exceed it by up to one batch. Appending
+    starts a new part after the existing ones.
+    """
+
+    def __init__(self, output_file, mode='write', money_mode='float', dedup=None, batch_rows=1000,
+                 compression=None, part_size=None, compress_workers=None):
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package (pip install zstandard)")
+        if compression is not None and compression not in CSV_COMPRESSION:
+            raise ValueError(f"Unsupported CSV compression: {compression}")
+        for other, (_, suffix) in CSV_COMPRESSION.items():
+            if other != compression and output_file.lower().endswith(suffix):
+                raise ValueError(f"{output_file} is named for {other} compression, "
+                                 f"but the CSV is written {compression or 'uncompressed'}")
+        if compression is not None and not output_file.lower().endswith(CSV_COMPRESSION[compression][1]):
+            output_file += CSV_COMPRESSION[compression][1]
+        super().__init__(output_file, mode, money_mode, dedup)
+        self.batch_rows = batch_rows
+        self.compression = compression
+        self.part_size = part_size
+        self.compress_workers = compress_workers or min(4, os.cpu_count() or 1)
+        self.parts_written = []
+        self._header = pd.DataFrame(columns=COLUMN_ORDER).to_csv(index=False).encode('utf-8')
+        self._file = None
+        self._file_bytes = 0
+        self._part_number = 0
+        self._pool = None
+        self._in_flight = deque()
+
+    def _compress(self, data):
+        if self.compression is None:
+            return data
+        return CSV_COMPRESSION[self.compression][0](data)
+
+    def _start_file(self, path, appending):
+        if self._file is not None:
+            self._file.close()
+        self._file = open(path, 'ab' if appending else 'wb')
+        self._file_bytes = self._file.tell()
+        self.parts_written.append(path)
+        if not appending:
+            self._write_chunk(self._compress(self._header))
+
+    def open(self):
+        super().open()
+        if self.compression is not None:
+            self._pool = ThreadPoolExecutor(max_workers=self.compress_workers, thread_name_prefix="csv-compress")
+        if self.part_size:
+            existing = _numbered_parts(self.output_file)
+            if self.mode == 'write':
+                for _, path in existing:
+                    os.remove(path)
+                existing = []
+            self._part_number = existing[-1][0] + 1 if existing else 1
+            self._start_file(part_path(self.output_file, self._part_number), appending=False)
+        else:
+            appending = self.mode == 'append' and os.path.exists(self.output_file)
+            self._start_file(self.output_file, appending)
+
+    def read_existing_headers(self):
+        paths = part_paths(self.output_file) if self.part_size else [self.output_file]
+        frames = [
+            pd.read_csv(path, usecols=HEADER_COLUMNS, dtype=str, keep_default_na=False)
+            for path in paths if os.path.exists(path)
+        ]
+        if not frames:
+            return []
+        return _invoice_headers(pd.concat(frames, ignore_index=True))
+
+    def _write_chunk(self, chunk):
+        self._file.write(chunk)
+        self._file_bytes += len(chunk)
+
+    def _write_rows(self, chunk, mark):
+        if self.part_size and self._file_bytes >= self.part_size:
+            self._part_number += 1
+            self._start_file(part_path(self.output_file, self._part_number), appending=False)
+        self._write_chunk(chunk)
+        self.commit_index(mark)
+
+    def _drain(self, wait_all=False):
+        """Write finished chunks in submission order; all of them when ``wait_all``"""
+        while self._in_flight and (
+            wait_all or self._in_flight[0][0].done() or len(self._in_flight) > 2 * self.compress_workers
+        ):
+            future, mark = self._in_flight.popleft()
+            self._write_rows(future.result(), mark)
+
+    def write_frame(self, frame):
+        data = frame.to_csv(header=False, index=False).encode('utf-8')
+        # Every pending invoice is in this frame (flush writes them all at once)
+        mark = self.dedup.mark() if self.dedup is not None else None
+        if self._pool is None:
+            self._write_rows(data, mark)
+        else:
+            self._in_flight.append((self._pool.submit(self._compress, data), mark))
+            self._drain()
+
+    def _close_file(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        self._in_flight.clear()
+        self._file.close()
+        self._file = None
+
+    def close(self):
+        if self._file is None:
+            return
+        super().close()
+        self._drain(wait_all=True)
+        self._close_file()
+
+    def abort(self):
+        # Rows that were already flushed stay in the file; drop the pending batch
+        if self._file is not None:
+            try:
+                self._drain(wait_all=True)
+            finally:
+                self._close_file()
+        super().abort()
+
+
+class ExcelWriter(Writer):
+    """Transforms all invoices in one batch and writes the workbook once, on close."""
+
+    def __init__(self, output_file, mode='write', money_mode='float', dedup=None):
+        super().__init__(output_file, mode, money_mode, dedup)
+        self._frames = []
+
+    def read_existing_headers(self):
+        frame = pd.read_excel(self.output_file, usecols=HEADER_COLUMNS, dtype=str).fillna("")
+        return _invoice_headers(frame)
+
+    def write_frame(self, frame):
+        self._frames.append(frame)
+
+    def close(self):
+        super().close()
+        frames = self._frames or [pd.DataFrame(columns=COLUMN_ORDER)]
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        if self.mode == 'append' and os.path.exists(self.output_file):
+            existing_df = pd.read_excel(self.output_file)
+            df = pd.concat([existing_df, df], ignore_index=True)
+        df.to_excel(self.output_file, index=False, engine='openpyxl')
+        self._frames = []
+        self.commit_index()
+
+    def abort(self):
+        super().abort()
+        self._frames = []
+
+
+def _json_default(value):
+    # Decimal amounts (money_mode='exact') and numpy scalars
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def _dumps_jsonl(document):
+    if orjson is not None:
+        return orjson.dumps(document, default=_json_default, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(document, default=_json_default, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+# Extracted item key of each export column that holds an extracted value; PRICE and
+# AMOUNT are computed (LIST_PRICE is the extracted rate)
+JSONL_ITEM_KEYS = {
+    "ITEM_NAME": "items",
+    "QUANTITY": "Qnty",
+    "UNIT": "unit",
+    "LIST_PRICE": "price",
+    "DISCOUNT_PERCENT": "discount",
+}
+
+
+def invoice_document(doc_data):
+    """One invoice as a JSON-ready dict: the header fields plus its parsed items as a list"""
+    document = {key: value for key, value in doc_data.items() if key != "items"}
+    document["items"] = doc_data.get("items", {}).get("items", [])
+    return document
+
+
+def rows_document(records, template=None):
+    """
+    One invoice as ``invoice_document`` writes it, rebuilt from its export rows
+    (dicts, header values on the first). Header fields and item keys of
+    ``template`` (default: the registry default) that rows do not carry, such as
+    ``dealer``, ``hsna`` and ``total``, are None, so both give the same keys.
+    """
+    template = templates.resolve(template) or templates.REGISTRY.default
+    document = dict(template.defaults)
+    document.update(dict.fromkeys(template.header_fields))
+    document.update({column: records[0][column] for column in HEADER_COLUMNS})
+    items = []
+    for record in records:
+        item = dict.fromkeys(template.fields)
+        item.update({key: record[column] for column, key in JSONL_ITEM_KEYS.items()})
+        # Rows leave the discount blank where the invoice has none
+        if item["discount"] == "":
+            item["discount"] = None
+        items.append(item)
+    document["items"] = items
+    return document
+
+
+class JsonlWriter(Writer):
+    """
+    Streams one JSON object per invoice (see ``invoice_document``) to a JSONL file.
+
+    Unlike the row-based targets, the header is kept once per invoice and items
+    stay nested, with their extracted values. Every ``write`` is encoded and
+    written straight away, with orjson when it is installed. Decimal values
+    (money_mode='exact') are written as strings so that no digits are lost.
+    """
+
+    batch_rows = 0
+
+    def __init__(self, output_file, mode='write', money_mode='float', dedup=None):
+        super().__init__(output_file, mode, money_mode, dedup)
+        self._file = None
+
+    def open(self):
+        super().open()
+        self._file = open(self.output_file, 'ab' if self.mode == 'append' else 'wb')
+
+    def read_existing_headers(self):
+        headers = []
+        with open(self.output_file, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    headers.append(json.loads(line))
+        return headers
+
+    def flush(self):
+        if not self._pending:
+            return
+        docs = self._pending
+        self._pending = []
+        self._pending_items = 0
+        if self.money_mode == 'exact':
+            mismatches = reconcile_totals(docs)
+            if len(mismatches):
+                self.total_mismatches.append(mismatches)
+
+        # The rows are only built for the preview and the results buffer
+        previewed = sum(len(part) for part in self._preview)
+        frame = None
+        if previewed < PREVIEW_ROWS or self.results is not None:
+            frame = rows_frame(docs, self.money_mode)
+        if previewed < PREVIEW_ROWS:
+            self._preview.append(frame.head(PREVIEW_ROWS - previewed))
+
+        self._file.write(b"".join(_dumps_jsonl(invoice_document(doc_data)) for doc_data in docs))
+        self._file.flush()
+        self.invoices_written += len(docs)
+        self.rows_written += sum(_item_count(doc_data) for doc_data in docs)
+        self.commit_index()
+        if self.results is not None:
+            self.results.add(frame, docs)
+
+    def write_frame(self, frame):
+        # Rows without invoice boundaries (export_data): group them back into invoice documents
+        starts = _invoice_starts(frame)
+        ends = np.append(starts[1:], len(frame))
+        records = frame.astype(object).where(frame.notna(), None).to_dict("records")
+        documents = [rows_document(records[start:end]) for start, end in zip(starts, ends)]
+        self._file.write(b"".join(_dumps_jsonl(document) for document in documents))
+        self._file.flush()
+        self.invoices_written += len(documents)
+        self.rows_written += len(frame)
+        self.commit_index()
+
+    def close(self):
+        if self._file is None:
+            return
+        super().close()
+        self._file.close()
+        self._file = None
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        super().abort()
+
+
+# Normalized schema of the database targets; statements are valid in SQLite and DuckDB
+DATABASE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS invoices (
+        id INTEGER PRIMARY KEY,
+        vch_series TEXT,
+        sale_type TEXT,
+        mc_name TEXT,
+        bill_date TEXT,
+        bill_no TEXT,
+        party_name TEXT,
+        dealer TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS items (
+        invoice_id INTEGER NOT NULL REFERENCES invoices (id),
+        line_no INTEGER NOT NULL,
+        item_name TEXT,
+        hsn TEXT,
+        quantity DOUBLE,
+        unit TEXT,
+        price DOUBLE,
+        discount_percent DOUBLE,
+        list_price_alt_unit DOUBLE,
+        list_price DOUBLE,
+        amount DOUBLE,
+        total DOUBLE,
+        PRIMARY KEY (invoice_id, line_no)
+    )""",
+    "CREATE INDEX IF NOT EXISTS invoices_bill ON invoices (bill_no, party_name, bill_date)",
+]
+
+# invoices table column: export column
+INVOICE_TABLE_COLUMNS = {
+    "vch_series": "VCH_SERIES",
+    "sale_type": "SALE/PURC_TYPE",
+    "mc_name": "MC_NAME",
+    "bill_date": "VCH/BILL_DATE",
+    "bill_no": "VCH/BILL_NO",
+    "party_name": "PARTY_NAME",
+}
+
+# items table column: export column
+ITEM_TABLE_COLUMNS = {
+    "item_name": "ITEM_NAME",
+    "quantity": "QUANTITY",
+    "unit": "UNIT",
+    "price": "PRICE",
+    "discount_percent": "DISCOUNT_PERCENT",
+    "list_price_alt_unit": "LIST_PRICE_ALT_UNIT",
+    "list_price": "LIST_PRICE",
+    "amount": "AMOUNT",
+}
+
+
+def _optional_float(value):
+    return None if value is None or value == "" else float(value)
+
+
+class DatabaseWriter(Writer):
+    """
+    Bulk-inserts invoices and their items into a normalized invoices/items schema.
+
+    Every flushed batch of ``batch_rows`` items goes in as one transaction:
+    invoice ids are allocated up front, so header and item rows are inserted
+    with one bulk statement each. Append mode adds to the existing tables;
+    write mode drops and recreates them.
+    """
+
+    def __init__(self, output_file, mode='write', money_mode='float', dedup=None, batch_rows=5000):
+        super().__init__(output_file, mode, money_mode, dedup)
+        self.batch_rows = batch_rows
+        self._conn = None
+        self._next_id = 1
+
+    def connect(self):
+        raise NotImplementedError
+
+    def insert(self, table, frame):
+        """Insert every row of ``frame`` (columns named as in the table) into ``table``"""
+        raise NotImplementedError
+
+    def open(self):
+        self._conn = self.connect()
+        if self.mode == 'write':
+            self._conn.execute("DROP TABLE IF EXISTS items")
+            self._conn.execute("DROP TABLE IF EXISTS invoices")
+        for statement in DATABASE_SCHEMA:
+            self._conn.execute(statement)
+        self._next_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM invoices").fetchone()[0]
+        super().open()
+
+    def read_existing_headers(self):
+        rows = self._conn.execute("SELECT bill_no, party_name, bill_date FROM invoices").fetchall()
+        return [dict(zip(("VCH/BILL_NO", "PARTY_NAME", "VCH/BILL_DATE"), row)) for row in rows]
+
+    def write_batch(self, docs, frame):
+        items = [item for doc_data in docs for item in doc_data.get("items", {}).get("items", [])]
+        self._insert_batch(
+            frame,
+            [_item_count(doc_data) for doc_data in docs],
+            headers={column: [doc_data.get(column) for doc_data in docs]
+                     for column in list(INVOICE_TABLE_COLUMNS.values()) + ["dealer"]},
+            hsn=[item.get("hsna") for item in items],
+            totals=[_optional_float(item.get("total")) for item in items],
+        )
+
+    def write_frame(self, frame):
+        starts = _invoice_starts(frame)
+        counts = np.diff(np.append(starts, len(frame)))
+        headers = {column: frame[column].to_numpy()[starts] for column in INVOICE_TABLE_COLUMNS.values()}
+        headers["dealer"] = [None] * len(starts)
+        self._insert_batch(frame, counts, headers, hsn=None, totals=None)
+
+    def _insert_batch(self, frame, counts, headers, hsn, totals):
+        counts = np.asarray(counts, dtype=np.int64)
+        ids = np.arange(self._next_id, self._next_id + len(counts))
+        starts = np.cumsum(counts) - counts
+
+        invoices = pd.DataFrame({"id": ids})
+        for table_column, column in INVOICE_TABLE_COLUMNS.items():
+            invoices[table_column] = headers[column]
+        invoices["dealer"] = headers["dealer"]
+
+        items = pd.DataFrame({
+            "invoice_id": np.repeat(ids, counts),
+            "line_no": np.arange(len(frame)) - np.repeat(starts, counts) + 1,
+        })
+        for table_column, column in ITEM_TABLE_COLUMNS.items():
+            items[table_column] = frame[column].to_numpy()
+        items["discount_percent"] = pd.to_numeric(items["discount_percent"], errors="coerce")
+        items["hsn"] = hsn
+        items["total"] = totals
+
+        self._conn.execute("BEGIN TRANSACTION")
+        try:
+            self.insert("invoices", invoices)
+            self.insert("items", items)
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._next_id += len(counts)
+        self.commit_index()
+
+    def close(self):
+        if self._conn is None:
+            return
+        super().close()
+        self._conn.close()
+        self._conn = None
+
+    def abort(self):
+        # Batches already committed stay in the database; drop the pending one
+        super().abort()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class SqliteWriter(DatabaseWriter):
+    """Writes to a SQLite file with one prepared INSERT per table, executed for the whole batch."""
+
+    def connect(self):
+        # Autocommit; transactions are opened explicitly per batch
+        conn = sqlite3.connect(self.output_file, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def insert(self, table, frame):
+        columns = ", ".join(frame.columns)
+        placeholders = ", ".join("?" * len(frame.columns))
+        # Object dtype turns NumPy scalars into Python values sqlite3 can bind; NaN becomes NULL
+        values = frame.astype(object).where(frame.notna(), None)
+        self._conn.executemany(
+            f"INSERT INTO {table} ({columns}) VALUES ({placeholders})",
+            values.itertuples(index=False, name=None),
+        )
+
+
+class DuckDbWriter(DatabaseWriter):
+    """Writes to a DuckDB file, inserting each batch straight from its DataFrame."""
+
+    def connect(self):
+        return duckdb.connect(self.output_file)
+
+    def insert(self, table, frame):
+        self._conn.register("batch_frame", frame)
+        try:
+            columns = ", ".join(frame.columns)
+            self._conn.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM batch_frame")
+        finally:
+            self._conn.unregister("batch_frame")
+
+
+WRITERS = {
+    'csv': CsvWriter,
+    'excel': ExcelWriter,
+    'sqlite': SqliteWriter,
+    'jsonl': JsonlWriter,
+}
+if duckdb is not None:
+    WRITERS['duckdb'] = DuckDbWriter
+
+EXTENSIONS = {
+    'csv': 'csv',
+    'excel': 'xlsx',
+    'sqlite': 'sqlite',
+    'duckdb': 'duckdb',
+    'jsonl': 'jsonl',
+}
+
+
+def register_writer(file_format, writer_class):
+    """Make a Writer subclass available to get_writer under ``file_format``"""
+    WRITERS[file_format.lower()] = writer_class
+
+
+def get_writer(file_format, output_file, mode='write', **options):
+    try:
+        writer_class = WRITERS[file_format.lower()]
+    except KeyError:
+        raise ValueError(f"Unsupported output format: {file_format}") from None
+    return writer_class(output_file, mode=mode, **options)
+
+
+def output_filename(filename, file_format, compression=None):
+    """Append the extension that matches ``file_format`` (and CSV ``compression``) to ``filename``"""
+    file_format = file_format.lower()
+    name = f"{filename}.{EXTENSIONS.get(file_format, file_format)}"
+    if file_format == 'csv' and compression is not None:
+        name += CSV_COMPRESSION[compression][1]
+    return name
+
+
+def export_invoices(input_pdf_path, output_folder, writer, workers=None, queue_size=8,
+                    executor='process', on_progress=None, stats=None, cancel_event=None,
+                    profiler=None, page_chunk=16, table_engine="dict", timeout=None, retries=0,
+                    quarantine=None, split_options=None, autoscale=None, watermarks=None, lookahead=64,
+                    first_page=None):
+    """
+    Split, extract and export every invoice in ``input_pdf_path`` through ``writer``.
+    If ``cancel_event`` is set mid-run, the writer is aborted and
+    pipeline.PipelineCancelled is raised.
+    When the writer has a dedup index, invoices whose page text was already
+    exported are skipped before extraction (counted in ``stats.skipped``).
+    ``table_engine`` picks how table rows are read (table_extractor.TABLE_ENGINES).
+    ``timeout``, ``retries`` and ``quarantine`` isolate failing invoices, see
+    pipeline.run_pipeline. ``split_options`` control how split invoices are
+    saved (invoice_splitter.iter_invoices). ``autoscale`` (pipeline.AutoScaler)
+    adapts the number of concurrent workers to memory. ``lookahead`` invoices
+    are held back so the longest is extracted first (pipeline.run_pipeline).
+    With ``watermarks`` (watermark.HighWaterMarks) only the pages after the
+    source's mark are split, and a completed run moves the mark to the end of
+    its last invoice; writing (rather than appending) starts the marks afresh.
+    A caller that already called ``watermarks.resume_page`` passes its result
+    as ``first_page``, since verifying the mark rereads the whole prefix.
+
+    Returns:
+        int: Number of invoices processed
+    """
+    def write_invoice(invoice, doc_data):
+        writer.write([doc_data], [invoice.get("content_hash")])
+
+    skip_invoice = None
+    if writer.dedup is not None:
+        skip_invoice = lambda invoice: writer.dedup.contains_content(invoice.get("content_hash"))
+
+    if watermarks is None:
+        first_page = 0
+    else:
+        if writer.mode == 'write':
+            watermarks.clear()
+            first_page = 0
+        elif first_page is None:
+            first_page = watermarks.resume_page(input_pdf_path)
+        split_options = dict(split_options or {}, first_page=first_page)
+        stats = stats if stats is not None else pipeline.PipelineStats()
+
+    with writer:
+        done = pipeline.run_pipeline(
+            input_pdf_path,
+            output_folder,
+            write_invoice,
+            workers=workers,
+            queue_size=queue_size,
+            executor=executor,
+            on_progress=on_progress,
+            stats=stats,
+            extract_options={'money_mode': writer.money_mode, 'table_engine': table_engine},
+            cancel_event=cancel_event,
+            profiler=profiler,
+            skip_invoice=skip_invoice,
+            page_chunk=page_chunk,
+            timeout=timeout,
+            retries=retries,
+            quarantine=quarantine,
+            split_options=split_options,
+            autoscale=autoscale,
+            lookahead=lookahead,
+        )
+    # Only once the writer is closed: a failed run leaves the mark where it was
+    if watermarks is not None:
+        watermarks.advance(input_pdf_path, max(stats.split_end, first_page), done)
+    return done
+
+
+def export_data(all_rows, output_file, file_format, mode='write'):
+    """Export already-built rows to any registered format and return them as a DataFrame"""
+    df = pd.DataFrame(all_rows, columns=COLUMN_ORDER)
+    writer = get_writer(file_format, output_file, mode)
+    with writer:
+        writer.write_frame(df)
+    return df
@@ -1,57 +1,138 @@
 import fitz  # PyMuPDF
+import hashlib
 import os
 from tqdm import tqdm
 import uuid
 from pathlib import Path
 
-def split_invoices(input_pdf_path, output_folder):
-    os.makedirs(output_folder, exist_ok=True)
+from custom_modules import templates
+from custom_modules.doc_cache import CACHE
+
+# Save options for split invoices: drop unused objects, compress every stream and
+# pack the small objects into compressed object streams
+COMPACT_SAVE = {"garbage": 3, "deflate": True, "deflate_images": True, "deflate_fonts": True, "use_objstms": 1}
+
+def page_count(input_pdf_path):
+    """Return the number of pages in a PDF without extracting any text."""
+    return CACHE.document(input_pdf_path).page_count
+
+def save_invoice_pdf(pdf, output_path, compact=True, subset_fonts=False):
+    """
+    Save a split invoice. ``compact`` applies COMPACT_SAVE; ``subset_fonts``
+    also cuts embedded fonts down to the glyphs the invoice uses, which pays off
+    when the source embeds whole fonts but is slow when they are subsets already.
+    """
+    if subset_fonts:
+        pdf.subset_fonts()
+    if not compact:
+        pdf.save(output_path)
+        return
+    try:
+        pdf.save(output_path, **COMPACT_SAVE)
+    except TypeError:  # PyMuPDF before 1.24 has no object streams
+        pdf.save(output_path, **{k: v for k, v in COMPACT_SAVE.items() if k != "use_objstms"})
+
 
-    pdf = fitz.open(input_pdf_path)
+def scan_invoices(input_pdf_path, first_page=0, show_progress=False):
+    """
+    Find the invoice boundaries in a PDF from its page text, without saving anything.
+
+    Yields:
+        dict: {"index", "start_page", "end_page", "template", "content_hash"} for
+        every invoice found from ``first_page`` on, as in iter_invoices
+    """
+    pdf = CACHE.document(input_pdf_path)
     invoice_count = 0
     start_page = None
-    saved_pdf_paths = []
-    
-    # Extract original PDF name without extension
-    original_pdf_name = Path(input_pdf_path).stem
-    
-    # Generate unique ID for this batch
-    unique_id = uuid.uuid4().hex[:8]  # 8-character unique ID
+    template = None
 
-    print(f"📄 Processing '{input_pdf_path}' ({pdf.page_count} pages)...\n")
+    pages = range(first_page, pdf.page_count)
+    if show_progress:
+        pages = tqdm(pages, desc="Splitting invoices", unit="page")
 
-    for page_num in tqdm(range(pdf.page_count), desc="Splitting invoices", unit="page"):
+    for page_num in pages:
         page = pdf.load_page(page_num)
         text = page.get_text("text")
 
-        # Detect start of an invoice
-        if start_page is None and "Tax Invoice" in text:
-            start_page = page_num
+        # Detect start of an invoice, fingerprinting its layout on the first page
+        if start_page is None:
+            template = templates.REGISTRY.match(text)
+            if template.invoice_start in text:
+                start_page = page_num
+                content = hashlib.sha1()
+
+        if start_page is not None:
+            content.update(text.encode("utf-8"))
 
         # Detect end of an invoice
-        if start_page is not None and "This is a Computer Generated Invoice" in text:
-            end_page = page_num
+        if start_page is not None and template.invoice_end in text:
             invoice_count += 1
-
-            # Create new PDF with the invoice pages
-            new_pdf = fitz.open()
-            new_pdf.insert_pdf(pdf, from_page=start_page, to_page=end_page)
-            
-            # Create filename with format: <original_name>_<unique_id>_<count>.pdf
-            output_filename = f"{original_pdf_name}_{unique_id}_{invoice_count}.pdf"
-            output_path = os.path.join(output_folder, output_filename)
-            
-            new_pdf.save(output_path)
-            new_pdf.close()
-            
-            # Add to list of saved paths
-            saved_pdf_paths.append(output_path)
+            yield {
+                "index": invoice_count - 1,
+                "start_page": start_page,
+                "end_page": page_num,
+                "template": template.name,
+                "content_hash": content.hexdigest(),
+            }
 
             # Reset for next invoice
             start_page = None
 
-    pdf.close()
-    print(f"\n✅ Done! Extracted {invoice_count} invoices into '{output_folder}'.")
+def iter_invoices(input_pdf_path, output_folder, show_progress=False, compact=True, subset_fonts=False,
+                  first_page=0):
+    """
+    Split a PDF into individual invoices, yielding each one as soon as it is saved.
+
+    Args:
+        input_pdf_path (str): Path to the multi-invoice PDF
+        output_folder (str): Folder the individual invoice PDFs are written to
+        show_progress (bool): Show a tqdm bar over the source pages
+        compact, subset_fonts (bool): How the invoice PDFs are saved, see save_invoice_pdf
+        first_page (int): First source page to scan (0-based), e.g. the end of the
+            invoices split by an earlier run (see watermark.HighWaterMarks)
+
+    Yields:
+        dict: {"index", "path", "start_page", "end_page", "template", "content_hash"}
+        for every invoice found from ``first_page`` on, with 0-based page numbers
+        relative to the source PDF, the name of the template matched on the
+        invoice's first page and a SHA-1 of the invoice's page text (the same
+        invoice in another PDF hashes the same)
+    """
+    os.makedirs(output_folder, exist_ok=True)
+
+    pdf = CACHE.document(input_pdf_path)
+
+    # Extract original PDF name without extension
+    original_pdf_name = Path(input_pdf_path).stem
+
+    # Generate unique ID for this batch
+    unique_id = uuid.uuid4().hex[:8]  # 8-character unique ID
+
+    for invoice in scan_invoices(input_pdf_path, first_page, show_progress):
+        # Create new PDF with the invoice pages
+        new_pdf = fitz.open()
+        new_pdf.insert_pdf(pdf, from_page=invoice["start_page"], to_page=invoice["end_page"])
+
+        # Create filename with format: <original_name>_<unique_id>_<count>.pdf
+        output_filename = f"{original_pdf_name}_{unique_id}_{invoice['index'] + 1}.pdf"
+        output_path = os.path.join(output_folder, output_filename)
+
+        save_invoice_pdf(new_pdf, output_path, compact, subset_fonts)
+        new_pdf.close()
+
+        yield dict(invoice, path=output_path)
+
+def split_invoices(input_pdf_path, output_folder, compact=True, subset_fonts=False, first_page=0):
+    total_pages = page_count(input_pdf_path)
+
+    print(f"📄 Processing '{input_pdf_path}' ({total_pages - first_page} of {total_pages} pages)...\n")
+
+    saved_pdf_paths = [
+        invoice["path"]
+        for invoice in iter_invoices(input_pdf_path, output_folder, show_progress=True,
+                                     compact=compact, subset_fonts=subset_fonts, first_page=first_page)
+    ]
+
+    print(f"\n✅ Done! Extracted {len(saved_pdf_paths)} invoices into '{output_folder}'.")
     
     return saved_pdf_paths
-
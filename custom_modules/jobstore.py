@@ -0,0 +1,409 @@
+import argparse
+import functools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent import futures
+from decimal import Decimal
+
+from custom_modules import exporter, invoice_splitter, pipeline, table_extractor
+from custom_modules.dedup import DedupIndex
+
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    name TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    money_mode TEXT NOT NULL,
+    table_engine TEXT NOT NULL,
+    split_done INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    batch TEXT NOT NULL REFERENCES batches (name),
+    idx INTEGER NOT NULL,
+    invoice TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    UNIQUE (batch, idx)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_expires);
+"""
+
+# Job states
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def _encode(value):
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    raise TypeError(f"Cannot store {type(value).__name__} in a job result")
+
+
+def _decode(obj):
+    return Decimal(obj["$decimal"]) if obj.keys() == {"$decimal"} else obj
+
+
+def dump_result(doc_data):
+    """JSON for an extraction result; Decimal amounts (money_mode="exact") survive the round trip"""
+    return json.dumps(doc_data, default=_encode)
+
+
+def load_result(text):
+    return json.loads(text, object_hook=_decode)
+
+
+class JobStore:
+    """
+    Lease-based queue of invoice extraction jobs in one SQLite file.
+
+    Every state change is a single UPDATE guarded by the job's state and owner,
+    so a worker that lost its lease can neither complete nor fail the job. Each
+    thread gets its own connection. The rollback journal is used rather than WAL,
+    because WAL needs shared memory on one host.
+    """
+
+    def __init__(self, path, max_attempts=3, busy_timeout=30):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self.connection().executescript(JOB_SCHEMA)
+
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=DELETE")
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def create_batch(self, name, source, money_mode="float", table_engine="dict"):
+        self.connection().execute(
+            "INSERT INTO batches (name, source, money_mode, table_engine, created) VALUES (?, ?, ?, ?, ?)",
+            (name, source, money_mode, table_engine, time.time()),
+        )
+
+    def batch(self, name):
+        row = self.connection().execute(
+            "SELECT name, source, money_mode, table_engine, split_done FROM batches WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown batch: {name}")
+        return dict(zip(("name", "source", "money_mode", "table_engine", "split_done"), row))
+
+    def batches(self):
+        return [row[0] for row in self.connection().execute("SELECT name FROM batches ORDER BY created")]
+
+    def finish_split(self, name):
+        self.connection().execute("UPDATE batches SET split_done = 1 WHERE name = ?", (name,))
+
+    def enqueue(self, batch, invoice):
+        """Queue the extraction of one split invoice (a dict from invoice_splitter.iter_invoices)"""
+        self.connection().execute(
+            "INSERT INTO jobs (batch, idx, invoice) VALUES (?, ?, ?)",
+            (batch, invoice["index"], json.dumps(invoice)),
+        )
+
+    def lease(self, owner, lease_seconds=60):
+        """
+        Take the oldest queued job, or one whose lease has expired, for ``lease_seconds``.
+
+        Returns:
+            dict: {"id", "batch", "invoice", "attempts"}, or None when there is nothing to do
+        """
+        connection = self.connection()
+        now = time.time()
+        # IMMEDIATE takes the write lock up front, so two workers cannot lease the same job
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "UPDATE jobs SET state = ?, owner = NULL, lease_expires = NULL, "
+                "error = 'lease expired ' || attempts || ' times' "
+                "WHERE state = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, LEASED, now, self.max_attempts),
+            )
+            row = connection.execute(
+                "SELECT id, batch, invoice, attempts FROM jobs "
+                "WHERE state = ? OR (state = ? AND lease_expires < ?) ORDER BY id LIMIT 1",
+                (QUEUED, LEASED, now),
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE jobs SET state = ?, owner = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                    (LEASED, owner, now + lease_seconds, row[0]),
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return {"id": row[0], "batch": row[1], "invoice": json.loads(row[2]), "attempts": row[3] + 1}
+
+    def _update_leased(self, sql, params, job_id, owner):
+        cursor = self.connection().execute(
+            sql + " WHERE id = ? AND owner = ? AND state = ?", params + (job_id, owner, LEASED)
+        )
+        return cursor.rowcount == 1
+
+    def heartbeat(self, job_id, owner, lease_seconds=60):
+        """Extend a lease; False if the job is no longer leased to ``owner``"""
+        return self._update_leased("UPDATE jobs SET lease_expires = ?", (time.time() + lease_seconds,), job_id, owner)
+
+    def complete(self, job_id, owner, doc_data):
+        """Store a job's result; False (result discarded) if the lease was lost meanwhile"""
+        return self._update_leased(
+            "UPDATE jobs SET state = ?, result = ?, error = NULL, owner = NULL, lease_expires = NULL",
+            (DONE, dump_result(doc_data)), job_id, owner,
+        )
+
+    def fail(self, job_id, owner, error):
+        """Record a failed attempt; the job is queued again until it has used ``max_attempts``"""
+        return self._update_leased(
+            "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?, "
+            "owner = NULL, lease_expires = NULL",
+            (self.max_attempts, FAILED, QUEUED, error), job_id, owner,
+        )
+
+    def counts(self, batch=None):
+        """{state: number of jobs}, for one batch or the whole store"""
+        sql = "SELECT state, COUNT(*) FROM jobs"
+        params = ()
+        if batch is not None:
+            sql += " WHERE batch = ?"
+            params = (batch,)
+        counts = dict.fromkeys((QUEUED, LEASED, DONE, FAILED), 0)
+        counts.update(self.connection().execute(sql + " GROUP BY state", params).fetchall())
+        return counts
+
+    def pending(self, batch=None):
+        """Jobs not yet done or failed, plus 1 for every batch still being split"""
+        counts = self.counts(batch)
+        sql = "SELECT COUNT(*) FROM batches WHERE split_done = 0"
+        params = ()
+        if batch is not None:
+            sql += " AND name = ?"
+            params = (batch,)
+        splitting = self.connection().execute(sql, params).fetchone()[0]
+        return counts[QUEUED] + counts[LEASED] + splitting
+
+    def results(self, batch):
+        """Yield (invoice, doc_data) for the batch's finished jobs in source order"""
+        rows = self.connection().execute(
+            "SELECT invoice, result FROM jobs WHERE batch = ? AND state = ? ORDER BY idx", (batch, DONE)
+        )
+        for invoice, result in rows:
+            yield json.loads(invoice), load_result(result)
+
+    def failures(self, batch):
+        return [
+            {"invoice": json.loads(invoice), "attempts": attempts, "error": error}
+            for invoice, attempts, error in self.connection().execute(
+                "SELECT invoice, attempts, error FROM jobs WHERE batch = ? AND state = ? ORDER BY idx",
+                (batch, FAILED),
+            )
+        ]
+
+
+def split_batch(store, input_pdf_path, split_folder, batch=None, money_mode="float", table_engine="dict"):
+    """Split ``input_pdf_path`` into ``split_folder``, queueing each invoice as it is saved; returns the batch name"""
+    batch = batch or f"{os.path.splitext(os.path.basename(input_pdf_path))[0]}-{uuid.uuid4().hex[:8]}"
+    store.create_batch(batch, os.path.abspath(input_pdf_path), money_mode, table_engine)
+    for invoice in invoice_splitter.iter_invoices(input_pdf_path, split_folder):
+        invoice["path"] = os.path.abspath(invoice["path"])
+        store.enqueue(batch, invoice)
+    store.finish_split(batch)
+    return batch
+
+
+class _Heartbeat:
+    """Renews a job's lease every third of its length while the block runs"""
+
+    def __init__(self, store, job_id, owner, lease_seconds):
+        self.store = store
+        self.job_id = job_id
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.lease_seconds / 3):
+                if not self.store.heartbeat(self.job_id, self.owner, self.lease_seconds):
+                    return
+        finally:
+            self.store.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def _extract_job(pool, path, job_timeout, **options):
+    """Run one extraction in the pool's child process, killing it after ``job_timeout`` seconds"""
+    future = pool.submit(functools.partial(pipeline.extract_invoice, path, **options))
+    try:
+        return future.result(job_timeout)
+    except futures.TimeoutError:
+        pool.restart()
+        raise futures.TimeoutError(f"Extraction ran for more than {job_timeout:g}s") from None
+    except futures.BrokenExecutor:
+        pool.restart()
+        raise
+
+
+def run_worker(store, owner=None, lease_seconds=60, poll_interval=1.0, exit_when_idle=True, stop_event=None,
+               job_timeout=120):
+    """
+    Lease and extract jobs until the store has nothing left to do (or forever,
+    with ``exit_when_idle=False``, until ``stop_event`` is set).
+
+    With ``job_timeout`` each extraction runs in a child process, which is
+    killed once it has run for that many seconds; the lease then stops being
+    renewed and the attempt is recorded as failed. Without it, extractions run
+    in this process and a hung one keeps its lease for as long as it hangs.
+
+    Returns:
+        int: Number of jobs this worker completed
+    """
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    pool = pipeline.WorkerPool('process', 1) if job_timeout else None
+    options = {}
+    completed = 0
+    try:
+        while stop_event is None or not stop_event.is_set():
+            job = store.lease(owner, lease_seconds)
+            if job is None:
+                if exit_when_idle and not store.pending():
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            if job["batch"] not in options:
+                batch = store.batch(job["batch"])
+                options[job["batch"]] = {"money_mode": batch["money_mode"], "table_engine": batch["table_engine"]}
+            invoice = job["invoice"]
+            try:
+                with _Heartbeat(store, job["id"], owner, lease_seconds):
+                    if pool is None:
+                        doc_data = pipeline.extract_invoice(
+                            invoice["path"], template=invoice.get("template"), **options[job["batch"]]
+                        )
+                    else:
+                        doc_data = _extract_job(pool, invoice["path"], job_timeout,
+                                                template=invoice.get("template"), **options[job["batch"]])
+            except Exception:
+                store.fail(job["id"], owner, traceback.format_exc())
+                continue
+            if store.complete(job["id"], owner, doc_data):
+                completed += 1
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return completed
+
+
+def export_batch(store, batch, writer, poll_interval=2.0):
+    """
+    Wait until every job of ``batch`` is done or failed, then write the results
+    through ``writer`` in source order.
+
+    Returns:
+        tuple: (invoices written, [failed jobs])
+    """
+    while store.pending(batch):
+        time.sleep(poll_interval)
+    written = 0
+    with writer:
+        for invoice, doc_data in store.results(batch):
+            writer.write([doc_data], [invoice.get("content_hash")])
+            written += 1
+    return written, store.failures(batch)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distributed invoice extraction through a shared job store")
+    parser.add_argument("store", help="SQLite job store on a volume shared by all hosts")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    split = commands.add_parser("split", help="Split a PDF and queue one job per invoice")
+    split.add_argument("pdf")
+    split.add_argument("split_folder", help="Folder for the split invoices, readable by every worker")
+    split.add_argument("--batch", default=None, help="Batch name (default: PDF name plus a random suffix)")
+    split.add_argument("--money", choices=["float", "exact"], default="float")
+    split.add_argument("--table-engine", choices=table_extractor.TABLE_ENGINES, default="dict")
+
+    work = commands.add_parser("work", help="Extract queued jobs")
+    work.add_argument("--lease", type=float, default=60, metavar="SECONDS",
+                      help="Lease length; a job is handed to another worker if not renewed in time")
+    work.add_argument("--poll", type=float, default=1.0, metavar="SECONDS")
+    work.add_argument("--forever", action="store_true", help="Keep polling when there is nothing to do")
+    work.add_argument("--max-attempts", type=int, default=3)
+    work.add_argument("--timeout", type=float, default=120, metavar="SECONDS",
+                      help="Kill an extraction that runs longer and fail the attempt (0: wait forever)")
+
+    status = commands.add_parser("status", help="Show job counts per batch")
+    status.add_argument("--batch", default=None)
+
+    export = commands.add_parser("export", help="Wait for a batch and export its results")
+    export.add_argument("batch")
+    export.add_argument("output_file")
+    export.add_argument("--format", choices=list(exporter.WRITERS), default="csv")
+    export.add_argument("--mode", choices=["write", "append"], default="write")
+    export.add_argument("--no-dedup", action="store_true")
+
+    args = parser.parse_args(argv)
+    store = JobStore(args.store, max_attempts=getattr(args, "max_attempts", 3))
+
+    if args.command == "split":
+        batch = split_batch(store, args.pdf, args.split_folder, args.batch, args.money, args.table_engine)
+        print(f"Queued batch {batch}: {store.counts(batch)[QUEUED]} invoices")
+    elif args.command == "work":
+        completed = run_worker(store, lease_seconds=args.lease, poll_interval=args.poll,
+                               exit_when_idle=not args.forever, job_timeout=args.timeout or None)
+        print(f"Completed {completed} jobs")
+    elif args.command == "status":
+        for batch in [args.batch] if args.batch else store.batches():
+            counts = store.counts(batch)
+            splitting = "" if store.batch(batch)["split_done"] else " (splitting)"
+            print(f"{batch}{splitting}: " + ", ".join(f"{state} {count}" for state, count in counts.items()))
+    else:
+        money_mode = store.batch(args.batch)["money_mode"]
+        dedup = None if args.no_dedup else DedupIndex.for_output(args.output_file)
+        writer = exporter.get_writer(args.format, args.output_file, args.mode, money_mode=money_mode, dedup=dedup)
+        written, failures = export_batch(store, args.batch, writer)
+        print(f"Exported {writer.rows_written} rows from {written} invoices to {args.output_file}")
+        for failure in failures:
+            invoice = failure["invoice"]
+            print(f"Failed: invoice {invoice['index'] + 1} (pages {invoice['start_page'] + 1}-"
+                  f"{invoice['end_page'] + 1}) after {failure['attempts']} attempts")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,121 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+
+# Exact fixed-point money arithmetic: amounts are held as integer paise, quantities
+# as thousandths of a unit and discounts as hundredths of a percent, so PRICE and
+# AMOUNT are computed and rounded half-up without float error while staying vectorized.
+PAISE = 100
+QUANTITY_SCALE = 1000
+DISCOUNT_SCALE = 100
+
+# GST slabs (percent) tried when reconciling an item's tax-inclusive total
+GST_RATES = (0, 5, 12, 18, 28)
+
+# Products above this fall back to Python integers (object arrays) to avoid int64 overflow
+_INT64_SAFE = 2 ** 62
+
+_ONE = Decimal(1)
+
+
+def to_fixed(values, scale):
+    """
+    Convert numbers (floats, Decimals or None) to scaled integers.
+
+    Values carrying more decimals than ``scale`` allows are rounded to it.
+
+    Returns:
+        tuple: (int64 array, bool array marking values that were present)
+    """
+    values = list(values)
+    if not any(isinstance(value, Decimal) for value in values):
+        floats = np.array(values, dtype=float)
+        present = ~np.isnan(floats)
+        fixed = np.zeros(len(floats), dtype=np.int64)
+        fixed[present] = np.rint(floats[present] * scale).astype(np.int64)
+        return fixed, present
+
+    # Decimals are scaled exactly; only float inputs go through float arithmetic
+    present = np.zeros(len(values), dtype=bool)
+    scaled = [0] * len(values)
+    for i, value in enumerate(values):
+        if value is None:
+            continue
+        if isinstance(value, Decimal):
+            if not value.is_finite():
+                continue
+            scaled[i] = int((value * scale).quantize(_ONE, rounding=ROUND_HALF_UP))
+        else:
+            value = float(value)
+            if value != value:
+                continue
+            scaled[i] = int(round(value * scale))
+        present[i] = True
+    if max(map(abs, scaled), default=0) < _INT64_SAFE:
+        return np.array(scaled, dtype=np.int64), present
+    return np.array(scaled, dtype=object), present
+
+
+def div_round_half_up(numerator, denominator):
+    """Integer division rounding halves away from zero, element-wise"""
+    sign = np.where(numerator < 0, -1, 1)
+    return sign * ((np.abs(numerator) + denominator // 2) // denominator)
+
+
+def _widen(*arrays):
+    """Switch to Python-int object arrays when the product of the inputs could overflow int64"""
+    bound = 1
+    for array in arrays:
+        bound *= max(int(np.abs(array).max(initial=0)), 1)
+    if bound < _INT64_SAFE:
+        return arrays
+    return tuple(array.astype(object) for array in arrays)
+
+
+def exact_amounts(quantities, list_prices, discounts):
+    """
+    Compute price after discount and line amount exactly, in paise.
+
+    PRICE is ``list_price * (1 - discount/100)`` and AMOUNT is
+    ``quantity * list_price * (1 - discount/100)``, each rounded half-up to the
+    paisa once, from the unrounded product.
+
+    Returns:
+        tuple: (price_paise, amount_paise, present) where ``present`` marks items
+        that have both a quantity and a list price
+    """
+    quantity, has_quantity = to_fixed(quantities, QUANTITY_SCALE)
+    list_price, has_price = to_fixed(list_prices, PAISE)
+    discount, _ = to_fixed(discounts, DISCOUNT_SCALE)
+    remaining = 100 * DISCOUNT_SCALE - discount
+
+    list_price, remaining, quantity = _widen(list_price, remaining, quantity)
+    price = div_round_half_up(list_price * remaining, 100 * DISCOUNT_SCALE)
+    amount = div_round_half_up(quantity * list_price * remaining, QUANTITY_SCALE * 100 * DISCOUNT_SCALE)
+    return price, amount, has_quantity & has_price
+
+
+def to_rupees(paise, present):
+    """Convert paise back to float rupees for export, NaN where the input was missing"""
+    rupees = np.asarray(paise, dtype=float) / PAISE
+    rupees[~present] = np.nan
+    return rupees
+
+
+def totals_match(amount_paise, total_paise, tax_rates=GST_RATES):
+    """
+    Check computed amounts against extracted, possibly tax-inclusive, totals.
+
+    A total matches when it equals the amount, or the amount plus CGST and SGST
+    at half of one of ``tax_rates`` each, every half rounded to the paisa
+    separately as on the invoice.
+
+    Returns:
+        np.ndarray: bool per item
+    """
+    amount_paise, total_paise = _widen(np.asarray(amount_paise), np.asarray(total_paise))
+    matched = amount_paise == total_paise
+    for rate in tax_rates:
+        half_tax = div_round_half_up(amount_paise * int(rate * DISCOUNT_SCALE), 200 * DISCOUNT_SCALE)
+        matched |= amount_paise + 2 * half_tax == total_paise
+    return np.asarray(matched, dtype=bool)
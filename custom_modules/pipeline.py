@@ -0,0 +1,936 @@
+import cProfile
+import functools
+import heapq
+import os
+import queue
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent import futures
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from custom_modules import invoice_splitter, dataocr, table_extractor, profiling, templates
+from custom_modules.doc_cache import CACHE, summarize
+
+try:
+    import psutil
+except ImportError:  # optional; memory readings fall back to /proc
+    psutil = None
+
+# Marks the end of a stage's output on its queue
+_DONE = object()
+
+# Seconds between checks of the cancel event while the writer waits for an extraction
+_WAIT_SLICE = 0.1
+
+
+class PipelineCancelled(Exception):
+    """Raised by run_pipeline when its cancel event is set before all invoices are written."""
+
+
+def extract_invoice(path, money_mode="float", phases=None, template=None, table_engine="dict"):
+    """
+    Extract header fields and table items for one split invoice.
+    Runs inside the extraction worker processes, so it must stay a top-level function.
+    When ``phases`` is a dict, the time spent in each extraction step is recorded in it.
+    ``template`` is a registered template name (as chosen by the splitter) or None
+    to fingerprint the invoice here. ``table_engine`` is one of
+    table_extractor.TABLE_ENGINES.
+    """
+    started = time.perf_counter()
+    template = templates.resolve(template)
+    if template is None:
+        template = templates.REGISTRY.detect(CACHE.document(path))
+    doc_data = dataocr.extract_invoice_data(path, template)
+    extracted = time.perf_counter()
+    rows = table_extractor.extract_invoice_table(path, template, table_engine)
+    tabled = time.perf_counter()
+    doc_data["items"] = table_extractor.parse_items(rows, money_mode, template)
+
+    if phases is not None:
+        phases["extract_invoice_data"] = extracted - started
+        phases["extract_invoice_table"] = tabled - extracted
+        phases["parse_items"] = time.perf_counter() - tabled
+    return doc_data
+
+
+def _timed_extract(path, extract_options):
+    started = time.perf_counter()
+    with CACHE.track() as cache_counts:
+        doc_data = extract_invoice(path, **extract_options)
+    return doc_data, time.perf_counter() - started, cache_counts
+
+
+def _profiled_extract(path, extract_options, sample_interval):
+    """Extract one invoice under cProfile and the stack sampler; used by --profile runs."""
+    profiler = cProfile.Profile()
+    phases = {}
+    started = time.perf_counter()
+    sampler = profiling.StackSampler(threading.get_ident(), extract_invoice.__code__, sample_interval)
+    with sampler, CACHE.track() as cache_counts:
+        profiler.enable()
+        try:
+            doc_data = extract_invoice(path, phases=phases, **extract_options)
+        finally:
+            profiler.disable()
+    seconds = time.perf_counter() - started
+
+    profiler.create_stats()
+    return doc_data, seconds, {
+        "phases": phases,
+        "stats": profiler.stats,
+        "stacks": dict(sampler.stacks),
+        "cache": cache_counts,
+    }
+
+
+def _extract_page_range(path, template, first_page, last_page, table_engine="dict"):
+    """
+    Scan pages ``first_page`` to ``last_page - 1`` of one split invoice for header
+    fields and table rows, parsing each page once. One job of a chunked extraction.
+    """
+    started = time.perf_counter()
+    template = templates.resolve(template)
+    header = dict.fromkeys(template.header_fields)
+    page_scans = []
+    with CACHE.track() as cache_counts:
+        doc = CACHE.document(path)
+        for page_num in range(first_page, last_page):
+            page_dict = CACHE.page_dict(path, page_num)
+            dataocr.find_header_fields(page_dict["blocks"], template, header)
+            if table_engine == "words":
+                page_scans.append(table_extractor.scan_table_page_words(doc[page_num], page_num, template))
+            else:
+                page_scans.append(table_extractor.scan_table_page(doc[page_num], page_num, template, page_dict))
+    return header, page_scans, time.perf_counter() - started, cache_counts
+
+
+class ChunkedExtraction:
+    """
+    Extraction of one long invoice, split into page-range jobs on the executor.
+
+    Stands in for the future of a single extraction: ``result()`` waits for the
+    jobs and merges them in page order, so header fields are taken from the
+    first page that has them and the table is clipped to its markers across
+    chunks exactly as in a serial extraction. It returns ``(doc_data, seconds,
+    cache_counts)`` with the worker time and document cache counts summed over
+    the jobs. ``timeout`` is waited out by the writer (see ``_wait_result``),
+    which times the invoice out once any of its jobs has run longer than that.
+    """
+
+    def __init__(self, executor, path, page_count, page_chunk, template, money_mode="float", table_engine="dict",
+                 gated=False):
+        self.template = templates.resolve(template)
+        self.money_mode = money_mode
+        self.generation = getattr(executor, "generation", 0)
+        submit = functools.partial(executor.submit, gated=True) if gated else executor.submit
+        self.futures = [
+            submit(
+                _extract_page_range, path, self.template.name, first, min(first + page_chunk, page_count),
+                table_engine,
+            )
+            for first in range(0, page_count, page_chunk)
+        ]
+
+    def result(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        doc_data = dict(self.template.defaults)
+        doc_data.update(dict.fromkeys(self.template.header_fields))
+        page_scans = []
+        seconds = 0.0
+        cache_counts = Counter()
+        for future in self.futures:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            header, scans, job_seconds, job_cache_counts = future.result(remaining)
+            for field, value in header.items():
+                if doc_data[field] is None:
+                    doc_data[field] = value
+            page_scans.extend(scans)
+            seconds += job_seconds
+            cache_counts.update(job_cache_counts)
+
+        rows = table_extractor.clip_table_rows(page_scans)
+        doc_data["items"] = table_extractor.parse_items(rows, self.money_mode, self.template)
+        return doc_data, seconds, cache_counts
+
+    def cancel(self):
+        for future in self.futures:
+            future.cancel()
+
+
+class SerialExecutor(Executor):
+    """Runs every task inline on the submitting thread; useful for debugging and profiling."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+EXECUTORS = {
+    'process': ProcessPoolExecutor,
+    'thread': ThreadPoolExecutor,
+    'serial': lambda max_workers: SerialExecutor(),
+}
+
+
+def _live_processes(executor):
+    """Pids of the running worker processes of ``executor`` (none for non-process executors)"""
+    # ProcessPoolExecutor keeps its workers keyed by pid
+    processes = getattr(executor, "_processes", None) or {}
+    return [pid for pid, process in list(processes.items()) if process.exitcode is None]
+
+
+class WorkerPool:
+    """
+    The extraction executor of a run, replaced when a worker hangs or dies.
+
+    ``restart`` kills the worker processes of a process pool created here and
+    starts a new one; the old pool's futures then fail with BrokenProcessPool or
+    are cancelled. Every submitted future is tagged with the pool ``generation``
+    it was submitted to, so those failures can be told apart from the invoice's
+    own. Executors passed in by the caller, and thread or serial ones, are never
+    restarted.
+
+    Once ``limit`` is set, submissions through ``submit(..., gated=True)`` wait
+    while that many of them are in flight, which lets an AutoScaler change the
+    concurrency without rebuilding the pool. ``recycle`` retires a process pool gracefully:
+    new work goes to a fresh pool while the old one finishes what it has.
+    Once ``stop`` (the run's stop event) is set, or the pool is shut down, waiting
+    submissions return at once with a cancelled future.
+
+    Unfinished futures are kept with the time they were first seen running (see
+    ``overdue``), so a timeout counts from when a job starts, not from when it
+    was queued. A process pool hands a job to its call queue, and reports it
+    running, up to one job before a worker is free for it.
+    """
+
+    def __init__(self, executor, workers, stop=None):
+        self.owned = not isinstance(executor, Executor)
+        self.kind = executor if self.owned else None
+        self.workers = workers
+        self.executor = EXECUTORS[executor](max_workers=workers) if self.owned else executor
+        self.generation = 0
+        self.restarts = 0
+        self.recycles = 0
+        self.abandoned = 0
+        self.stop = stop
+        self.limit = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.tasks = 0
+        self._jobs = set()
+        self._retired = []
+        self._recycle_requested = False
+        self._closed = False
+        self._lock = threading.Lock()
+        self._slots = threading.Condition()
+
+    @property
+    def recyclable(self):
+        return self.owned and self.kind == 'process'
+
+    def idle(self):
+        """True while fewer gated extractions are in flight than may run at once"""
+        return self.in_flight < (self.limit or self.workers)
+
+    def set_limit(self, limit):
+        """Allow ``limit`` gated extractions at once (None: no limit)"""
+        with self._slots:
+            self.limit = None if limit is None else max(1, min(limit, self.workers))
+            self._slots.notify_all()
+
+    def _stopped(self):
+        return self._closed or (self.stop is not None and self.stop.is_set())
+
+    def _acquire_slot(self):
+        """Wait for a free slot; returns False if the run stopped first"""
+        with self._slots:
+            self.waiting += 1
+            while self.limit is not None and self.in_flight >= self.limit and not self._stopped():
+                self._slots.wait(0.1)
+            self.waiting -= 1
+            if self._stopped():
+                return False
+            self.in_flight += 1
+            return True
+
+    def _release_slot(self, future):
+        with self._slots:
+            self.in_flight -= 1
+            self._slots.notify()
+
+    def submit(self, fn, /, *args, gated=False):
+        if gated and not self._acquire_slot():
+            future = Future()
+            future.cancel()
+            future.generation = self.generation
+            return future
+        with self._lock:
+            if self._recycle_requested:
+                self._recycle()
+            try:
+                future = self.executor.submit(fn, *args)
+            except futures.BrokenExecutor as e:
+                # A worker died; fail like the extraction would, and let the writer restart the pool
+                future = Future()
+                future.set_exception(e)
+            self.tasks += 1
+            future.generation = self.generation
+            future.started = None
+            self._jobs.add(future)
+        future.add_done_callback(self._jobs.discard)
+        if gated:
+            future.add_done_callback(self._release_slot)
+        return future
+
+    def overdue(self, timeout):
+        """
+        Unfinished futures that have been running for more than ``timeout``
+        seconds. Also notes the start of futures seen running for the first time,
+        so it is meant to be called every few tenths of a second while waiting.
+        """
+        now = time.monotonic()
+        overdue = []
+        for future in list(self._jobs):
+            if future.started is None:
+                if future.running():
+                    future.started = now
+            elif now - future.started > timeout and not future.done():
+                overdue.append(future)
+        return overdue
+
+    def request_recycle(self):
+        """Recycle the worker processes before the next submission"""
+        if self.recyclable:
+            self._recycle_requested = True
+
+    def _recycle(self):
+        self._recycle_requested = False
+        self._retired = [executor for executor in self._retired if _live_processes(executor)]
+        self._retired.append(self.executor)
+        # Without cancel_futures the old pool still runs everything it was given, then exits
+        self.executor.shutdown(wait=False)
+        self.executor = EXECUTORS[self.kind](max_workers=self.workers)
+        self.tasks = 0
+        self.recycles += 1
+
+    def restart(self):
+        """Returns False if this pool cannot be restarted (its hung tasks are abandoned)"""
+        if not self.recyclable:
+            self.abandoned += 1
+            return False
+        with self._lock:
+            self._terminate_executors()
+            self.executor = EXECUTORS[self.kind](max_workers=self.workers)
+            self.generation += 1
+            self.restarts += 1
+            self.tasks = 0
+        return True
+
+    def _terminate_executors(self):
+        # The hung task may be in a recycled pool that is still finishing
+        for executor in self._retired + [self.executor]:
+            processes = list((executor._processes or {}).values())
+            executor.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                process.terminate()
+        self._retired = []
+
+    def terminate(self):
+        """Stop every worker without waiting for its task, e.g. on cancel; thread workers are abandoned"""
+        if not self.recyclable:
+            self.abandoned += 1
+            return
+        with self._lock:
+            self._terminate_executors()
+
+    def worker_pids(self):
+        """Live worker processes, including those of recycled pools still finishing"""
+        return [pid for executor in self._retired + [self.executor] for pid in _live_processes(executor)]
+
+    def shutdown(self):
+        with self._slots:
+            self._closed = True
+            self._slots.notify_all()
+        # Waiting would block on abandoned tasks that may never finish
+        if self.owned:
+            for executor in self._retired + [self.executor]:
+                executor.shutdown(wait=not self.abandoned, cancel_futures=True)
+
+
+def rss_bytes(pid=None):
+    """Resident memory of a process in bytes (0 if it cannot be read on this platform)."""
+    pid = pid or os.getpid()
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return 0
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def system_memory():
+    """(available, total) system memory in bytes; (0, 0) if it cannot be read on this platform"""
+    if psutil is not None:
+        memory = psutil.virtual_memory()
+        return memory.available, memory.total
+    try:
+        with open("/proc/meminfo") as f:
+            info = {line.split(":")[0]: int(line.split()[1]) * 1024 for line in f}
+        return info["MemAvailable"], info["MemTotal"]
+    except (OSError, ValueError, IndexError, KeyError):
+        return 0, 0
+
+
+class AutoScaler:
+    """
+    Keeps extraction concurrency as high as memory allows.
+
+    Every ``interval`` seconds it looks at system memory and the workers' RSS:
+    below ``memory_reserve`` (fraction of system memory kept free) it lowers the
+    number of concurrent extractions by one, down to ``min_workers``; when
+    extractions are waiting for a slot and there is room for another worker as
+    large as the largest one, it raises it by one, up to the pool's workers.
+    Process pools are recycled after ``recycle_after`` invoices, or as soon as a
+    worker's RSS exceeds ``worker_memory_limit`` bytes, so memory a worker grew
+    to on a huge invoice is given back.
+    """
+
+    def __init__(self, min_workers=1, memory_reserve=0.15, worker_memory_limit=1024 * 2**20,
+                 recycle_after=200, interval=1.0):
+        self.min_workers = min_workers
+        self.memory_reserve = memory_reserve
+        self.worker_memory_limit = worker_memory_limit
+        self.recycle_after = recycle_after
+        self.interval = interval
+
+    def step(self, pool):
+        """Adjust ``pool`` once; returns the concurrency limit now in effect"""
+        if pool.limit is None:
+            pool.set_limit(pool.workers)
+        worker_rss = [rss_bytes(pid) for pid in pool.worker_pids()]
+        largest = max(worker_rss, default=0)
+        if (self.worker_memory_limit and largest > self.worker_memory_limit) or \
+                (self.recycle_after and pool.tasks >= self.recycle_after):
+            pool.request_recycle()
+
+        available, total = system_memory()
+        if not total:
+            return pool.limit
+        headroom = available - self.memory_reserve * total
+        if headroom < 0 and pool.limit > self.min_workers:
+            pool.set_limit(pool.limit - 1)
+            # Idle workers beyond the new limit would otherwise keep their memory
+            pool.request_recycle()
+        elif headroom > 2 * largest and pool.waiting and pool.limit < pool.workers:
+            pool.set_limit(pool.limit + 1)
+        return pool.limit
+
+
+class PipelineStats:
+    """
+    Timings and live metrics collected during a pipeline run.
+
+    ``snapshot()`` may be called from another thread while the run is in
+    progress, e.g. to drive a dashboard.
+    """
+
+    def __init__(self, slowest_count=5):
+        self.timings = defaultdict(list)
+        self.elapsed = 0.0
+        self.started = None
+        self.workers = 0
+        self.invoices = 0
+        self.pages = 0
+        self.items = 0
+        self.cost_sums = defaultdict(Counter)
+        self.peak_memory = 0
+        self.peak_main_memory = 0
+        self.peak_worker_memory = 0
+        self.skipped = 0
+        # Source page after the last invoice split so far
+        self.split_end = 0
+        self.failed = 0
+        self.retried = 0
+        self.slowest_count = slowest_count
+        self.slowest = []
+        self.queues = {}
+        self.executor = None
+        self.cache = Counter()
+
+    def record(self, stage, seconds):
+        self.timings[stage].append(seconds)
+
+    def record_invoice(self, invoice, extract_seconds, items=0):
+        """Count a written invoice and keep it if it is among the slowest so far."""
+        pages = invoice["end_page"] - invoice["start_page"] + 1
+        self.invoices += 1
+        self.pages += pages
+        self.items += items
+        # Least-squares sums of extract_seconds ~ pages, items per template (see estimate.Calibration)
+        self.cost_sums[invoice.get("template")].update(
+            n=1, p=pages, i=items, pp=pages * pages, pi=pages * items, ii=items * items,
+            pt=pages * extract_seconds, it=items * extract_seconds,
+        )
+        entry = (extract_seconds, invoice["index"], invoice)
+        if len(self.slowest) < self.slowest_count:
+            heapq.heappush(self.slowest, entry)
+        elif entry > self.slowest[0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def record_cache(self, counts):
+        """Add the document cache hits and misses of one extraction (from its worker)"""
+        self.cache.update(counts)
+
+    def percentile(self, stage, pct):
+        values = sorted(self.timings.get(stage, ()))
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+    def summary(self):
+        """
+        Returns:
+            dict: {stage: {"count", "total", "mean", "max", "p50", "p95"}} in seconds
+        """
+        return {
+            stage: {
+                "count": len(values),
+                "total": sum(values),
+                "mean": sum(values) / len(values),
+                "max": max(values),
+                "p50": self.percentile(stage, 50),
+                "p95": self.percentile(stage, 95),
+            }
+            for stage, values in list(self.timings.items())
+            if values
+        }
+
+    def worker_pids(self):
+        return self.executor.worker_pids() if self.executor is not None else []
+
+    def sample_memory(self):
+        """RSS of this process plus the workers now; peaks are kept in peak_memory, peak_main_memory
+        and peak_worker_memory (the largest worker)"""
+        main_rss = rss_bytes()
+        worker_rss = [rss_bytes(pid) for pid in self.worker_pids()]
+        total = main_rss + sum(worker_rss)
+        self.peak_memory = max(self.peak_memory, total)
+        self.peak_main_memory = max(self.peak_main_memory, main_rss)
+        self.peak_worker_memory = max([self.peak_worker_memory] + worker_rss)
+        return total
+
+    def snapshot(self):
+        """
+        Current throughput, utilization, queue depths and memory.
+
+        Returns:
+            dict: invoices, pages, elapsed, invoices_per_sec, pages_per_sec,
+            utilization (busy fraction of the extraction workers), worker_limit
+            (concurrent extractions allowed now), recycles, queue_depths,
+            memory_bytes (this process plus workers), stages (see summary),
+            cache (document cache hits and misses of the extractions, see
+            doc_cache.summarize) and slowest [(seconds, invoice), ...], slowest first
+        """
+        elapsed = time.perf_counter() - self.started if self.started else self.elapsed
+        busy = sum(self.timings.get("extract", ()))
+        capacity = elapsed * max(self.workers, 1)
+        return {
+            "invoices": self.invoices,
+            "pages": self.pages,
+            "elapsed": elapsed,
+            "invoices_per_sec": self.invoices / elapsed if elapsed else 0.0,
+            "pages_per_sec": self.pages / elapsed if elapsed else 0.0,
+            "utilization": min(busy / capacity, 1.0) if capacity else 0.0,
+            "worker_limit": (self.executor.limit if self.executor is not None else None) or self.workers,
+            "recycles": self.executor.recycles if self.executor is not None else 0,
+            "queue_depths": {name: q.qsize() for name, q in self.queues.items()},
+            "memory_bytes": self.sample_memory(),
+            "stages": self.summary(),
+            "cache": summarize(self.cache),
+            "slowest": [(seconds, invoice) for seconds, _, invoice in sorted(self.slowest, reverse=True)],
+        }
+
+
+class CostModel:
+    """
+    Expected extraction time of a split invoice, for scheduling: its page count
+    times a per-page cost learned per template from the invoices extracted so
+    far (an exponential moving average with weight ``smoothing``). Templates not
+    seen yet cost the average of those that have been.
+    """
+
+    def __init__(self, per_page=None, smoothing=0.2):
+        self.per_page = dict(per_page or {})
+        self.smoothing = smoothing
+
+    @staticmethod
+    def pages(invoice):
+        return invoice["end_page"] - invoice["start_page"] + 1
+
+    def page_cost(self, template):
+        if template in self.per_page:
+            return self.per_page[template]
+        known = list(self.per_page.values())
+        return sum(known) / len(known) if known else 1.0
+
+    def estimate(self, invoice):
+        return self.pages(invoice) * self.page_cost(invoice.get("template"))
+
+    def record(self, invoice, seconds):
+        """Learn from an invoice that took ``seconds`` to extract"""
+        template = invoice.get("template")
+        observed = seconds / self.pages(invoice)
+        previous = self.per_page.get(template)
+        self.per_page[template] = observed if previous is None else \
+            previous + self.smoothing * (observed - previous)
+
+
+def _put(q, item, stop):
+    """Block on a bounded queue until there is room, giving up if the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _split_stage(input_pdf_path, output_folder, split_q, stop, errors, stats, split_options):
+    try:
+        started = time.perf_counter()
+        for invoice in invoice_splitter.iter_invoices(input_pdf_path, output_folder, **split_options):
+            stats.record("split", time.perf_counter() - started)
+            stats.split_end = invoice["end_page"] + 1
+            if not _put(split_q, invoice, stop):
+                return
+            started = time.perf_counter()
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        _put(split_q, _DONE, stop)
+
+
+def _submit_extraction(pool, invoice, extract_options, profiler, page_chunk, gated=False):
+    """Submit one split invoice's extraction; returns its future (or ChunkedExtraction)"""
+    options = dict(extract_options, template=invoice.get("template"))
+    pages = invoice["end_page"] - invoice["start_page"] + 1
+    if page_chunk and pages > page_chunk and profiler is None and options["template"] is not None:
+        return ChunkedExtraction(
+            pool, invoice["path"], pages, page_chunk, options["template"],
+            options.get("money_mode", "float"), options.get("table_engine", "dict"), gated,
+        )
+    if profiler is not None:
+        return pool.submit(_profiled_extract, invoice["path"], options, profiler.sample_interval, gated=gated)
+    return pool.submit(_timed_extract, invoice["path"], options, gated=gated)
+
+
+def _wait_result(pool, future, timeout, cancel_event):
+    """
+    ``future.result()``, waiting in slices of _WAIT_SLICE seconds and raising
+    PipelineCancelled as soon as ``cancel_event`` is set.
+
+    Raises futures.TimeoutError once one of the future's jobs has been running
+    for more than ``timeout`` seconds; time spent queued behind other jobs does
+    not count. When another invoice's job has overrun instead, the pool is
+    restarted to free its worker: that job is charged when its own turn comes,
+    and this future is lost in the restart and resubmitted by the caller.
+    """
+    waiting = getattr(future, "futures", [future])
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            raise PipelineCancelled("Cancelled while waiting for an extraction")
+        if timeout is not None:
+            overdue = pool.overdue(timeout)
+            if any(job in overdue for job in waiting):
+                raise futures.TimeoutError(f"Extraction ran for more than {timeout:g}s")
+            # Jobs of earlier generations were killed already and are only waiting to fail
+            if pool.recyclable and any(job.generation == pool.generation for job in overdue):
+                pool.restart()
+        _, not_done = futures.wait(waiting, _WAIT_SLICE)
+        if not not_done:
+            return future.result(0)
+
+
+def _await_extraction(pool, invoice, future, resubmit, timeout, retries, stats, cancel_event=None):
+    """
+    Wait for an invoice's extraction, retrying it up to ``retries`` times after
+    an error or after it ran for more than ``timeout`` seconds. Raises
+    PipelineCancelled when ``cancel_event`` is set, without waiting for the
+    extraction.
+
+    A timeout or a dead worker restarts the pool (see WorkerPool.restart), so a
+    hung worker is killed rather than left holding a slot; the attempt is charged
+    to the invoice being waited for. Extractions lost in a restart caused by
+    another invoice are resubmitted without using a retry.
+
+    Returns:
+        tuple: (result, None, attempts) on success, or (None, last error,
+        attempts) once every attempt has failed
+    """
+    attempts = 1
+    while True:
+        try:
+            return _wait_result(pool, future, timeout, cancel_event), None, attempts
+        except PipelineCancelled:
+            future.cancel()
+            raise
+        except Exception as e:
+            error = e
+        if isinstance(error, (futures.BrokenExecutor, futures.CancelledError)) \
+                and future.generation != pool.generation:
+            future = resubmit(invoice)
+            continue
+        if isinstance(error, (futures.TimeoutError, futures.BrokenExecutor)):
+            future.cancel()
+            pool.restart()
+        if attempts > retries:
+            return None, error, attempts
+        attempts += 1
+        stats.retried += 1
+        future = resubmit(invoice)
+
+
+def _extract_stage(pool, split_q, result_q, stop, errors, extract_options, profiler, skip_invoice,
+                   page_chunk, lookahead=0, costs=None):
+    # Invoices in source order as [invoice, future, submitted]; they are queued for
+    # the writer in that order, each once it and every invoice before it is submitted
+    ordered = deque()
+    # Invoices not submitted yet, costliest first (ties in source order)
+    pending = []
+
+    def submit(entry):
+        entry[1] = _submit_extraction(pool, entry[0], extract_options, profiler, page_chunk, gated=True)
+        entry[2] = True
+
+    def queue_submitted():
+        while ordered and ordered[0][2]:
+            invoice, future, _ = ordered[0]
+            if not _put(result_q, (invoice, future), stop):
+                for _, future, _ in ordered:
+                    if future is not None:
+                        future.cancel()
+                return False
+            ordered.popleft()
+        return True
+
+    try:
+        while not stop.is_set():
+            try:
+                # Held-back invoices are submitted as soon as a worker is free
+                invoice = split_q.get(timeout=0.01 if pending else 0.1)
+            except queue.Empty:
+                invoice = None
+            if invoice is _DONE:
+                break
+            if invoice is None:
+                pass
+            elif skip_invoice is not None and skip_invoice(invoice):
+                # Keeps its place in source order but is never extracted or written
+                ordered.append([invoice, None, True])
+            else:
+                entry = [invoice, None, False]
+                ordered.append(entry)
+                cost = costs.estimate(invoice) if costs is not None else 0.0
+                heapq.heappush(pending, (-cost, invoice["index"], entry))
+            while pending and (len(pending) > lookahead or pool.idle()):
+                submit(heapq.heappop(pending)[2])
+            # Bound how long a cheap invoice can hold back the writer
+            if len(ordered) > 2 * lookahead and not ordered[0][2]:
+                pending = [item for item in pending if item[2] is not ordered[0]]
+                heapq.heapify(pending)
+                submit(ordered[0])
+            if not queue_submitted():
+                return
+        while pending and not stop.is_set():
+            submit(heapq.heappop(pending)[2])
+        queue_submitted()
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        _put(result_q, _DONE, stop)
+
+
+def _scale_stage(pool, autoscale, stop):
+    while not stop.wait(autoscale.interval):
+        autoscale.step(pool)
+
+
+def run_pipeline(input_pdf_path, output_folder, sink, workers=None, queue_size=8,
+                 executor='process', on_progress=None, stats=None, extract_options=None,
+                 cancel_event=None, profiler=None, skip_invoice=None, page_chunk=16,
+                 timeout=None, retries=0, quarantine=None, split_options=None, autoscale=None,
+                 lookahead=64, costs=None):
+    """
+    Split, extract and write invoices as a staged pipeline.
+
+    One splitter thread feeds a process pool of extraction workers, whose results
+    are handed to ``sink`` one invoice at a time, in source order, on the calling
+    thread. Queues between the stages are bounded, so a slow sink throttles the
+    extraction and splitting stages instead of letting results pile up in memory.
+
+    Args:
+        input_pdf_path (str): Multi-invoice PDF to process
+        output_folder (str): Folder for the split invoice PDFs
+        sink (callable): ``sink(invoice, doc_data)`` called for every extracted invoice
+        workers (int): Extraction processes (defaults to the CPU count)
+        queue_size (int): Capacity of each inter-stage queue
+        executor (str | Executor): 'process', 'thread', 'serial' or an executor
+            instance owned by the caller (it is not shut down here)
+        on_progress (callable): Optional ``on_progress(done, invoice)`` called after each sink
+        stats (PipelineStats): Optional collector for per-stage timings
+        extract_options (dict): Keyword arguments passed on to ``extract_invoice``
+        split_options (dict): Keyword arguments passed on to
+            ``invoice_splitter.iter_invoices`` (``compact``, ``subset_fonts``)
+        cancel_event (threading.Event): When set, the run stops after the invoice
+            being written, queued extractions are cancelled and PipelineCancelled
+            is raised
+        profiler (profiling.InvoiceProfiler): When given, every extraction and
+            sink call is profiled and collected into it
+        skip_invoice (callable): Optional ``skip_invoice(invoice)``; invoices it
+            returns True for are neither extracted nor passed to ``sink`` and are
+            counted in ``stats.skipped``
+        page_chunk (int): Invoices longer than this many pages are extracted as
+            several page-range jobs of this size, in parallel, and merged in page
+            order (see ChunkedExtraction); None or 0 extracts every invoice in a
+            single job. Not used with ``profiler``.
+        timeout (float): Seconds an invoice's extraction (each job of a chunked
+            one) may run, counted from when it starts rather than from when it
+            was queued. A hung process worker is killed by restarting the pool;
+            thread and serial executors cannot be interrupted and their hung
+            tasks are abandoned. None waits forever.
+        retries (int): Extra attempts for an invoice whose extraction raised or
+            timed out (counted in ``stats.retried``)
+        quarantine (quarantine.Quarantine): When given, invoices that fail every
+            attempt are quarantined there and counted in ``stats.failed`` while the
+            run goes on; otherwise the last error is raised
+        autoscale (AutoScaler): When given, ``workers`` is the most extractions
+            run at once and the AutoScaler moves the actual number between its
+            ``min_workers`` and that as memory allows, recycling process workers
+            as it goes (see ``stats.snapshot()`` worker_limit and recycles)
+        lookahead (int): Split invoices held back so the costliest of them can be
+            submitted first, which keeps a long invoice late in the source from
+            finishing alone at the end of the batch. Results are still written in
+            source order. 0 submits in source order.
+        costs (CostModel): Estimates of each invoice's extraction time used to
+            pick the costliest; learns from this run's extractions (a new one if
+            not given)
+
+    Returns:
+        int: Number of invoices processed (excluding skipped and failed ones)
+    """
+    workers = workers or os.cpu_count() or 1
+    costs = costs if costs is not None else CostModel()
+    stats = stats if stats is not None else PipelineStats()
+    extract_options = extract_options or {}
+    split_options = split_options or {}
+    split_q = queue.Queue(maxsize=queue_size)
+    # Every queued future is already submitted, so this (plus the lookahead) also caps in-flight extractions
+    result_q = queue.Queue(maxsize=max(queue_size, workers))
+    stop = threading.Event()
+    errors = []
+    done = 0
+    run_started = time.perf_counter()
+
+    pool = WorkerPool(executor, workers, stop)
+    if autoscale is not None:
+        pool.set_limit(workers)
+    resubmit = lambda invoice: _submit_extraction(pool, invoice, extract_options, profiler, page_chunk)
+
+    stats.started = run_started
+    stats.workers = workers
+    stats.executor = pool
+    stats.queues = {"split": split_q, "extract": result_q}
+
+    try:
+        threads = [
+            threading.Thread(
+                target=_split_stage,
+                args=(input_pdf_path, output_folder, split_q, stop, errors, stats, split_options),
+                daemon=True,
+            ),
+            threading.Thread(
+                target=_extract_stage,
+                args=(pool, split_q, result_q, stop, errors, extract_options, profiler, skip_invoice,
+                      page_chunk, lookahead, costs),
+                daemon=True,
+            ),
+        ]
+        if autoscale is not None:
+            threads.append(threading.Thread(target=_scale_stage, args=(pool, autoscale, stop), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise PipelineCancelled(f"Cancelled after {done} invoices")
+                try:
+                    entry = result_q.get(timeout=0.1)
+                except queue.Empty:
+                    if stop.is_set():
+                        break
+                    continue
+                if entry is _DONE:
+                    break
+                invoice, future = entry
+                if future is None:
+                    stats.skipped += 1
+                    continue
+                result, error, attempts = _await_extraction(pool, invoice, future, resubmit, timeout, retries, stats,
+                                                            cancel_event)
+                if error is not None:
+                    if quarantine is None:
+                        raise error
+                    quarantine.add(invoice, error, attempts)
+                    stats.failed += 1
+                    continue
+                if profiler is not None:
+                    doc_data, extract_seconds, profile = result
+                    profiler.add_invoice(invoice, extract_seconds, profile)
+                    cache_counts = profile["cache"]
+                else:
+                    doc_data, extract_seconds, cache_counts = result
+                stats.record("extract", extract_seconds)
+                costs.record(invoice, extract_seconds)
+                stats.record_cache(cache_counts)
+                write_started = time.perf_counter()
+                if profiler is not None:
+                    profiler.profile_export(sink, invoice, doc_data)
+                else:
+                    sink(invoice, doc_data)
+                stats.record("write", time.perf_counter() - write_started)
+                stats.record_invoice(invoice, extract_seconds, len(doc_data.get("items", {}).get("items", [])))
+                done += 1
+                if on_progress:
+                    on_progress(done, invoice)
+        except PipelineCancelled:
+            # In-flight extractions may take as long as the timeout; don't wait for them
+            pool.terminate()
+            raise PipelineCancelled(f"Cancelled after {done} invoices") from None
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+    finally:
+        # The workers are at their largest now, just before they exit
+        stats.sample_memory()
+        pool.shutdown()
+        stats.elapsed = time.perf_counter() - run_started
+        stats.started = None
+        stats.executor = None
+
+    if errors:
+        raise errors[0]
+    return done
@@ -0,0 +1,173 @@
+import cProfile
+import heapq
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class StackSampler:
+    """
+    Samples the call stack of one thread at a fixed interval.
+
+    Stacks are kept in collapsed form ("root;caller;callee" -> sample count), the
+    input format of flamegraph.pl, speedscope and similar tools. Only frames
+    below ``root_code`` (the code object of the profiled entry point) are kept.
+    """
+
+    def __init__(self, thread_id, root_code, interval=0.005):
+        self.thread_id = thread_id
+        self.root_code = root_code
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _collapse(self, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            if code is self.root_code:
+                break
+            frame = frame.f_back
+        else:
+            return None
+        return ";".join(reversed(names))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = self._collapse(frame) if frame is not None else None
+            if stack:
+                self.stacks[stack] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+class RawStats:
+    """Lets pstats.Stats load a stats dict that was shipped back from a worker process."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class InvoiceProfiler:
+    """
+    Collects per-invoice profiles from a pipeline run and writes the reports.
+
+    Pass an instance as ``profiler=`` to pipeline.run_pipeline (or
+    exporter.export_invoices); every extraction then runs under cProfile and the
+    stack sampler in its worker, and every sink call is profiled as the
+    "export" phase.
+    """
+
+    def __init__(self, top=10, sample_interval=0.005):
+        self.top = top
+        self.sample_interval = sample_interval
+        self.stats = None
+        self.stacks = Counter()
+        self.phase_totals = Counter()
+        self.cache = Counter()
+        self.invoices = []
+
+    def _add_stats(self, raw_stats):
+        if self.stats is None:
+            self.stats = pstats.Stats(RawStats(raw_stats))
+        else:
+            self.stats.add(RawStats(raw_stats))
+
+    def add_invoice(self, invoice, seconds, profile):
+        self._add_stats(profile["stats"])
+        self.stacks.update(profile["stacks"])
+        self.phase_totals.update(profile["phases"])
+        self.cache.update(profile.get("cache", ()))
+        self.invoices.append({
+            "path": invoice["path"],
+            "start_page": invoice["start_page"] + 1,
+            "end_page": invoice["end_page"] + 1,
+            "seconds": seconds,
+            "phases": profile["phases"],
+        })
+
+    def profile_export(self, fn, *args):
+        """Run a sink call under cProfile and the sampler, attributing it to the last invoice."""
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with StackSampler(threading.get_ident(), self.profile_export.__func__.__code__, self.sample_interval) as sampler:
+            profiler.enable()
+            try:
+                return fn(*args)
+            finally:
+                profiler.disable()
+                seconds = time.perf_counter() - started
+                profiler.create_stats()
+                self._add_stats(profiler.stats)
+                self.stacks.update(sampler.stacks)
+                self.phase_totals["export"] += seconds
+                if self.invoices:
+                    self.invoices[-1]["phases"]["export"] = seconds
+
+    def slowest(self, count=None):
+        """The ``count`` (default ``top``) slowest invoices, slowest first"""
+        return heapq.nlargest(count or self.top, self.invoices, key=lambda entry: entry["seconds"])
+
+    def write_reports(self, output_dir):
+        """
+        Write the aggregated profile to ``output_dir``:
+
+        - profile.pstats: cProfile stats, loadable with pstats or snakeviz
+        - profile.txt: top functions by cumulative and internal time
+        - profile.collapsed: collapsed stacks for flamegraph.pl / speedscope
+        - slowest_invoices.json: top N slowest invoices with page ranges and phase timings
+
+        Returns:
+            dict: {report name: path}
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        paths = {
+            "pstats": os.path.join(output_dir, "profile.pstats"),
+            "text": os.path.join(output_dir, "profile.txt"),
+            "collapsed": os.path.join(output_dir, "profile.collapsed"),
+            "slowest": os.path.join(output_dir, "slowest_invoices.json"),
+        }
+
+        with open(paths["text"], "w", encoding="utf-8") as f:
+            f.write("Phase totals (seconds)\n")
+            for phase, seconds in self.phase_totals.most_common():
+                f.write(f"  {phase:<24}{seconds:10.3f}\n")
+            f.write("\n")
+            if self.cache:
+                f.write("Document cache (extraction workers)\n")
+                for event, count in sorted(self.cache.items()):
+                    f.write(f"  {event:<24}{count:10d}\n")
+                f.write("\n")
+            if self.stats is not None:
+                self.stats.stream = f
+                self.stats.sort_stats("cumulative").print_stats(30)
+                self.stats.sort_stats("tottime").print_stats(30)
+                self.stats.stream = sys.stdout
+        if self.stats is not None:
+            self.stats.dump_stats(paths["pstats"])
+
+        with open(paths["collapsed"], "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        with open(paths["slowest"], "w", encoding="utf-8") as f:
+            json.dump(self.slowest(), f, indent=2)
+
+        return paths
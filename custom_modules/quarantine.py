@@ -0,0 +1,51 @@
+import json
+import os
+import shutil
+import traceback
+
+
+class Quarantine:
+    """
+    Side folder for invoices whose extraction failed.
+
+    Each failed invoice's split PDF is copied into ``folder`` and described in
+    ``folder/errors.json``. The report is rewritten after every failure, so it is
+    complete even if the batch is interrupted later.
+    """
+
+    REPORT = "errors.json"
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.entries = []
+
+    @property
+    def report_path(self):
+        return os.path.join(self.folder, self.REPORT)
+
+    def add(self, invoice, error, attempts):
+        """Quarantine ``invoice`` (as yielded by the splitter) after ``attempts`` failed with ``error``"""
+        os.makedirs(self.folder, exist_ok=True)
+        path = invoice["path"]
+        copied = os.path.join(self.folder, os.path.basename(path))
+        if os.path.exists(path):
+            shutil.copy2(path, copied)
+        else:
+            copied = None
+
+        self.entries.append({
+            "index": invoice["index"],
+            "file": copied,
+            "source_pages": [invoice["start_page"] + 1, invoice["end_page"] + 1],
+            "template": invoice.get("template"),
+            "attempts": attempts,
+            "error": type(error).__name__,
+            "message": str(error),
+            # Worker tracebacks arrive as the __cause__ of the re-raised exception
+            "traceback": "".join(traceback.format_exception(type(error), error, error.__traceback__)),
+        })
+        with open(self.report_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2)
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,357 @@
+import argparse
+import csv
+import glob
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+import pandas as pd
+
+from custom_modules import exporter, pipeline
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (source PDF, golden CSV) pairs checked by default, relative to the project root
+GOLDEN_CASES = [
+    ("pdfs/invoice.pdf", "sample.csv"),
+]
+
+# Split invoices checked one by one against the golden CSV of the PDF they came from
+SPLIT_FIXTURES = ("individual_invoice", "sample.csv")
+
+# p95 seconds per invoice allowed for each pipeline stage
+DEFAULT_BUDGETS = {
+    "split": 0.25,
+    "extract": 1.0,
+    "write": 0.25,
+}
+
+_ITEM_WORDS = ["TVS", "MRF", "TUBE", "TYRE", "FLAP", "VALVE", "LTP", "TEG", "LOOSE", "RIB", "ZOOM",
+               "2.50-16", "3.00-18", "90/90-17", "100/80-18", "NYLON", "RADIAL", "SET", "KIT"]
+_PARTY_WORDS = ["SRI", "LAKSHMI", "AUTOMOBILES", "MOTORS", "TYRES", "AGENCIES", "TRADERS", "GANESH",
+                "BRAHMADEVA", "KRISHNA", "ENTERPRISES"]
+
+
+class CheckResult:
+    """Outcome of one regression check: output differences and blown time budgets."""
+
+    def __init__(self, name):
+        self.name = name
+        self.differences = []
+        self.budget_failures = []
+        self.rows = 0
+        self.elapsed = 0.0
+        self.stage_p95 = {}
+
+    @property
+    def passed(self):
+        return not self.differences and not self.budget_failures
+
+    def report(self):
+        status = "PASS" if self.passed else "FAIL"
+        lines = [f"[{status}] {self.name}: {self.rows} rows in {self.elapsed:.2f}s"]
+        if self.stage_p95:
+            lines.append("    p95 " + ", ".join(f"{stage} {seconds * 1000:.1f}ms"
+                                              for stage, seconds in self.stage_p95.items()))
+        lines.extend(f"    {difference}" for difference in self.differences)
+        lines.extend(f"    {failure}" for failure in self.budget_failures)
+        return "\n".join(lines)
+
+
+def compare_csv(expected_path, actual_path, limit=20):
+    """
+    Diff two export CSVs row by row, comparing cell text exactly.
+
+    Returns:
+        list[str]: One message per differing cell (at most ``limit``, plus a count
+        of the rest) and one for a row count or header mismatch
+    """
+    with open(expected_path, newline="", encoding="utf-8") as f:
+        expected = list(csv.reader(f))
+    with open(actual_path, newline="", encoding="utf-8") as f:
+        actual = list(csv.reader(f))
+
+    if not expected or not actual:
+        return [f"empty output: expected {len(expected)} lines, got {len(actual)}"]
+    if expected[0] != actual[0]:
+        return [f"header differs: expected {expected[0]}, got {actual[0]}"]
+
+    header = expected[0]
+    differences = []
+    for row_number, (expected_row, actual_row) in enumerate(zip(expected[1:], actual[1:]), start=1):
+        for column, expected_value, actual_value in zip(header, expected_row, actual_row):
+            if expected_value != actual_value:
+                differences.append(
+                    f"row {row_number} {column}: expected {expected_value!r}, got {actual_value!r}"
+                )
+
+    hidden = len(differences) - limit
+    differences = differences[:limit]
+    if hidden > 0:
+        differences.append(f"... and {hidden} more differing cells")
+    if len(expected) != len(actual):
+        differences.append(f"row count differs: expected {len(expected) - 1}, got {len(actual) - 1}")
+    return differences
+
+
+def check_budgets(result, stats, budgets):
+    """Record each stage's p95 on ``result`` and a failure for every stage over budget"""
+    for stage, budget in budgets.items():
+        p95 = stats.percentile(stage, 95)
+        result.stage_p95[stage] = p95
+        if p95 > budget:
+            result.budget_failures.append(
+                f"{stage} p95 {p95 * 1000:.1f}ms exceeds budget {budget * 1000:.1f}ms"
+            )
+
+
+def run_export(pdf_path, output_csv, work_dir, workers=None, money_mode="float"):
+    """
+    Run the full pipeline over ``pdf_path`` into a CSV.
+
+    Returns:
+        tuple: (PipelineStats, number of rows written)
+    """
+    stats = pipeline.PipelineStats()
+    writer = exporter.get_writer("csv", output_csv, money_mode=money_mode)
+    exporter.export_invoices(pdf_path, os.path.join(work_dir, "split"), writer, workers=workers, stats=stats)
+    return stats, writer.rows_written
+
+
+def check_golden(pdf_path, golden_csv, work_dir, workers=None, budgets=DEFAULT_BUDGETS, update=False):
+    """Export ``pdf_path`` through the pipeline and diff the CSV against ``golden_csv``"""
+    result = CheckResult(f"golden {os.path.basename(pdf_path)} -> {os.path.basename(golden_csv)}")
+    output_csv = os.path.join(work_dir, "golden_output.csv")
+
+    started = time.perf_counter()
+    stats, result.rows = run_export(pdf_path, output_csv, work_dir, workers)
+    result.elapsed = time.perf_counter() - started
+
+    if update:
+        shutil.copyfile(output_csv, golden_csv)
+    result.differences = compare_csv(golden_csv, output_csv)
+    check_budgets(result, stats, budgets)
+    return result
+
+
+def _invoice_number(path):
+    match = re.search(r"_(\d+)\.pdf$", path)
+    return int(match.group(1)) if match else 0
+
+
+def check_split_fixtures(folder, golden_csv, work_dir):
+    """
+    Extract already-split invoice PDFs one by one, in invoice order, and diff the
+    combined rows against ``golden_csv``. Exercises extraction without the splitter.
+    """
+    result = CheckResult(f"split fixtures {os.path.basename(folder)} -> {os.path.basename(golden_csv)}")
+    paths = sorted(glob.glob(os.path.join(folder, "*.pdf")), key=_invoice_number)
+    output_csv = os.path.join(work_dir, "fixtures_output.csv")
+
+    started = time.perf_counter()
+    docs = [pipeline.extract_invoice(path) for path in paths]
+    frame = exporter.rows_frame(docs)
+    frame.to_csv(output_csv, index=False)
+    result.elapsed = time.perf_counter() - started
+    result.rows = len(frame)
+
+    result.differences = compare_csv(golden_csv, output_csv)
+    return result
+
+
+def _draw_invoice(page, doc):
+    """Draw one invoice in the Tally layout the default template expects"""
+    def text(x, y, value, bold=False):
+        page.insert_text((x, y), value, fontname="hebo" if bold else "helv", fontsize=8)
+
+    text(275, 36, "Tax Invoice", bold=True)
+    text(330, 57, "Invoice No.")
+    text(330, 67, doc["VCH/BILL_NO"], bold=True)
+    text(483, 57, "Dated")
+    text(483, 67, doc["VCH/BILL_DATE"], bold=True)
+    text(37, 155, "Consignee")
+    text(37, 165, doc["PARTY_NAME"], bold=True)
+
+    text(37, 305, "S.No.", bold=True)
+    text(65, 305, "Description of Goods", bold=True)
+    text(330, 305, "Quantity", bold=True)
+
+    y = 330
+    for number, item in enumerate(doc["items"]["items"], start=1):
+        # MuPDF keeps a row in one wide block only if its first line is drawn
+        # before the wrapped lines below it
+        text(37, y, f"{number}.")
+        text(65, y, item["name_lines"][0], bold=True)
+        text(247, y, item["hsna"])
+        text(330, y, f"{item['Qnty']:.2f} {item['unit']}.")
+        text(381, y, item["price_text"])
+        text(420, y, f"{item['unit']}.")
+        if item["discount"]:
+            text(483, y, f"{item['discount']:g} %")
+        text(525, y, f"{item['total']:,.2f}")
+        for offset, name_line in enumerate(item["name_lines"][1:], start=1):
+            text(65, y + 11 * offset, name_line, bold=True)
+        text(330, y + 11, f"({item['Qnty']:.2f} {item['unit']}.)")
+        y += 30
+
+    text(37, y + 10, "Amount Chargable(in words)")
+    text(330, y + 60, "Authorised Signatory")
+    text(330, y + 70, doc["dealer"], bold=True)
+    text(246, y + 100, "This is a Computer Generated Invoice")
+
+
+def make_synthetic_invoices(pdf_path, count=20, seed=0):
+    """
+    Write ``count`` generated single-page invoices into one PDF.
+
+    Returns:
+        list[dict]: The ground-truth invoice data, shaped like pipeline.extract_invoice output
+    """
+    rng = random.Random(seed)
+    docs = []
+    with fitz.open() as pdf:
+        for number in range(1, count + 1):
+            items = []
+            for _ in range(rng.randint(1, 12)):
+                name_lines = [" ".join(rng.choices(_ITEM_WORDS, k=rng.randint(2, 5)))]
+                if rng.random() < 0.2:
+                    name_lines.append(" ".join(rng.choices(_ITEM_WORDS, k=2)))
+                paise = rng.randint(100, 99999)
+                price_text = str(paise // 100) if paise % 100 == 0 else f"{paise / 100:.2f}"
+                quantity = float(rng.randint(1, 60))
+                discount = rng.choice([0, 0, 2, 5, 6, 7.5, 10])
+                amount = round(quantity * paise / 100 * (1 - discount / 100), 2)
+                items.append({
+                    "name_lines": name_lines,
+                    "items": " ".join(name_lines),
+                    "hsna": str(rng.randint(40000000, 40199999)),
+                    "Qnty": quantity,
+                    "price": float(price_text),
+                    "price_text": price_text,
+                    "unit": rng.choice(["Pcs", "Nos", "Set"]),
+                    "discount": float(discount),
+                    "total": round(amount * 1.18, 2),
+                })
+            docs.append({
+                "VCH_SERIES": "Main",
+                "SALE/PURC_TYPE": "L/GST-ItemWise",
+                "MC_NAME": "Main Store",
+                "VCH/BILL_NO": f"SYN-{seed}/{number}",
+                "VCH/BILL_DATE": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025",
+                "PARTY_NAME": " ".join(rng.sample(_PARTY_WORDS, 2)),
+                "dealer": "Synthetic Motors",
+                "items": {"items": items},
+            })
+            _draw_invoice(pdf.new_page(width=595, height=842), docs[-1])
+        pdf.save(pdf_path)
+    return docs
+
+
+def reference_rows(docs):
+    """
+    Expected export rows for ground-truth docs, computed one item at a time with
+    Python's round() so vectorized transforms are checked against the scalar rules.
+    """
+    rows = []
+    for doc_data in docs:
+        for position, item in enumerate(doc_data["items"]["items"]):
+            discount = item["discount"] or 0
+            price_after_discount = item["price"] - item["price"] * (discount / 100)
+            row = {column: doc_data[column] if position == 0 else "" for column in exporter.HEADER_COLUMNS}
+            row.update({
+                "ITEM_NAME": item["items"],
+                "QUANTITY": item["Qnty"],
+                "UNIT": item["unit"],
+                "PRICE": round(price_after_discount, 2),
+                "DISCOUNT_PERCENT": discount if discount else "",
+                "LIST_PRICE_ALT_UNIT": item["price"],
+                "LIST_PRICE": item["price"],
+                "AMOUNT": round(item["Qnty"] * price_after_discount, 2),
+            })
+            rows.append(row)
+    return pd.DataFrame(rows, columns=exporter.COLUMN_ORDER)
+
+
+def check_synthetic(work_dir, count=20, seed=0, workers=None, budgets=DEFAULT_BUDGETS):
+    """Generate invoices with known contents, export them and diff against the expected rows"""
+    result = CheckResult(f"synthetic {count} invoices (seed {seed})")
+    pdf_path = os.path.join(work_dir, "synthetic.pdf")
+    expected_csv = os.path.join(work_dir, "synthetic_expected.csv")
+    output_csv = os.path.join(work_dir, "synthetic_output.csv")
+
+    docs = make_synthetic_invoices(pdf_path, count, seed)
+    reference_rows(docs).to_csv(expected_csv, index=False)
+
+    started = time.perf_counter()
+    stats, result.rows = run_export(pdf_path, output_csv, work_dir, workers)
+    result.elapsed = time.perf_counter() - started
+
+    result.differences = compare_csv(expected_csv, output_csv)
+    check_budgets(result, stats, budgets)
+    return result
+
+
+def run_suite(golden_cases=GOLDEN_CASES, split_fixtures=SPLIT_FIXTURES, synthetic=20, seed=0,
+              workers=None, budgets=DEFAULT_BUDGETS, update=False, root=PROJECT_ROOT):
+    """
+    Run every regression check.
+
+    Returns:
+        list[CheckResult]
+    """
+    results = []
+    with tempfile.TemporaryDirectory(prefix="invoice-regression-") as work_dir:
+        for index, (pdf_path, golden_csv) in enumerate(golden_cases):
+            case_dir = os.path.join(work_dir, f"golden_{index}")
+            os.makedirs(case_dir)
+            results.append(check_golden(
+                os.path.join(root, pdf_path), os.path.join(root, golden_csv), case_dir,
+                workers=workers, budgets=budgets, update=update,
+            ))
+        if split_fixtures:
+            folder, golden_csv = split_fixtures
+            results.append(check_split_fixtures(
+                os.path.join(root, folder), os.path.join(root, golden_csv), work_dir
+            ))
+        if synthetic:
+            results.append(check_synthetic(work_dir, synthetic, seed, workers, budgets))
+    return results
+
+
+def _parse_budget(value):
+    stage, _, seconds = value.partition("=")
+    if stage not in DEFAULT_BUDGETS or not seconds:
+        raise argparse.ArgumentTypeError(f"expected STAGE=SECONDS with STAGE in {sorted(DEFAULT_BUDGETS)}")
+    return stage, float(seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check extraction output against golden CSVs and time budgets")
+    parser.add_argument("--synthetic", type=int, default=20, help="Number of generated invoices (0 to skip)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the generated invoices")
+    parser.add_argument("--workers", type=int, default=None, help="Extraction processes (default: CPU count)")
+    parser.add_argument("--budget", type=_parse_budget, action="append", default=[], metavar="STAGE=SECONDS",
+                        help="Override a stage's p95 budget per invoice, e.g. extract=0.5")
+    parser.add_argument("--no-budgets", action="store_true", help="Only check output, not timings")
+    parser.add_argument("--update-golden", action="store_true",
+                        help="Overwrite the golden CSVs with the current output (after an intended change)")
+    args = parser.parse_args(argv)
+
+    budgets = {} if args.no_budgets else dict(DEFAULT_BUDGETS, **dict(args.budget))
+    results = run_suite(synthetic=args.synthetic, seed=args.seed, workers=args.workers,
+                        budgets=budgets, update=args.update_golden)
+    for result in results:
+        print(result.report())
+
+    failed = sum(not result.passed for result in results)
+    print(f"\n{len(results) - failed} passed, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import bisect
+import math
+
+import numpy as np
+import pandas as pd
+
+from custom_modules.exporter import COLUMN_ORDER
+
+# Columns that can be searched through the index
+SEARCH_COLUMNS = ("VCH/BILL_NO", "PARTY_NAME")
+
+
+def _normalize(value):
+    """Search form of a header value: whitespace collapsed and case folded, as dedup.invoice_key does"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return " ".join(str(value).split()).casefold()
+
+
+def display_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return str(value)
+
+
+class ResultBuffer:
+    """
+    Exported rows of a run held in memory for browsing, with an invoice index.
+
+    Rows are kept as the DataFrames the writer flushed (columnar, in export
+    column order) and only turned into display strings for the rows asked for,
+    so a million-row run costs the frames and not a million row tuples. Every
+    invoice is recorded with its first row and row count, and its bill number
+    and party name are kept normalized like dedup keys: an exact value is looked
+    up in a dict, a partial one is matched against the column of keys with
+    pandas' vectorized string methods rather than by scanning the rows.
+
+    Feed it by setting ``writer.results``; the writer adds every batch it flushes.
+    """
+
+    def __init__(self):
+        self._frames = []
+        self._frame = None
+        self.rows = 0
+        self.invoice_starts = []
+        self.invoice_rows = []
+        self.index = {column: {} for column in SEARCH_COLUMNS}
+        # Normalized key of every invoice per column ("" if it has none), as a Series once searched
+        self._keys = {column: [] for column in SEARCH_COLUMNS}
+        self._key_series = {}
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def invoices(self):
+        return len(self.invoice_starts)
+
+    def add(self, frame, docs):
+        """Add a flushed batch: its rows and the extracted invoices they came from (one row per item)"""
+        for doc_data in docs:
+            invoice = len(self.invoice_starts)
+            count = len(doc_data.get("items", {}).get("items", []))
+            self.invoice_starts.append(self.rows)
+            self.invoice_rows.append(count)
+            self.rows += count
+            for column in SEARCH_COLUMNS:
+                key = _normalize(doc_data.get(column))
+                self._keys[column].append(key)
+                if key:
+                    self.index[column].setdefault(key, []).append(invoice)
+        self._frames.append(frame)
+        self._frame = None
+        self._key_series = {}
+
+    @property
+    def frame(self):
+        """Every row, as one DataFrame (concatenated on first use after an ``add``)"""
+        if self._frame is None:
+            if len(self._frames) > 1:
+                self._frames = [pd.concat(self._frames, ignore_index=True)]
+            self._frame = self._frames[0] if self._frames else pd.DataFrame(columns=COLUMN_ORDER)
+        return self._frame
+
+    def search(self, query, columns=SEARCH_COLUMNS):
+        """
+        Invoices whose indexed ``columns`` contain ``query`` (normalized), in row order.
+        An exact value is a single dict lookup; otherwise the column of keys is
+        matched as a whole with ``str.contains``.
+        """
+        query = _normalize(query)
+        invoices = set()
+        for column in columns:
+            index = self.index[column]
+            if query in index:
+                invoices.update(index[query])
+            else:
+                keys = self._key_series.get(column)
+                if keys is None:
+                    keys = self._key_series[column] = pd.Series(self._keys[column], dtype=object)
+                matches = keys.str.contains(query, regex=False).to_numpy(dtype=bool)
+                if not query:
+                    matches &= keys.to_numpy() != ""
+                invoices.update(np.flatnonzero(matches).tolist())
+        return sorted(invoices)
+
+    def view(self, invoices=None):
+        """A ResultView of every row, or of the rows of ``invoices`` (as from ``search``)"""
+        return ResultView(self, invoices)
+
+
+class ResultView:
+    """The rows of a ResultBuffer, or of some of its invoices, addressed by position"""
+
+    def __init__(self, buffer, invoices=None):
+        self.buffer = buffer
+        if invoices is None:
+            self.ranges = [(0, len(buffer))]
+        else:
+            self.ranges = [(buffer.invoice_starts[i], buffer.invoice_rows[i])
+                           for i in invoices if buffer.invoice_rows[i]]
+        # Position of the first row of each range in the view, for bisecting
+        self.offsets = []
+        total = 0
+        for _, count in self.ranges:
+            self.offsets.append(total)
+            total += count
+        self.rows = total
+        self.invoices = len(buffer.invoice_starts) if invoices is None else len(invoices)
+
+    def __len__(self):
+        return self.rows
+
+    def rows_at(self, first, count):
+        """Display strings of rows ``first`` to ``first + count`` of the view, one list per row"""
+        frame = self.buffer.frame
+        rows = []
+        position = first
+        end = min(first + count, self.rows)
+        while position < end:
+            r = bisect.bisect_right(self.offsets, position) - 1
+            start, length = self.ranges[r]
+            row = start + position - self.offsets[r]
+            take = min(end - position, start + length - row)
+            for values in frame.iloc[row:row + take].itertuples(index=False):
+                rows.append([display_value(value) for value in values])
+            position += take
+        return rows
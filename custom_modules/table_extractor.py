@@ -1,219 +1,267 @@
 import fitz  # PyMuPDF
 import json
+from decimal import Decimal
 
-def extract_invoice_table(pdf_path):
+from custom_modules import templates
+from custom_modules.doc_cache import CACHE
+
+# Table row extraction engines:
+#   dict  - full get_text("dict") tree per page (shared with header extraction via the cache)
+#   words - get_text("blocks") and get_text("words") tuples from one TextPage
+TABLE_ENGINES = ("dict", "words")
+
+def scan_table_page(page, page_num, template, page_dict=None):
     """
-    Extract table data between start and end markers.
-    Table rows are wide blocks (>80% page width).
-    Returns detailed information about blocks, lines, text, and coordinates.
+    Scan one page for the table markers and for candidate table rows.
+
+    Candidate rows are wide blocks (>80% page width by default) that are not
+    skipped by the template, wherever they are on the page; clip_table_rows
+    keeps the ones between the markers once every page has been scanned.
+
+    Returns:
+        dict: {"page", "height", "start_y", "end_y", "rows": [(block top y, row)]}
+        where start_y is the bottom of the first start-marker block and end_y the
+        top of the first end-marker block on this page (None if absent)
     """
-    doc = fitz.open(pdf_path)
-    
-    table_start = "S.No."
-    table_end = "Amount Chargable(in words)"
-    
-    all_table_rows = []
-    
-    # First, find which page has the start and end markers
-    start_page = None
-    end_page = None
-    start_y = None
-    end_y = None
-    
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        blocks = page.get_text("dict")["blocks"]
-        
-        for block in blocks:
-            if "lines" in block:
-                block_text = ""
-                for line in block["lines"]:
-                    for span in line["spans"]:
-                        block_text += span["text"]
-                
-                if table_start in block_text and start_page is None:
-                    start_page = page_num
-                    start_y = block["bbox"][3]  # Bottom of start block
-                    
-                if table_end in block_text and end_page is None:
-                    end_page = page_num
-                    end_y = block["bbox"][1]  # Top of end block
-    
+    if page_dict is None:
+        page_dict = page.get_text("dict")
+    page_width = page.rect.width
+    scan = {"page": page_num, "height": page.rect.height, "start_y": None, "end_y": None, "rows": []}
+
+    for block in page_dict["blocks"]:
+        if "lines" not in block:
+            continue
+        block_text = ""
+        for line in block["lines"]:
+            for span in line["spans"]:
+                block_text += span["text"]
+
+        if template.table_start in block_text and scan["start_y"] is None:
+            scan["start_y"] = block["bbox"][3]  # Bottom of start block
+        if template.table_end in block_text and scan["end_y"] is None:
+            scan["end_y"] = block["bbox"][1]  # Top of end block
+
+        # Check if block is wide enough (>80% page width)
+        block_width = block["bbox"][2] - block["bbox"][0]
+        if (block_width / page_width) <= template.row_min_width:
+            continue
+
+        # Extract complete text from block
+        row_text = ""
+        for line in block["lines"]:
+            for span in line["spans"]:
+                row_text += span["text"] + " "
+        row_text = row_text.strip()
+
+        if row_text and not any(skip in row_text for skip in template.skip_rows):
+            # Extract detailed line data
+            lines_data = []
+            for line in block["lines"]:
+                line_text = ""
+                for span in line["spans"]:
+                    line_text += span["text"]
+
+                lines_data.append({
+                    "text": line_text.strip(),
+                    "bbox": line["bbox"],
+                    "x0": line["bbox"][0],
+                    "y0": line["bbox"][1],
+                    "x1": line["bbox"][2],
+                    "y1": line["bbox"][3]
+                })
+
+            scan["rows"].append((block["bbox"][1], {
+                "page": page_num + 1,
+                "lines": lines_data
+            }))
+
+    return scan
+
+
+def scan_table_page_words(page, page_num, template):
+    """
+    Words-mode variant of scan_table_page, returning the same scan.
+
+    Markers and candidate rows are found from the page's text blocks, then the
+    words inside the candidate rows' rectangle are grouped into lines by their
+    block and line numbers. No span dicts are built, and the row lines carry only
+    the "text", "x0", "y0", "x1" and "y1" that parse_items needs.
+    """
+    textpage = page.get_textpage()
+    page_width = page.rect.width
+    scan = {"page": page_num, "height": page.rect.height, "start_y": None, "end_y": None, "rows": []}
+
+    # {block number: (block top y, [[line number, words, x0, y0, x1, y1], ...])}
+    candidates = {}
+    clip = fitz.Rect()
+    for x0, y0, x1, y1, text, block_num, block_type in page.get_text("blocks", textpage=textpage):
+        if block_type != 0:
+            continue
+        # Block text without line breaks, as the dict engine concatenates spans
+        block_text = text.replace("\n", "")
+        if template.table_start in block_text and scan["start_y"] is None:
+            scan["start_y"] = y1
+        if template.table_end in block_text and scan["end_y"] is None:
+            scan["end_y"] = y0
+
+        if (x1 - x0) / page_width <= template.row_min_width:
+            continue
+        row_text = text.replace("\n", " ").strip()
+        if row_text and not any(skip in row_text for skip in template.skip_rows):
+            candidates[block_num] = (y0, [])
+            clip |= (x0, y0, x1, y1)
+
+    if not candidates:
+        return scan
+
+    for x0, y0, x1, y1, word, block_num, line_num, _ in page.get_text("words", textpage=textpage, clip=clip):
+        if block_num not in candidates:
+            continue
+        lines = candidates[block_num][1]
+        if lines and lines[-1][0] == line_num:
+            line = lines[-1]
+            line[1].append(word)
+            line[4] = max(line[4], x1)
+            line[5] = max(line[5], y1)
+        else:
+            lines.append([line_num, [word], x0, y0, x1, y1])
+
+    for block_y, lines in candidates.values():
+        scan["rows"].append((block_y, {
+            "page": page_num + 1,
+            "lines": [
+                {"text": " ".join(words), "x0": x0, "y0": y0, "x1": x1, "y1": y1}
+                for _, words, x0, y0, x1, y1 in lines
+            ]
+        }))
+
+    return scan
+
+
+def clip_table_rows(page_scans):
+    """
+    Keep the candidate rows that lie between the table markers.
+
+    ``page_scans`` (from scan_table_page) must cover the invoice's pages in
+    page order; they may come from separate workers. The first start and end
+    markers across all pages bound the table: rows on the start page must be
+    below the start marker, rows on the end page above the end marker, and
+    pages in between are taken whole.
+    """
+    start_page = end_page = start_y = end_y = None
+    for scan in page_scans:
+        if start_page is None and scan["start_y"] is not None:
+            start_page, start_y = scan["page"], scan["start_y"]
+        if end_page is None and scan["end_y"] is not None:
+            end_page, end_y = scan["page"], scan["end_y"]
+
     # If we didn't find start marker, return empty
+    all_table_rows = []
     if start_page is None:
-        doc.close()
         return all_table_rows
-    
-    # Process pages based on start and end positions
-    for page_num in range(start_page, len(doc)):
+
+    for scan in page_scans:
+        page_num = scan["page"]
+        if page_num < start_page:
+            continue
         # Stop if we've passed the end page
         if end_page is not None and page_num > end_page:
             break
-            
-        page = doc[page_num]
-        page_width = page.rect.width
-        page_height = page.rect.height
-        
-        # Get text blocks
-        blocks = page.get_text("dict")["blocks"]
-        
+
         # Determine extraction range for this page
-        if page_num == start_page and page_num == end_page:
-            # Start and end on same page
-            range_start = start_y
-            range_end = end_y
-        elif page_num == start_page:
-            # First page: from start marker to bottom of page
-            range_start = start_y
-            range_end = page_height
-        elif page_num == end_page:
-            # Last page: from top of page to end marker
-            range_start = 0
-            range_end = end_y
-        else:
-            # Middle pages: entire page
-            range_start = 0
-            range_end = page_height
-        
-        # Extract table rows (wide blocks in range)
-        for block in blocks:
-            if "lines" not in block:
-                continue
-            
-            block_y = block["bbox"][1]  # Top of block
-            block_width = block["bbox"][2] - block["bbox"][0]
-            
-            # Check if block is in range
-            in_range = range_start < block_y < range_end
-            
-            # Check if block is wide enough (>80% page width)
-            is_wide = (block_width / page_width) > 0.8
-            
-            if in_range and is_wide:
-                # Extract complete text from block
-                row_text = ""
-                for line in block["lines"]:
-                    for span in line["spans"]:
-                        row_text += span["text"] + " "
-                
-                row_text = row_text.strip()
-                
-                if "Rounded Off (-)" not in row_text and row_text:
-                    # Extract detailed line data
-                    lines_data = []
-                    for line in block["lines"]:
-                        line_text = ""
-                        for span in line["spans"]:
-                            line_text += span["text"]
-                        
-                        lines_data.append({
-                            "text": line_text.strip(),
-                            "bbox": line["bbox"],
-                            "x0": line["bbox"][0],
-                            "y0": line["bbox"][1],
-                            "x1": line["bbox"][2],
-                            "y1": line["bbox"][3]
-                        })
-                    
-                    all_table_rows.append({
-                        "page": page_num + 1,
-                        "lines": lines_data
-                    })
+        range_start = start_y if page_num == start_page else 0
+        range_end = end_y if page_num == end_page else scan["height"]
+
+        for block_y, row in scan["rows"]:
+            if range_start < block_y < range_end:
+                all_table_rows.append(row)
+
+    return all_table_rows
+
+
+def extract_invoice_table(pdf_path, template=None, engine="dict"):
+    """
+    Extract table data between start and end markers.
+    Table rows are wide blocks (>80% page width by default).
+    Returns detailed information about blocks, lines, text, and coordinates.
+    Markers, row width and skipped rows come from ``template`` (an
+    InvoiceTemplate or name), picked from the first page when None.
+    ``engine`` is one of TABLE_ENGINES; both give the same parse_items output.
+    """
+    doc = CACHE.document(pdf_path)
+    
+    template = templates.resolve(template) or templates.REGISTRY.detect(doc)
+    if engine == "words":
+        page_scans = [scan_table_page_words(doc[page_num], page_num, template) for page_num in range(len(doc))]
+    elif engine == "dict":
+        page_scans = [
+            scan_table_page(doc[page_num], page_num, template, CACHE.page_dict(pdf_path, page_num))
+            for page_num in range(len(doc))
+        ]
+    else:
+        raise ValueError(f"Unknown table engine: {engine}")
     
-    doc.close()
     # print(all_table_rows)
-    return all_table_rows
+    return clip_table_rows(page_scans)
 
 
-def parse_items(table_rows):
+def parse_items(table_rows, money_mode="float", template=None):
     """
     Parse table rows into structured item data based on x0 coordinates.
-    Range increased to 8px for each field.
+    Column x0 ranges and value kinds come from ``template`` (default: the
+    registry default), see templates.COLUMN_KINDS.
+    With money_mode="exact", numbers are parsed as Decimal instead of float.
     """
+    template = templates.resolve(template) or templates.REGISTRY.default
+    number = Decimal if money_mode == "exact" else float
     items = []
     
     for row in table_rows:
-        item = {
-            "sno": None,
-            "items": None,
-            "hsna": None,
-            "Qnty": None,
-            "price": None,
-            "unit": None,
-            "discount": None,
-            "total": None
-        }
+        item = dict.fromkeys(template.fields)
         
-        # Collect all Quantity candidates (for finding the one with least y0)
-        quantity_candidates = []
-        name_candidates = []
+        # Columns that collect every line (topmost wins / wrapped text is joined)
+        candidates = {}
         
         for line in row["lines"]:
-            x0 = line["x0"]
-            y0 = line["y0"]
+            column = template.column_at(line["x0"])
+            if column is None:
+                continue
+            field, kind = column
             text = line["text"]
             
-            # S.No (x0 between 31-42, center: 36.5, range: 8px)
-            if 31 <= x0 <= 42:
-                item["sno"] = text
-            
-            # Description of Goods (x0 between 61-69, center: 65, range: 8px)
-            elif 61 <= x0 <= 69:
-                # item["items"] = text
-                name_candidates.append(text)
-            
-            # HSN/SAC (x0 between 241-251, center: 246, range: 8px)
-            elif 241 <= x0 <= 251:
-                item["hsna"] = text
-            
-            # Quantity (x0 between 325-333, center: 329, range: 8px) - collect all candidates
-            elif 325 <= x0 <= 333:
-                quantity_candidates.append({"text": text, "y0": y0})
-            
-            # Rate (x0 between 377-385, center: 381, range: 8px)
-            elif 377 <= x0 <= 385:
-                item["price"] = text
-                price = float(item['price'])
-                item['price'] = price
-            
-            # Per (x0 between 415-423, center: 419, range: 8px)
-            elif 415 <= x0 <= 423:
-                item["unit"] = text.replace(".", "")
-            
-            # Discount percentage (x0 between 478-486, center: 482, range: 8px)
-            elif 470 <= x0 <= 486:
-                item["discount"] = text
-                discount = float(item['discount'].split(" ")[0])
-                item['discount'] = discount
-            
-            # Amount (x0 between 521-529, center: 525, range: 8px)
-            elif 510 <= x0 <= 599:
-                item["total"] = text
-                total = float(item['total'].replace(",", ""))
-                item['total'] = total
-        
-        # Select Quantity with least y0 (topmost)
-        if quantity_candidates:
-            quantity_candidates.sort(key=lambda x: x["y0"])
-            item["Qnty"] = quantity_candidates[0]["text"]
-            qnty = float(item['Qnty'].split(" ")[0])
-            item['Qnty'] = qnty
+            if kind == "text":
+                item[field] = text
+            elif kind == "unit":
+                item[field] = text.replace(".", "")
+            elif kind == "number":
+                item[field] = number(text)
+            elif kind == "amount":
+                item[field] = number(text.replace(",", ""))
+            elif kind == "first_number":
+                item[field] = number(text.split(" ")[0])
+            else:
+                candidates.setdefault(field, []).append((line["y0"], text))
         
-        if name_candidates:
-            name = " ".join(name_candidates)
-            item["items"] = name
-
-
+        for field, lines in candidates.items():
+            if template.column_kind(field) == "join":
+                item[field] = " ".join(text for _, text in lines)
+            else:
+                # Select the line with least y0 (topmost)
+                text = min(lines, key=lambda line: line[0])[1]
+                item[field] = number(text.split(" ")[0])
         
         items.append(item)
     
     return {"items": items}
 
-def process_items(pdf_path):
+def process_items(pdf_path, money_mode="float", template=None, engine="dict"):
+    template = templates.resolve(template)
+    if template is None:
+        template = templates.REGISTRY.detect(CACHE.document(pdf_path))
     # Extract table rows
-    rows = extract_invoice_table(pdf_path)
+    rows = extract_invoice_table(pdf_path, template, engine)
     # Parse into structured JSON
-    result = parse_items(rows)
+    result = parse_items(rows, money_mode, template)
     return result
 
 
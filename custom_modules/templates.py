@@ -0,0 +1,229 @@
+import bisect
+import glob
+import json
+import os
+import re
+
+# Folder scanned for extra supplier templates (*.json) when the module is imported
+TEMPLATES_DIR = os.environ.get(
+    "INVOICE_TEMPLATES_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates"),
+)
+
+# How a column's text is turned into a value by table_extractor.parse_items:
+#   text          - stripped text as-is
+#   join          - all lines in the column joined with spaces (wrapped descriptions)
+#   unit          - text with "." removed
+#   number        - the whole text as a number
+#   amount        - number with thousands separators removed
+#   first_number  - number from the first space-separated token ("6 %", "25 Pcs")
+#   topmost_first_number - like first_number, using the topmost line in the column
+COLUMN_KINDS = ("text", "join", "unit", "number", "amount", "first_number", "topmost_first_number")
+
+
+class InvoiceTemplate:
+    """
+    Layout rules for one supplier's invoice format.
+
+    Args:
+        name (str): Unique template name
+        fingerprint (list[str]): Strings that must all appear on an invoice's first page
+        invoice_start, invoice_end (str): Page markers used to split a multi-invoice PDF
+        table_start, table_end (str): Markers bounding the items table
+        header_fields (dict): {field: keyword}; the bold text of the block containing
+            the keyword becomes the field value
+        defaults (dict): Fixed header values (voucher series, sale type, ...)
+        columns (list): [field, x0_min, x0_max, kind] per table column
+        row_min_width (float): Minimum block width, as a fraction of the page, for table rows
+        skip_rows (list[str]): Table rows containing any of these strings are dropped
+    """
+
+    def __init__(self, name, fingerprint, invoice_start, invoice_end, table_start, table_end,
+                 header_fields, defaults, columns, row_min_width=0.8, skip_rows=()):
+        self.name = name
+        self.fingerprint = list(fingerprint)
+        self.invoice_start = invoice_start
+        self.invoice_end = invoice_end
+        self.table_start = table_start
+        self.table_end = table_end
+        self.header_fields = dict(header_fields)
+        self.defaults = dict(defaults)
+        self.columns = [tuple(column) for column in columns]
+        self.row_min_width = row_min_width
+        self.skip_rows = list(skip_rows)
+        self.compile()
+
+    def compile(self):
+        """Precompute the matchers used on every block and line."""
+        for field, x_min, x_max, kind in self.columns:
+            if kind not in COLUMN_KINDS:
+                raise ValueError(f"Template '{self.name}': unknown kind '{kind}' for column '{field}'")
+        if not self.header_fields:
+            raise ValueError(f"Template '{self.name}': header_fields is empty")
+        for field, keyword in self.header_fields.items():
+            if not keyword:
+                raise ValueError(f"Template '{self.name}': empty keyword for header field '{field}'")
+
+        # Zero-width lookahead so overlapping keywords are all found in one scan
+        keywords = sorted(set(self.header_fields.values()), key=len, reverse=True)
+        self._keyword_pattern = re.compile("(?=(" + "|".join(map(re.escape, keywords)) + "))")
+        # The scan reports the longest keyword starting at each position, so a match
+        # also implies every keyword contained in it
+        self._fields_by_keyword = {keyword: [] for keyword in keywords}
+        for keyword in keywords:
+            for field, other in self.header_fields.items():
+                if other in keyword:
+                    self._fields_by_keyword[keyword].append(field)
+
+        ordered = sorted(self.columns, key=lambda column: column[1])
+        self._column_starts = [column[1] for column in ordered]
+        self._ordered_columns = ordered
+        self.fields = [column[0] for column in self.columns]
+        self._kinds = {column[0]: column[3] for column in self.columns}
+
+    def header_fields_in(self, text):
+        """Header fields whose keyword occurs in ``text``"""
+        fields = set()
+        for keyword in {match.group(1) for match in self._keyword_pattern.finditer(text)}:
+            fields.update(self._fields_by_keyword[keyword])
+        return fields
+
+    def column_at(self, x0):
+        """
+        Returns:
+            tuple: (field, kind) for the column whose x0 range contains ``x0``, or None
+        """
+        index = bisect.bisect_right(self._column_starts, x0) - 1
+        if index < 0:
+            return None
+        field, x_min, x_max, kind = self._ordered_columns[index]
+        return (field, kind) if x0 <= x_max else None
+
+    def column_kind(self, field):
+        return self._kinds[field]
+
+    def matches(self, first_page_text):
+        return all(marker in first_page_text for marker in self.fingerprint)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "fingerprint": self.fingerprint,
+            "invoice_start": self.invoice_start,
+            "invoice_end": self.invoice_end,
+            "table_start": self.table_start,
+            "table_end": self.table_end,
+            "header_fields": self.header_fields,
+            "defaults": self.defaults,
+            "columns": [list(column) for column in self.columns],
+            "row_min_width": self.row_min_width,
+            "skip_rows": self.skip_rows,
+        }
+
+
+# The Tally-style layout this project was written for
+TALLY = InvoiceTemplate(
+    name="tally",
+    fingerprint=["Tax Invoice"],
+    invoice_start="Tax Invoice",
+    invoice_end="This is a Computer Generated Invoice",
+    table_start="S.No.",
+    table_end="Amount Chargable(in words)",
+    header_fields={
+        'VCH/BILL_NO': 'Invoice No.',
+        'VCH/BILL_DATE': 'Dated',
+        'PARTY_NAME': 'Consignee',
+        'dealer': 'Authorised Signatory'
+    },
+    defaults={
+        'VCH_SERIES': 'Main',
+        'SALE/PURC_TYPE': 'L/GST-ItemWise',
+        'MC_NAME': 'Main Store',
+    },
+    columns=[
+        ["sno", 31, 42, "text"],                     # S.No (center: 36.5)
+        ["items", 61, 69, "join"],                   # Description of Goods (center: 65)
+        ["hsna", 241, 251, "text"],                  # HSN/SAC (center: 246)
+        ["Qnty", 325, 333, "topmost_first_number"],  # Quantity (center: 329)
+        ["price", 377, 385, "number"],               # Rate (center: 381)
+        ["unit", 415, 423, "unit"],                  # Per (center: 419)
+        ["discount", 470, 486, "first_number"],      # Discount percentage (center: 482)
+        ["total", 510, 599, "amount"],               # Amount (center: 525)
+    ],
+    row_min_width=0.8,
+    skip_rows=["Rounded Off (-)"],
+)
+
+
+class TemplateRegistry:
+    """
+    Compiled supplier templates, matched per invoice by a first-page fingerprint.
+
+    Templates with more fingerprint markers are tried first, so a specific
+    supplier layout wins over a generic one; ``default`` is used when none match.
+    """
+
+    def __init__(self, templates=(), default=None):
+        self._templates = {}
+        self._ordered = []
+        self.default = default
+        for template in templates:
+            self.register(template)
+
+    def register(self, template):
+        self._templates[template.name] = template
+        self._ordered = sorted(self._templates.values(), key=lambda t: len(t.fingerprint), reverse=True)
+        if self.default is None:
+            self.default = template
+        return template
+
+    def get(self, name=None):
+        if name is None:
+            return self.default
+        try:
+            return self._templates[name]
+        except KeyError:
+            raise KeyError(f"Unknown invoice template: {name}") from None
+
+    def match(self, first_page_text):
+        """The most specific template whose fingerprint occurs in ``first_page_text``"""
+        for template in self._ordered:
+            if template.matches(first_page_text):
+                return template
+        return self.default
+
+    def detect(self, doc):
+        """Pick the template for an open fitz document from its first page"""
+        if doc.page_count == 0:
+            return self.default
+        return self.match(doc[0].get_text("text"))
+
+    def load_directory(self, directory):
+        """Register every ``*.json`` template in ``directory``; returns how many were loaded."""
+        paths = sorted(glob.glob(os.path.join(directory, "*.json")))
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                self.register(InvoiceTemplate.from_dict(json.load(f)))
+        return len(paths)
+
+    def __iter__(self):
+        return iter(self._ordered)
+
+    def __len__(self):
+        return len(self._templates)
+
+
+REGISTRY = TemplateRegistry([TALLY], default=TALLY)
+if os.path.isdir(TEMPLATES_DIR):
+    REGISTRY.load_directory(TEMPLATES_DIR)
+
+
+def resolve(template):
+    """Accept a template, a template name or None (fingerprint later) and return a template or None."""
+    if template is None or isinstance(template, InvoiceTemplate):
+        return template
+    return REGISTRY.get(template)
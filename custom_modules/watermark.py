@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from custom_modules.doc_cache import CACHE
+
+def prefix_fingerprint(pdf_path, pages, start=0, fingerprint=""):
+    """
+    Running SHA-1 of the text of the first ``pages`` pages of a PDF: each page's
+    digest covers the digest before it and the page's text, so every page of the
+    prefix counts. Given the ``fingerprint`` of the first ``start`` pages, only
+    the pages after them are read, which is how a mark is extended as its source
+    grows. None if the PDF has fewer than ``pages`` pages.
+    """
+    doc = CACHE.document(pdf_path)
+    if pages > doc.page_count:
+        return None
+    for page_num in range(start, pages):
+        digest = hashlib.sha1(f"{fingerprint}\x00".encode())
+        digest.update(doc.load_page(page_num).get_text("text").encode("utf-8"))
+        fingerprint = digest.hexdigest()
+    return fingerprint
+
+
+class HighWaterMarks:
+    """
+    Persistent record of how far each source PDF has been split and exported.
+
+    For every source the mark is the page after the last complete invoice of a
+    finished run, with a fingerprint of the pages before it. A later run over a
+    source that only grew resumes at its mark, so pages of an invoice that was
+    still open (started but not ended) are scanned again, and only new invoices
+    are extracted. A source whose prefix changed starts over from page 0.
+    Checking a mark reads its whole prefix; advancing it only reads the new pages.
+
+    Marks are kept in a JSON file, rewritten atomically on every ``advance``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.marks = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.marks = json.load(f)
+
+    @classmethod
+    def for_output(cls, output_file):
+        """The marks kept next to an export file, ``<output_file>.hwm``"""
+        return cls(f"{output_file}.hwm")
+
+    @staticmethod
+    def _key(pdf_path):
+        return os.path.abspath(pdf_path)
+
+    def resume_page(self, pdf_path):
+        """
+        First page to scan in ``pdf_path``: its mark if the prefix is unchanged, else 0.
+        Verifying the prefix reads the text of every page up to the mark, so the
+        cost of a call grows with the size of the prefix already processed.
+        """
+        mark = self.marks.get(self._key(pdf_path))
+        if not mark or not mark["pages"]:
+            return 0
+        if prefix_fingerprint(pdf_path, mark["pages"]) != mark["fingerprint"]:
+            del self.marks[self._key(pdf_path)]
+            return 0
+        return mark["pages"]
+
+    def advance(self, pdf_path, pages, invoices=0):
+        """Record that the first ``pages`` pages of ``pdf_path`` are done (``invoices`` more exported)"""
+        key = self._key(pdf_path)
+        previous = self.marks.get(key) or {}
+        if previous.get("fingerprint") and previous["pages"] <= pages:
+            # Checked by resume_page at the start of the run: extend it over the new pages
+            fingerprint = prefix_fingerprint(pdf_path, pages, previous["pages"], previous["fingerprint"])
+        else:
+            fingerprint = prefix_fingerprint(pdf_path, pages)
+        self.marks[key] = {
+            "pages": pages,
+            "fingerprint": fingerprint if pages else None,
+            "invoices": previous.get("invoices", 0) + invoices,
+            "updated": datetime.now().isoformat(timespec="seconds"),
+        }
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.marks, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        """Forget every mark, e.g. when the export file is overwritten"""
+        self.marks = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,26 @@
+import gzip
+
+import pandas as pd
+import pytest
+
+from custom_modules import exporter
+
+
+def test_compressed_csv_gets_its_suffix(tmp_path):
+    writer = exporter.get_writer("csv", str(tmp_path / "out.csv"), compression="gzip")
+    assert writer.output_file == str(tmp_path / "out.csv.gz")
+    with writer:
+        pass
+    with gzip.open(writer.output_file, "rt", encoding="utf-8") as f:
+        assert f.readline().rstrip("\n").split(",") == exporter.COLUMN_ORDER
+    assert list(pd.read_csv(writer.output_file).columns) == exporter.COLUMN_ORDER
+
+    named = exporter.output_filename(str(tmp_path / "out"), "csv", "gzip")
+    assert exporter.get_writer("csv", named, compression="gzip").output_file == named
+
+
+def test_mismatched_compression_suffix_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="named for gzip"):
+        exporter.get_writer("csv", str(tmp_path / "out.csv.gz"))
+    with pytest.raises(ValueError, match="named for zstd"):
+        exporter.get_writer("csv", str(tmp_path / "out.csv.zst"), compression="gzip")
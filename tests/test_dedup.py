@@ -0,0 +1,43 @@
+from custom_modules.dedup import DedupIndex, invoice_key
+
+DOC = {"VCH/BILL_NO": "25-26/52", "PARTY_NAME": "Brahmadeva  Automobiles", "VCH/BILL_DATE": "07/04/2025"}
+OTHER = dict(DOC, **{"VCH/BILL_NO": "25-26/53"})
+
+
+def test_invoice_key_is_normalized():
+    assert invoice_key(DOC) == invoice_key(dict(DOC, PARTY_NAME=" BRAHMADEVA automobiles "))
+    assert invoice_key(dict(DOC, PARTY_NAME=None)) is None
+
+
+def test_commit_persists_entries(tmp_path):
+    index = DedupIndex(str(tmp_path / "out.csv.dedup"))
+    index.add(DOC, "hash-1")
+    index.commit()
+    reloaded = DedupIndex(index.path)
+    assert reloaded.contains(DOC)
+    assert reloaded.contains_content("hash-1")
+
+
+def test_rollback_forgets_uncommitted_entries(tmp_path):
+    index = DedupIndex(str(tmp_path / "out.csv.dedup"))
+    index.add(DOC, "hash-1")
+    index.commit()
+    index.add(OTHER, "hash-2")
+    assert index.contains(OTHER)
+    index.rollback()
+    assert not index.contains(OTHER)
+    assert not index.contains_content("hash-2")
+    assert index.contains(DOC)
+    assert not DedupIndex(index.path).contains(OTHER)
+
+
+def test_commit_up_to_mark(tmp_path):
+    index = DedupIndex(str(tmp_path / "out.csv.dedup"))
+    index.add(DOC)
+    mark = index.mark()
+    index.add(OTHER)
+    index.commit(mark)
+    index.rollback()
+    assert index.contains(DOC)
+    assert not index.contains(OTHER)
+    assert len(DedupIndex(index.path)) == 1
@@ -0,0 +1,27 @@
+import os
+
+from custom_modules.doc_cache import _DOCUMENT_BYTES, DocumentCache, page_dict_size
+from custom_modules.regression import PROJECT_ROOT
+
+SOURCE = os.path.join(PROJECT_ROOT, "pdfs", "invoice.pdf")
+
+
+def test_a_document_is_charged_a_fixed_cost_not_its_file_size():
+    cache = DocumentCache()
+    first = cache.page_dict(SOURCE, 0)
+    assert cache.bytes == _DOCUMENT_BYTES + page_dict_size(first)
+
+    cache = DocumentCache(max_bytes=cache.bytes)
+    first = cache.page_dict(SOURCE, 0)
+    assert cache.page_dict(SOURCE, 0) is first
+    stats = cache.stats()
+    assert stats["evictions"] == 0
+    assert stats["page_hits"] == 1
+
+
+def test_a_page_inserted_meanwhile_is_kept():
+    cache = DocumentCache()
+    key = ("page",) + cache._document_key(SOURCE) + (0,)
+    kept = cache._put(key, {"blocks": []}, 10)
+    assert cache._put(key, {"blocks": []}, 10) is kept
+    assert cache.bytes == 10
@@ -0,0 +1,79 @@
+import time
+
+from custom_modules import jobstore, pipeline
+from custom_modules.jobstore import JobStore
+
+
+def make_store(tmp_path, jobs=1, max_attempts=3):
+    store = JobStore(str(tmp_path / "jobs.sqlite"), max_attempts=max_attempts)
+    store.create_batch("batch", "source.pdf")
+    for index in range(jobs):
+        store.enqueue("batch", {"index": index, "path": f"invoice_{index + 1}.pdf"})
+    store.finish_split("batch")
+    return store
+
+
+def test_expired_lease_is_leased_again(tmp_path):
+    store = make_store(tmp_path)
+    job = store.lease("worker-a", lease_seconds=0.05)
+    assert job["attempts"] == 1
+    assert store.lease("worker-b") is None
+
+    time.sleep(0.1)
+    retaken = store.lease("worker-b", lease_seconds=60)
+    assert retaken["id"] == job["id"]
+    assert retaken["attempts"] == 2
+    # The first worker lost its lease, so its result is discarded
+    assert not store.complete(job["id"], "worker-a", {"items": {"items": []}})
+    assert not store.heartbeat(job["id"], "worker-a")
+    assert store.complete(retaken["id"], "worker-b", {"items": {"items": []}})
+    assert store.counts("batch")[jobstore.DONE] == 1
+
+
+def test_lease_expiring_too_often_fails_the_job(tmp_path):
+    store = make_store(tmp_path, max_attempts=2)
+    for _ in range(2):
+        assert store.lease("worker-a", lease_seconds=0.01) is not None
+        time.sleep(0.05)
+    assert store.lease("worker-a") is None
+    failures = store.failures("batch")
+    assert len(failures) == 1
+    assert "lease expired" in failures[0]["error"]
+    assert store.pending("batch") == 0
+
+
+def test_failed_attempt_is_queued_again(tmp_path):
+    store = make_store(tmp_path, max_attempts=2)
+    job = store.lease("worker-a")
+    assert store.fail(job["id"], "worker-a", "boom")
+    assert store.counts("batch")[jobstore.QUEUED] == 1
+    job = store.lease("worker-a")
+    assert store.fail(job["id"], "worker-a", "boom again")
+    assert store.counts("batch")[jobstore.FAILED] == 1
+    assert store.failures("batch")[0]["error"] == "boom again"
+
+
+def hang(path, **options):
+    time.sleep(60)
+
+
+def extract_path(path, **options):
+    return {"path": path, "items": {"items": []}}
+
+
+def test_hung_extraction_is_killed_and_fails(tmp_path, monkeypatch):
+    # Worker children are forked, so they see the patched function
+    monkeypatch.setattr(pipeline, "extract_invoice", hang)
+    store = make_store(tmp_path, max_attempts=1)
+    started = time.monotonic()
+    assert jobstore.run_worker(store, lease_seconds=60, poll_interval=0.05, job_timeout=0.5) == 0
+    assert time.monotonic() - started < 10
+    (failure,) = store.failures("batch")
+    assert "ran for more than 0.5s" in failure["error"]
+
+
+def test_extractions_run_in_a_child_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "extract_invoice", extract_path)
+    store = make_store(tmp_path, jobs=2)
+    assert jobstore.run_worker(store, poll_interval=0.05, job_timeout=30) == 2
+    assert [doc_data["path"] for _, doc_data in store.results("batch")] == ["invoice_1.pdf", "invoice_2.pdf"]
@@ -0,0 +1,41 @@
+import glob
+import json
+import os
+
+import pytest
+
+from custom_modules import exporter, pipeline
+from custom_modules.regression import PROJECT_ROOT, _invoice_number
+
+# Extracted values that export rows do not carry
+ROW_MISSING = {"dealer", "sno", "hsna", "total"}
+
+
+@pytest.fixture(scope="module")
+def docs():
+    paths = sorted(glob.glob(os.path.join(PROJECT_ROOT, "individual_invoice", "*.pdf")), key=_invoice_number)
+    return [pipeline.extract_invoice(path) for path in paths]
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_rows_and_invoices_give_the_same_documents(docs, tmp_path):
+    streamed_path = str(tmp_path / "streamed.jsonl")
+    with exporter.get_writer("jsonl", streamed_path) as writer:
+        writer.write(docs)
+    rows = exporter.rows_frame(docs).values.tolist()
+    exporter.export_data(rows, str(tmp_path / "rows.jsonl"), "jsonl")
+
+    streamed = read_jsonl(streamed_path)
+    from_rows = read_jsonl(str(tmp_path / "rows.jsonl"))
+    assert len(from_rows) == len(streamed) == len(docs)
+    for expected, actual in zip(streamed, from_rows):
+        expected = {key: None if key in ROW_MISSING else value for key, value in expected.items()}
+        expected["items"] = [
+            {key: None if key in ROW_MISSING else value for key, value in item.items()}
+            for item in expected["items"]
+        ]
+        assert actual == expected
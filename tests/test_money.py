@@ -0,0 +1,49 @@
+from decimal import Decimal
+
+import numpy as np
+
+from custom_modules import exporter, money
+
+
+def test_to_fixed_floats():
+    fixed, present = money.to_fixed([1.25, None, float("nan"), 97.76], money.PAISE)
+    assert fixed.tolist() == [125, 0, 0, 9776]
+    assert present.tolist() == [True, False, False, True]
+
+
+def test_to_fixed_decimals_are_scaled_exactly():
+    fixed, present = money.to_fixed([Decimal("1.005"), Decimal("0.1"), None, 2.5], money.PAISE)
+    # 1.005 rounds half-up to 101 paise; as a float it is 1.00499... and would give 100
+    assert fixed.tolist() == [101, 10, 0, 250]
+    assert present.tolist() == [True, True, False, True]
+
+
+def test_to_fixed_large_decimals_use_python_ints():
+    fixed, present = money.to_fixed([Decimal("123456789012345678901")], money.PAISE)
+    assert fixed.dtype == object
+    assert fixed[0] == 12345678901234567890100
+    assert present.all()
+
+
+def test_exact_amounts():
+    price, amount, present = money.exact_amounts([25.0, 3.0, None], [104.0, 10.0, 5.0], [6.0, None, None])
+    assert price.tolist()[:2] == [9776, 1000]
+    assert amount.tolist()[:2] == [244400, 3000]
+    assert present.tolist() == [True, True, False]
+
+
+def test_totals_match_with_gst():
+    amount = np.array([244400, 244400, 244400, 1000])
+    # 18% GST as 9% CGST + 9% SGST, each rounded to the paisa
+    total = np.array([244400, 288392, 288393, 1050])
+    assert money.totals_match(amount, total).tolist() == [True, True, False, True]
+
+
+def test_exact_rows_scale_decimals_without_floats():
+    headers = {column: [""] for column in exporter.HEADER_COLUMNS}
+    frame = exporter.transform_columns([2], headers, ["a", "b"], [Decimal("1"), Decimal("3")], ["pcs", "pcs"],
+                                       [Decimal("1.005"), Decimal("10.005")], [None, Decimal("0")],
+                                       money_mode="exact")
+    # As floats 1.005 and 10.005 sit just below the half paisa and would round down to 1.00 and 10.00
+    assert frame["PRICE"].tolist() == [1.01, 10.01]
+    assert frame["AMOUNT"].tolist() == [1.01, 30.03]
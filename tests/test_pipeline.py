@@ -0,0 +1,72 @@
+import json
+import os
+import time
+
+import pytest
+
+from custom_modules import exporter, pipeline
+from custom_modules.quarantine import Quarantine
+from custom_modules.regression import PROJECT_ROOT
+
+SOURCE = os.path.join(PROJECT_ROOT, "pdfs", "invoice.pdf")
+
+
+def test_failing_invoices_are_retried_and_quarantined(tmp_path, monkeypatch):
+    extract_invoice = pipeline.extract_invoice
+    transient = []
+
+    def flaky(path, *args, **kwargs):
+        number = int(path.rsplit("_", 1)[1].split(".")[0])
+        if number == 3:
+            raise ValueError("could not convert string to float: 'abc'")
+        if number == 7 and not transient:
+            transient.append(path)
+            raise RuntimeError("transient")
+        return extract_invoice(path, *args, **kwargs)
+
+    # Thread workers see the patched function
+    monkeypatch.setattr(pipeline, "extract_invoice", flaky)
+    quarantine = Quarantine(str(tmp_path / "quarantine"))
+    stats = pipeline.PipelineStats()
+    writer = exporter.get_writer("csv", str(tmp_path / "out.csv"))
+    done = exporter.export_invoices(SOURCE, str(tmp_path / "split"), writer, workers=2, executor="thread",
+                                    stats=stats, retries=1, quarantine=quarantine, page_chunk=0)
+
+    assert done == 12
+    assert stats.failed == 1
+    assert stats.retried == 2
+    with open(quarantine.report_path, encoding="utf-8") as f:
+        (entry,) = json.load(f)
+    assert entry["index"] == 2
+    assert entry["attempts"] == 2
+    assert entry["error"] == "ValueError"
+    assert os.path.exists(entry["file"])
+
+
+def test_failure_without_quarantine_aborts(tmp_path, monkeypatch):
+    def broken(path, *args, **kwargs):
+        raise ValueError("broken")
+
+    monkeypatch.setattr(pipeline, "extract_invoice", broken)
+    writer = exporter.get_writer("csv", str(tmp_path / "out.csv"))
+    with pytest.raises(ValueError, match="broken"):
+        exporter.export_invoices(SOURCE, str(tmp_path / "split"), writer, workers=1, executor="thread",
+                                 page_chunk=0)
+
+
+def test_timeout_counts_from_when_an_extraction_starts(tmp_path, monkeypatch):
+    extract_invoice = pipeline.extract_invoice
+
+    def slow(path, *args, **kwargs):
+        time.sleep(0.15)
+        return extract_invoice(path, *args, **kwargs)
+
+    # Forked process workers see the patched function; with one worker, most
+    # invoices wait in the queue for longer than the timeout before they start
+    monkeypatch.setattr(pipeline, "extract_invoice", slow)
+    stats = pipeline.PipelineStats()
+    writer = exporter.get_writer("csv", str(tmp_path / "out.csv"))
+    done = exporter.export_invoices(SOURCE, str(tmp_path / "split"), writer, workers=1, executor="process",
+                                    stats=stats, timeout=0.5, retries=1, page_chunk=0)
+    assert done == 13
+    assert stats.retried == 0
@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+from custom_modules import regression
+
+
+@pytest.mark.parametrize("pdf_path, golden_csv", regression.GOLDEN_CASES)
+def test_golden(pdf_path, golden_csv, tmp_path):
+    result = regression.check_golden(
+        os.path.join(regression.PROJECT_ROOT, pdf_path), os.path.join(regression.PROJECT_ROOT, golden_csv),
+        str(tmp_path),
+    )
+    assert result.passed, result.report()
+
+
+def test_split_fixtures(tmp_path):
+    folder, golden_csv = regression.SPLIT_FIXTURES
+    result = regression.check_split_fixtures(
+        os.path.join(regression.PROJECT_ROOT, folder), os.path.join(regression.PROJECT_ROOT, golden_csv),
+        str(tmp_path),
+    )
+    assert result.passed, result.report()
+
+
+def test_synthetic(tmp_path):
+    result = regression.check_synthetic(str(tmp_path))
+    assert result.passed, result.report()
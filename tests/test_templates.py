@@ -0,0 +1,17 @@
+import pytest
+
+from custom_modules.templates import TALLY, InvoiceTemplate
+
+
+def test_header_fields_are_found_by_keyword():
+    assert TALLY.header_fields_in("Invoice No. 42 Dated 1-Apr-24") == {"VCH/BILL_NO", "VCH/BILL_DATE"}
+
+
+@pytest.mark.parametrize("header_fields, message", [
+    ({}, "header_fields is empty"),
+    ({"VCH/BILL_NO": ""}, "empty keyword for header field 'VCH/BILL_NO'"),
+])
+def test_template_without_header_keywords_is_rejected(header_fields, message):
+    data = dict(TALLY.to_dict(), name="broken", header_fields=header_fields)
+    with pytest.raises(ValueError, match=message):
+        InvoiceTemplate.from_dict(data)
@@ -0,0 +1,68 @@
+import os
+
+import fitz
+
+from custom_modules import exporter
+from custom_modules.regression import PROJECT_ROOT
+from custom_modules.watermark import HighWaterMarks
+
+
+def make_pdf(path, texts):
+    with fitz.open() as pdf:
+        for text in texts:
+            pdf.new_page().insert_text((72, 72), text)
+        pdf.save(path)
+
+
+def test_resume_after_append(tmp_path):
+    source = str(tmp_path / "source.pdf")
+    make_pdf(source, ["page one", "page two", "page three"])
+    marks = HighWaterMarks.for_output(str(tmp_path / "out.csv"))
+    marks.advance(source, 2, invoices=1)
+
+    make_pdf(source, ["page one", "page two", "page three", "page four"])
+    reloaded = HighWaterMarks(marks.path)
+    assert reloaded.resume_page(source) == 2
+    reloaded.advance(source, 4, invoices=2)
+    assert HighWaterMarks(marks.path).resume_page(source) == 4
+    assert HighWaterMarks(marks.path).marks[reloaded._key(source)]["invoices"] == 3
+
+
+def test_changed_prefix_starts_over(tmp_path):
+    source = str(tmp_path / "source.pdf")
+    make_pdf(source, ["page one", "page two", "page three"])
+    marks = HighWaterMarks.for_output(str(tmp_path / "out.csv"))
+    marks.advance(source, 3)
+
+    make_pdf(source, ["page one", "page 2 was edited", "page three", "page four"])
+    assert marks.resume_page(source) == 0
+    assert not marks.marks
+
+
+def test_shrunk_source_starts_over(tmp_path):
+    source = str(tmp_path / "source.pdf")
+    make_pdf(source, ["page one", "page two", "page three"])
+    marks = HighWaterMarks.for_output(str(tmp_path / "out.csv"))
+    marks.advance(source, 3)
+
+    make_pdf(source, ["page one"])
+    assert marks.resume_page(source) == 0
+
+
+def test_export_uses_the_resume_page_it_is_given(tmp_path, monkeypatch):
+    source = os.path.join(PROJECT_ROOT, "pdfs", "invoice.pdf")
+    output = str(tmp_path / "out.csv")
+    marks = HighWaterMarks.for_output(output)
+    exporter.export_invoices(source, str(tmp_path / "split"), exporter.get_writer("csv", output),
+                             workers=1, executor="thread", page_chunk=0, watermarks=marks)
+    first_page = marks.resume_page(source)
+    assert first_page
+
+    def verify_again(pdf_path):
+        raise AssertionError("the prefix was verified twice")
+
+    monkeypatch.setattr(marks, "resume_page", verify_again)
+    done = exporter.export_invoices(source, str(tmp_path / "split"),
+                                    exporter.get_writer("csv", output, mode="append"), workers=1,
+                                    executor="thread", page_chunk=0, watermarks=marks, first_page=first_page)
+    assert done == 0
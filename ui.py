@@ -1,10 +1,21 @@
-import pandas as pd
-from custom_modules import invoice_splitter, dataocr, table_extractor
+from custom_modules import invoice_splitter, exporter, pipeline, dedup
+from custom_modules.quarantine import Quarantine
+from custom_modules.results import ResultBuffer
 import os
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from pathlib import Path
 import threading
+import queue
+
+# How often the Tk main loop drains the worker's progress queue
+PROGRESS_POLL_MS = 100
+
+# Delay between the last keystroke in the results search box and the search
+SEARCH_DELAY_MS = 250
+
+# Rows the results grid moves per mouse wheel notch
+WHEEL_ROWS = 3
 
 class RoundedButton(tk.Canvas):
     def __init__(self, parent, text, command, bg_color, hover_color, text_color="white", width=100, height=36, corner_radius=6):
@@ -87,6 +98,136 @@ class RoundedEntry(tk.Frame):
     def on_focus_out(self, event):
         self.config(bg=self.border_color)
 
+class ResultsWindow(tk.Toplevel):
+    """
+    Browses the rows of a run (a results.ResultBuffer) in a virtualized Treeview.
+
+    The tree only ever holds the rows that fit on screen; scrolling refills them
+    from the buffer, so opening a million-row run is as quick as a small one.
+    The search box filters by bill number or party name through the buffer's
+    index and shows every row of the matching invoices.
+    """
+
+    SEARCH_FIELDS = {"Bill no. or party": ("VCH/BILL_NO", "PARTY_NAME"),
+                     "Bill no.": ("VCH/BILL_NO",), "Party": ("PARTY_NAME",)}
+
+    def __init__(self, app, buffer, title):
+        super().__init__(app.root)
+        self.title(title)
+        self.geometry("1100x600")
+        self.configure(bg=app.bg_dark)
+        self.buffer = buffer
+        self.view = buffer.view()
+        self.first = 0
+        self.visible = 0
+        self._search_job = None
+
+        self.query = tk.StringVar()
+        self.field = tk.StringVar(value=next(iter(self.SEARCH_FIELDS)))
+        self.query.trace_add("write", lambda *_: self.schedule_search())
+
+        search_frame = tk.Frame(self, bg=app.bg_dark)
+        search_frame.pack(fill=tk.X, padx=15, pady=10)
+        tk.Label(search_frame, text="Search", font=("Segoe UI", 10, "bold"),
+                 bg=app.bg_dark, fg=app.text_color).pack(side=tk.LEFT, padx=(0, 8))
+        entry = tk.Entry(search_frame, textvariable=self.query, font=("Segoe UI", 10), width=40,
+                         bg=app.bg_light, fg=app.text_color, insertbackground=app.text_color, relief=tk.FLAT)
+        entry.pack(side=tk.LEFT, ipady=4)
+        field = ttk.Combobox(search_frame, textvariable=self.field, values=list(self.SEARCH_FIELDS),
+                             state="readonly", width=18)
+        field.pack(side=tk.LEFT, padx=8)
+        field.bind("<<ComboboxSelected>>", lambda event: self.search())
+        self.count_label = tk.Label(search_frame, font=("Segoe UI", 9), bg=app.bg_dark, fg=app.text_dim)
+        self.count_label.pack(side=tk.RIGHT)
+
+        table_frame = tk.Frame(self, bg=app.bg_dark)
+        table_frame.pack(fill=tk.BOTH, expand=True, padx=15, pady=(0, 15))
+        table_frame.rowconfigure(0, weight=1)
+        table_frame.columnconfigure(0, weight=1)
+        self.tree = ttk.Treeview(table_frame, columns=exporter.COLUMN_ORDER, show="headings", selectmode="browse")
+        for column in exporter.COLUMN_ORDER:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=110 if column not in ("ITEM_NAME", "PARTY_NAME") else 220,
+                             stretch=False)
+        # The scrollbar tracks the position in the view, not the tree's few items
+        self.scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        xscrollbar = ttk.Scrollbar(table_frame, orient=tk.HORIZONTAL, command=self.tree.xview)
+        self.tree.configure(xscrollcommand=xscrollbar.set)
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        xscrollbar.grid(row=1, column=0, sticky="ew")
+
+        self.tree.bind("<Configure>", self.on_resize)
+        # Wheel deltas are 120 per notch on Windows but as small as 1 on macOS
+        self.tree.bind("<MouseWheel>",
+                       lambda event: self.scroll_to(self.first + (-1 if event.delta > 0 else 1) * WHEEL_ROWS))
+        self.tree.bind("<Button-4>", lambda event: self.scroll_to(self.first - WHEEL_ROWS))
+        self.tree.bind("<Button-5>", lambda event: self.scroll_to(self.first + WHEEL_ROWS))
+        self.tree.bind("<Prior>", lambda event: self.scroll_to(self.first - self.visible))
+        self.tree.bind("<Next>", lambda event: self.scroll_to(self.first + self.visible))
+        self.tree.bind("<Home>", lambda event: self.scroll_to(0))
+        self.tree.bind("<End>", lambda event: self.scroll_to(len(self.view)))
+        entry.focus_set()
+        self.update_count()
+
+    def on_resize(self, event):
+        row_height = ttk.Style(self).lookup("Treeview", "rowheight") or 20
+        # Leave room for the heading row
+        visible = max(1, (event.height - 25) // int(row_height))
+        if visible != self.visible:
+            self.visible = visible
+            self.tree.delete(*self.tree.get_children())
+            for i in range(visible):
+                self.tree.insert("", tk.END, iid=str(i))
+            self.refresh()
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * len(self.view)))
+        elif action == "scroll":
+            step = self.visible if unit == "pages" else 1
+            self.scroll_to(self.first + int(amount) * step)
+
+    def scroll_to(self, first):
+        self.first = max(0, min(first, len(self.view) - self.visible))
+        self.refresh()
+
+    def refresh(self):
+        """Fill the tree's items with the rows from ``first`` on"""
+        rows = self.view.rows_at(self.first, self.visible)
+        for i in range(self.visible):
+            if i < len(rows):
+                self.tree.item(str(i), values=rows[i])
+            else:
+                self.tree.item(str(i), values=[""] * len(exporter.COLUMN_ORDER))
+        total = len(self.view)
+        if total:
+            self.scrollbar.set(self.first / total, min(self.first + self.visible, total) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def schedule_search(self):
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(SEARCH_DELAY_MS, self.search)
+
+    def search(self):
+        self._search_job = None
+        query = self.query.get().strip()
+        if query:
+            self.view = self.buffer.view(self.buffer.search(query, self.SEARCH_FIELDS[self.field.get()]))
+        else:
+            self.view = self.buffer.view()
+        self.update_count()
+        self.scroll_to(0)
+
+    def update_count(self):
+        self.count_label.config(
+            text=f"{len(self.view):,} rows of {self.view.invoices:,} invoices "
+                 f"(total {len(self.buffer):,} rows)"
+        )
+
+
 class InvoiceExporterUI:
     def __init__(self, root):
         self.root = root
@@ -103,6 +244,8 @@ class InvoiceExporterUI:
         self.blue_hover = "#388bfd"  # GitHub blue hover
         self.green = "#238636"  # GitHub green
         self.green_hover = "#2ea043"
+        self.red = "#da3633"  # GitHub danger
+        self.red_hover = "#f85149"
         self.text_color = "#c9d1d9"  # GitHub text
         self.text_dim = "#8b949e"  # GitHub dim text
         
@@ -115,7 +258,14 @@ class InvoiceExporterUI:
         self.file_format = tk.StringVar(value="excel")
         self.mode = tk.StringVar(value="write")
         
+        # Worker -> UI channel; only the main loop touches widgets
+        self.progress_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.processing = False
+        self.results = None
+        
         self.setup_ui()
+        self.root.after(PROGRESS_POLL_MS, self.poll_progress)
         
     def setup_ui(self):
         # Main container with padding
@@ -220,6 +370,8 @@ class InvoiceExporterUI:
         
         self.create_radio(radio_frame1, "Excel (.xlsx)", "excel", self.file_format).pack(anchor="w", pady=2)
         self.create_radio(radio_frame1, "CSV (.csv)", "csv", self.file_format).pack(anchor="w", pady=2)
+        self.create_radio(radio_frame1, "SQLite (.sqlite)", "sqlite", self.file_format).pack(anchor="w", pady=2)
+        self.create_radio(radio_frame1, "JSON Lines (.jsonl)", "jsonl", self.file_format).pack(anchor="w", pady=2)
         
         # Mode
         mode_frame = tk.Frame(options_frame, bg=self.bg_dark)
@@ -273,7 +425,29 @@ class InvoiceExporterUI:
             width=180,
             height=40
         )
-        self.process_btn.pack()
+        self.process_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.cancel_btn = RoundedButton(
+            button_frame,
+            "Cancel",
+            self.cancel_processing,
+            self.text_dim,
+            self.text_dim,
+            width=120,
+            height=40
+        )
+        self.cancel_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.results_btn = RoundedButton(
+            button_frame,
+            "View Results",
+            self.show_results,
+            self.text_dim,
+            self.text_dim,
+            width=140,
+            height=40
+        )
+        self.results_btn.pack(side=tk.LEFT)
         
         # Configure grid
         card_inner.columnconfigure(0, weight=1)
@@ -331,152 +505,149 @@ class InvoiceExporterUI:
             self.output_folder.set(folder)
     
     def start_processing(self):
+        if self.processing:
+            return
         if not self.input_file.get():
             messagebox.showerror("Error", "Please select an input PDF file")
             return
         
+        # Read the Tk variables here, on the main thread
+        config = {
+            'input_pdf': self.input_file.get(),
+            'output_folder': self.output_folder.get(),
+            'output_file': exporter.output_filename(self.output_filename.get(), self.file_format.get()),
+            'file_format': self.file_format.get(),
+            'mode': self.mode.get(),
+        }
+        
         # Disable button during processing
+        self.processing = True
+        self.cancel_event.clear()
         self.process_btn.config(state=tk.DISABLED)
         self.process_btn.draw_button(self.text_dim)
+        self.set_cancel_enabled(True)
+        self.results = None
+        self.set_results_enabled(False)
         
         # Start processing in a separate thread
-        thread = threading.Thread(target=self.process_invoices, daemon=True)
+        thread = threading.Thread(target=self.process_invoices, args=(config,), daemon=True)
         thread.start()
     
-    def process_invoices(self):
+    def cancel_processing(self):
+        if not self.processing or self.cancel_event.is_set():
+            return
+        self.cancel_event.set()
+        self.set_cancel_enabled(False)
+        self.status_label.config(text="Cancelling, stopping the extraction workers...")
+    
+    def show_results(self):
+        if self.processing or self.results is None:
+            return
+        buffer, output_file = self.results
+        ResultsWindow(self, buffer, f"Results - {output_file}")
+    
+    def set_results_enabled(self, enabled):
+        self.results_btn.bg_color = self.blue if enabled else self.text_dim
+        self.results_btn.hover_color = self.blue_hover if enabled else self.text_dim
+        self.results_btn.draw_button(self.results_btn.bg_color)
+    
+    def set_cancel_enabled(self, enabled):
+        self.cancel_btn.bg_color = self.red if enabled else self.text_dim
+        self.cancel_btn.hover_color = self.red_hover if enabled else self.text_dim
+        self.cancel_btn.draw_button(self.cancel_btn.bg_color)
+    
+    def process_invoices(self, config):
+        """Runs on the worker thread; reports back only through progress_queue."""
         try:
-            input_pdf = self.input_file.get()
-            output_folder = self.output_folder.get()
-            filename = self.output_filename.get()
-            file_format = self.file_format.get()
-            mode = self.mode.get()
-            
-            # Add appropriate extension
-            if file_format == 'excel':
-                output_file = f"{filename}.xlsx"
-            else:
-                output_file = f"{filename}.csv"
+            output_file = config['output_file']
             
             # Update status
             self.update_status("Splitting invoices...", 10)
             
-            # Process invoices
-            paths = invoice_splitter.split_invoices(input_pdf, output_folder)
-            total_invoices = len(paths)
-            all_rows = []
+            # Split, extract and export as a pipeline; progress is tracked in source pages
+            total_pages = invoice_splitter.page_count(config['input_pdf'])
+            writer = exporter.get_writer(
+                config['file_format'], output_file, config['mode'], dedup=dedup.DedupIndex.for_output(output_file)
+            )
+            # Rows of this run, for the results view
+            writer.results = ResultBuffer()
             
-            for idx, path in enumerate(paths, 1):
-                progress = 10 + (idx / total_invoices) * 70
-                self.update_status(f"Processing invoice {idx}/{total_invoices}...", progress)
-                
-                doc_data = dataocr.extract_invoice_data(path)
-                table_data = table_extractor.process_items(path)
-                doc_data["items"] = table_data
-                
-                rows = self.process_invoice_to_rows(doc_data)
-                all_rows.extend(rows)
+            def report_progress(done, invoice):
+                progress = 10 + ((invoice['end_page'] + 1) / total_pages) * 80
+                self.update_status(f"Processed invoice {done} (page {invoice['end_page'] + 1}/{total_pages})...", progress)
             
-            # Export data
-            self.update_status("Exporting data...", 85)
-            df = self.export_data(all_rows, output_file, file_format, mode)
+            stats = pipeline.PipelineStats()
+            quarantine = Quarantine(os.path.join(config['output_folder'], "quarantine"))
+            total_invoices = exporter.export_invoices(
+                config['input_pdf'], config['output_folder'], writer,
+                on_progress=report_progress, stats=stats, cancel_event=self.cancel_event,
+                timeout=120, retries=1, quarantine=quarantine
+            )
+            total_records = writer.rows_written
+            duplicates = stats.skipped + writer.duplicates_skipped
             
-            self.update_status(f"✓ Complete! Processed {len(all_rows)} records from {total_invoices} invoices", 100)
+            self.update_status(f"✓ Complete! Processed {total_records} records from {total_invoices} invoices", 100)
             
             # Show success message
-            self.root.after(0, lambda: messagebox.showinfo(
-                "Success",
+            self.progress_queue.put(("info", "Success",
                 f"Successfully processed {total_invoices} invoices!\n"
-                f"Total records: {len(all_rows)}\n"
+                f"Total records: {total_records}\n"
+                f"Duplicates skipped: {duplicates}\n"
+                f"Failed (quarantined): {len(quarantine)}\n"
                 f"Output file: {output_file}"
             ))
+            self.progress_queue.put(("results", writer.results, output_file))
+            
+        except pipeline.PipelineCancelled as e:
+            self.update_status(f"Cancelled: {str(e)}", 0)
             
         except Exception as e:
             self.update_status(f"Error: {str(e)}", 0)
-            self.root.after(0, lambda: messagebox.showerror("Error", str(e)))
+            self.progress_queue.put(("error", "Error", str(e)))
         
         finally:
-            # Re-enable button
-            self.root.after(0, lambda: [
-                self.process_btn.config(state=tk.NORMAL),
-                self.process_btn.draw_button(self.green)
-            ])
+            self.progress_queue.put(("finished",))
     
     def update_status(self, message, progress):
-        self.root.after(0, lambda: self.status_label.config(text=message))
-        self.root.after(0, lambda: self.update_progress_bar(progress))
-        self.root.update_idletasks()
-    
-    def calculate_price_after_discount(self, price, discount_percent):
-        if discount_percent is None or discount_percent == 0:
-            return price
-        discount_amount = price * (discount_percent / 100)
-        return price - discount_amount
-    
-    def calculate_amount(self, quantity, price_after_discount):
-        return quantity * price_after_discount
-    
-    def process_invoice_to_rows(self, doc_data):
-        rows = []
-        items = doc_data.get("items", {}).get("items", [])
-        
-        for idx, item in enumerate(items):
-            item_name = item.get("items", "")
-            quantity = item.get("Qnty", 0)
-            unit = item.get("unit", "")
-            list_price = item.get("price", 0)
-            discount_percent = item.get("discount", "") or ""
-            
-            if discount_percent != "":
-                price_after_discount = self.calculate_price_after_discount(list_price, discount_percent)
-            else:
-                price_after_discount = list_price
-            
-            amount = self.calculate_amount(quantity, price_after_discount)
-            
-            row = {
-                "VCH_SERIES": doc_data.get("VCH_SERIES", "") if idx == 0 else "",
-                "SALE/PURC_TYPE": doc_data.get("SALE/PURC_TYPE", "") if idx == 0 else "",
-                "MC_NAME": doc_data.get("MC_NAME", "") if idx == 0 else "",
-                "VCH/BILL_DATE": doc_data.get("VCH/BILL_DATE", "") if idx == 0 else "",
-                "VCH/BILL_NO": doc_data.get("VCH/BILL_NO", "") if idx == 0 else "",
-                "PARTY_NAME": doc_data.get("PARTY_NAME", "") if idx == 0 else "",
-                "ITEM_NAME": item_name,
-                "QUANTITY": quantity,
-                "UNIT": unit,
-                "PRICE": round(price_after_discount, 2),
-                "DISCOUNT_PERCENT": discount_percent,
-                "LIST_PRICE_ALT_UNIT": list_price,
-                "LIST_PRICE": list_price,
-                "AMOUNT": round(amount, 2)
-            }
-            rows.append(row)
-        
-        return rows
+        """Thread-safe: queue a status update for the main loop to pick up."""
+        self.progress_queue.put(("status", message, progress))
     
-    def export_data(self, all_rows, output_file, file_format, mode='write'):
-        df = pd.DataFrame(all_rows)
-        
-        column_order = [
-            "VCH_SERIES", "SALE/PURC_TYPE", "MC_NAME", "VCH/BILL_DATE", 
-            "VCH/BILL_NO", "PARTY_NAME", "ITEM_NAME", "QUANTITY", "UNIT", 
-            "PRICE", "DISCOUNT_PERCENT", "LIST_PRICE_ALT_UNIT", "LIST_PRICE", "AMOUNT"
-        ]
-        df = df[column_order]
-        
-        if file_format.lower() == 'excel':
-            if mode == 'append' and os.path.exists(output_file):
-                existing_df = pd.read_excel(output_file)
-                df = pd.concat([existing_df, df], ignore_index=True)
-            
-            df.to_excel(output_file, index=False, engine='openpyxl')
-            
-        elif file_format.lower() == 'csv':
-            if mode == 'append' and os.path.exists(output_file):
-                df.to_csv(output_file, mode='a', header=False, index=False)
-            else:
-                df.to_csv(output_file, index=False)
+    def poll_progress(self):
+        """Drain the progress queue on the main loop, applying only the latest status."""
+        latest_status = None
+        events = []
+        try:
+            while True:
+                event = self.progress_queue.get_nowait()
+                if event[0] == "status":
+                    latest_status = event
+                else:
+                    events.append(event)
+        except queue.Empty:
+            pass
+        
+        if latest_status is not None:
+            _, message, progress = latest_status
+            self.status_label.config(text=message)
+            self.update_progress_bar(progress)
+        
+        for event in events:
+            if event[0] == "info":
+                messagebox.showinfo(event[1], event[2])
+            elif event[0] == "error":
+                messagebox.showerror(event[1], event[2])
+            elif event[0] == "results":
+                self.results = event[1:]
+            elif event[0] == "finished":
+                # Re-enable button
+                self.processing = False
+                self.process_btn.config(state=tk.NORMAL)
+                self.process_btn.draw_button(self.green)
+                self.set_cancel_enabled(False)
+                self.set_results_enabled(self.results is not None)
+                self.show_results()
         
-        return df
+        self.root.after(PROGRESS_POLL_MS, self.poll_progress)
 
 def main():
     root = tk.Tk()